@@ -0,0 +1,166 @@
+"""Ingredient analysis: derived flags and a comedogenic score per product.
+
+RULES and COMEDOGENIC are written as INCI names and synonyms. compile_rules resolves
+them to `ingredient` ids once per batch: the ids become a sorted integer vocabulary, and
+each rule a row of position limits over it (-1 where the ingredient is not part of the
+rule), so scoring a batch is array indexing and segmented reductions over the
+(product, ingredient, position) rows of `productingredient`, with no per-product Python.
+
+A product gets a flag when one of the rule's ingredients is listed within the rule's
+first `max_position` ingredients (anywhere when None); "fragrance_free" is set for
+products that have an INCI list and no "fragrance" hit. The comedogenic score is the
+highest 0-5 rating among the product's ingredients. Products without an INCI list get
+neither. crud.sync_product_analysis stores the results; needs numpy.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlmodel import Session, select
+
+from .ingredients import canonical_inci
+from .models import Ingredient
+
+
+@dataclass(frozen=True)
+class Rule:
+    flag: str
+    names: Tuple[str, ...]
+    # Only ingredients within the first `max_position` of the list count (None: anywhere)
+    max_position: Optional[int] = None
+
+
+# EU-declarable fragrance allergens (Regulation (EC) No 1223/2009, Annex III)
+FRAGRANCE_ALLERGENS = (
+    "alpha-isomethyl ionone", "amyl cinnamal", "amylcinnamyl alcohol", "anise alcohol", "benzyl alcohol",
+    "benzyl benzoate", "benzyl cinnamate", "benzyl salicylate", "butylphenyl methylpropional", "cinnamal",
+    "cinnamyl alcohol", "citral", "citronellol", "coumarin", "eugenol", "evernia furfuracea extract",
+    "evernia prunastri extract", "farnesol", "geraniol", "hexyl cinnamal", "hydroxycitronellal",
+    "hydroxyisohexyl 3-cyclohexene carboxaldehyde", "isoeugenol", "limonene", "linalool", "methyl 2-octynoate",
+)
+
+RULES: Tuple[Rule, ...] = (
+    Rule("fragrance", (
+        "parfum", "fragrance", "aroma", "lavandula angustifolia oil", "citrus aurantium dulcis peel oil",
+        "citrus limon peel oil", "citrus aurantium bergamia fruit oil", "mentha piperita oil",
+        "eucalyptus globulus leaf oil", "rosmarinus officinalis leaf oil", "pelargonium graveolens oil",
+        "rosa damascena flower oil", "cananga odorata flower oil",
+    )),
+    Rule("allergen", FRAGRANCE_ALLERGENS),
+    Rule("irritant", (
+        "sodium lauryl sulfate", "ammonium lauryl sulfate", "methylisothiazolinone",
+        "methylchloroisothiazolinone", "dmdm hydantoin", "imidazolidinyl urea", "diazolidinyl urea",
+        "quaternium-15", "formaldehyde", "menthol", "camphor",
+    )),
+    # Drying in quantity; trace amounts as a solvent for extracts are not flagged
+    Rule("irritant", ("alcohol denat", "sd alcohol", "sd alcohol 40", "isopropyl alcohol"), max_position=5),
+    Rule("retinoid", (
+        "retinol", "retinal", "retinaldehyde", "retinyl palmitate", "retinyl acetate", "retinyl retinoate",
+        "hydroxypinacolone retinoate",
+    )),
+    Rule("niacinamide", ("niacinamide", "nicotinamide", "vitamin b3")),
+    Rule("vitamin_c", (
+        "ascorbic acid", "l-ascorbic acid", "sodium ascorbyl phosphate", "magnesium ascorbyl phosphate",
+        "ascorbyl glucoside", "3-o-ethyl ascorbic acid", "ethyl ascorbic acid", "tetrahexyldecyl ascorbate",
+        "ascorbyl tetraisopalmitate",
+    )),
+    # Near the end of a list these acids only adjust the pH
+    Rule("aha", ("glycolic acid", "lactic acid", "mandelic acid"), max_position=10),
+    Rule("bha", ("salicylic acid", "betaine salicylate"), max_position=15),
+    Rule("azelaic_acid", ("azelaic acid", "potassium azeloyl diglycinate")),
+    Rule("ceramide", (
+        "ceramide np", "ceramide ap", "ceramide eop", "ceramide ns", "ceramide eos", "ceramide 1",
+        "ceramide 3", "ceramide 6 ii",
+    )),
+)
+
+# Comedogenic ratings (0-5) of common ingredients; unlisted ingredients rate 0
+COMEDOGENIC: Dict[str, int] = {
+    "isopropyl myristate": 5, "isopropyl isostearate": 5, "myristyl myristate": 5, "isocetyl stearate": 5,
+    "laureth-4": 5, "algae extract": 5, "carrageenan": 5, "triticum vulgare germ oil": 5,
+    "sodium lauryl sulfate": 5, "isopropyl palmitate": 4, "cocos nucifera oil": 4,
+    "theobroma cacao seed butter": 4, "acetylated lanolin": 4, "ethylhexyl palmitate": 4,
+    "myristyl lactate": 4, "cetyl acetate": 4, "oleth-3": 4, "isostearyl isostearate": 4,
+    "linum usitatissimum seed oil": 4, "lauric acid": 4, "decyl oleate": 3, "glyceryl stearate se": 3,
+    "glycine soja oil": 3, "myristic acid": 3, "stearic acid": 2, "cetearyl alcohol": 2,
+    "cetyl alcohol": 2, "lanolin": 1,
+}
+
+FLAGS = tuple(dict.fromkeys([r.flag for r in RULES] + ["fragrance_free"]))
+
+_ANYWHERE = 1 << 30
+
+
+def analysis_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class CompiledRules:
+    # Sorted ingredient ids named by any rule, plus a trailing -1 for all other ingredients
+    codes: "np.ndarray"
+    flags: Tuple[str, ...]
+    # flags x codes: highest counting 0-based position, -1 where the ingredient is not in the rule
+    limits: "np.ndarray"
+    # per code: comedogenic rating
+    comedogenic: "np.ndarray"
+
+
+def compile_rules(session: Session) -> CompiledRules:
+    """Resolve RULES and COMEDOGENIC against the ingredient vocabulary."""
+    import numpy as np
+
+    names = {canonical_inci(n) for rule in RULES for n in rule.names} | {canonical_inci(n) for n in COMEDOGENIC}
+    ids = dict(session.exec(select(Ingredient.name, Ingredient.id).where(Ingredient.name.in_(names))).all())
+    codes = np.array(sorted(ids.values()) + [-1], dtype=np.int64)
+    column = {int(code): i for i, code in enumerate(codes[:-1])}
+    flags = tuple(dict.fromkeys(r.flag for r in RULES))
+    limits = np.full((len(flags), len(codes)), -1, dtype=np.int32)
+    for rule in RULES:
+        limit = rule.max_position - 1 if rule.max_position else _ANYWHERE
+        row = flags.index(rule.flag)
+        for name in rule.names:
+            ingredient_id = ids.get(canonical_inci(name))
+            if ingredient_id is not None:
+                i = column[ingredient_id]
+                limits[row, i] = max(limits[row, i], limit)
+    comedogenic = np.zeros(len(codes), dtype=np.int8)
+    for name, rating in COMEDOGENIC.items():
+        ingredient_id = ids.get(canonical_inci(name))
+        if ingredient_id is not None:
+            comedogenic[column[ingredient_id]] = rating
+    return CompiledRules(codes, flags, limits, comedogenic)
+
+
+def analyze(
+    rules: CompiledRules, products: Sequence[int], ingredients: Sequence[int], positions: Sequence[int]
+) -> Tuple[List[int], Dict[str, List[int]], List[int]]:
+    """Score parallel (product_id, ingredient_id, position) rows.
+
+    Returns the analyzed product ids (those with at least one row), the ids carrying each
+    flag, and the comedogenic score of each analyzed product in the same order.
+    """
+    import numpy as np
+
+    product_col = np.asarray(products, dtype=np.int64)
+    if not len(product_col):
+        return [], {flag: [] for flag in FLAGS}, []
+    ingredient_col = np.asarray(ingredients, dtype=np.int64)
+    position_col = np.asarray(positions, dtype=np.int64)
+    product_ids, rows = np.unique(product_col, return_inverse=True)
+    order = np.argsort(rows, kind="stable")
+    rows, ingredient_col, position_col = rows[order], ingredient_col[order], position_col[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    # Map ingredient ids onto rule columns; everything else onto the trailing -1 column
+    last = len(rules.codes) - 1
+    local = np.minimum(np.searchsorted(rules.codes[:-1], ingredient_col), last)
+    local[rules.codes[local] != ingredient_col] = last
+    hits = position_col[None, :] <= rules.limits[:, local]
+    flagged = np.logical_or.reduceat(hits, starts, axis=1)
+    scores = np.maximum.reduceat(rules.comedogenic[local], starts)
+    by_flag = {flag: product_ids[flagged[i]].tolist() for i, flag in enumerate(rules.flags)}
+    by_flag["fragrance_free"] = product_ids[~flagged[rules.flags.index("fragrance")]].tolist()
+    return product_ids.tolist(), by_flag, scores.tolist()
@@ -7,6 +7,21 @@ class Settings(BaseSettings):
     environment: str = "development"
 
     database_url: str = "sqlite:///./skincare.db"
+    # Connection pool per engine (sync and async each have one)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 30
+    db_pool_pre_ping: bool = True
+    # Replace pooled connections older than this, before servers or proxies drop them
+    db_pool_recycle_seconds: int = 1800
+    # Executions after which psycopg prepares a statement; negative disables (e.g. behind PgBouncer)
+    db_prepare_threshold: int = 5
+    # SQLite runs in WAL mode with these pragmas on every connection
+    sqlite_busy_timeout_ms: int = 10000
+    sqlite_mmap_size_bytes: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+    # Postgres statement_timeout for the async (read endpoint) engine; 0 disables it
+    db_statement_timeout_ms: int = 15000
 
     cors_origins: list[str] = [
         "http://localhost:3000",
@@ -17,7 +32,55 @@ class Settings(BaseSettings):
         "SkincareCompareBot/0.1 (+https://example.com/bot; contact: admin@example.com)"
     )
     scraper_concurrency: int = 4
+    # Per-host request rate starts here and adapts (AIMD): every response within
+    # scraper_fast_response_seconds adds scraper_rate_increase_per_minute, a 429/503 or a
+    # timeout multiplies it by scraper_rate_decrease_factor; it stays within min..max
     scraper_rate_limit_per_host_per_minute: int = 30
+    scraper_rate_limit_min_per_host_per_minute: float = 2
+    scraper_rate_limit_max_per_host_per_minute: float = 240
+    scraper_fast_response_seconds: float = 1.0
+    scraper_rate_increase_per_minute: float = 1.0
+    scraper_rate_decrease_factor: float = 0.5
+    # Attempts per URL; a Retry-After longer than the maximum gives up on the URL instead
+    scraper_fetch_attempts: int = 3
+    scraper_max_retry_after_seconds: float = 300
+    # Obey robots.txt Allow/Disallow and Crawl-delay; parsed rules are cached per origin
+    scraper_respect_robots: bool = True
+    scraper_robots_ttl_seconds: float = 86400
+    # On-disk HTTP cache for conditional re-crawls; empty string disables it
+    scraper_cache_dir: str = "./.scraper_cache"
+    # Skip parsing pages whose body is unchanged since the last fetch
+    scraper_skip_unchanged: bool = True
+    scraper_domain_concurrency: int = 8
+    scraper_domain_timeout_seconds: float = 900
+    # HTML parser processes; unset uses one per CPU, 0 parses inline on the fetching thread
+    scraper_parse_workers: int | None = None
+    # Pages one domain's crawl may hold between fetch and parsed result before it pauses fetching
+    scraper_parse_queue_size: int = 16
+
+    # Crawl frontier: pages are re-crawled every min..max hours (sooner the more often they
+    # change); failed fetches are retried after retry_base * 2^(attempts - 1) seconds
+    frontier_recrawl_min_hours: float = 6
+    frontier_recrawl_max_hours: float = 336
+    frontier_retry_base_seconds: float = 600
+
+    # Products still incomplete after enrichment are retried after base * 2^(attempts - 1)
+    # hours, capped at max; enrichment fetches this many products per chunk
+    enrich_retry_base_hours: float = 24
+    enrich_retry_max_hours: float = 720
+    enrich_chunk_size: int = 200
+
+    # The in-process ingredient similarity index is rebuilt after this many seconds; in
+    # between, products changed by this process are patched in incrementally
+    similarity_rebuild_seconds: float = 3600
+
+    # Background scrape jobs run on this many worker threads per API process
+    job_workers: int = 2
+
+    # Read-endpoint response cache; ttl <= 0 disables it. A redis:// URL shares it across workers.
+    response_cache_ttl_seconds: float = 300
+    response_cache_max_entries: int = 2048
+    response_cache_url: str = ""
 
     class Config:
         env_file = ".env"
@@ -1,15 +1,99 @@
-from typing import Iterable, Optional, Sequence
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
 from sqlmodel import Session, select
-from sqlalchemy import cast, String
-from .models import Provider, Product
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, case, delete, func, insert, null, update
+from sqlalchemy.dialects import postgresql, sqlite
+from .analysis import analysis_available, analyze, compile_rules
+from .facets import FACETS, facet_memberships
+from .filters import TermClause, parse_term_filters
+from .fulltext import apply_text_search
+from .ingredients import canonical_inci, canonical_inci_list, canonical_term, canonical_terms
+from .matching import product_offers, sync_matches
+from .response_cache import invalidate_catalog
+from .similarity import load_ingredient_terms, mark_dirty_on_commit, similar_product_ids
+from .pagination import Page, PaginationError, SortKey, paginate
+from .models import (
+    CrawlState,
+    FacetCount,
+    Ingredient,
+    PriceDaily,
+    PriceObservation,
+    Product,
+    ProductFacet,
+    ProductFlag,
+    ProductIngredient,
+    ProductSkinType,
+    ProductTag,
+    Provider,
+    ProviderTag,
+)
+from .scrapers.base import ScrapedProduct
+from .urls import canonical_url
+
+
+INGEST_BATCH_SIZE = 500
+
+# A single value or repeated query values, see filters.parse_term_filters
+TermFilter = Optional[Union[str, Sequence[str]]]
+
+# Columns accepted as `sort` (optionally prefixed with "-") besides "id" and "relevance"
+PRODUCT_SORT_COLUMNS = ("price_amount", "rating")
+PROVIDER_SORT_COLUMNS = ("name",)
+
+# Values returned per facet by product_facets
+FACET_SIZE = 20
+
+
+def _dialect_insert(session: Session):
+    return postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def _term_filter(statement, id_column, clauses: List[TermClause], matching: Callable[[List[str]], object]):
+    """AND together semi-joins (or anti-joins for negated clauses) against an association table."""
+    for clause in clauses:
+        subquery = matching(clause.values)
+        statement = statement.where(id_column.notin_(subquery) if clause.negate else id_column.in_(subquery))
+    return statement
+
+
+def _products_with_tags(values: List[str]):
+    return select(ProductTag.product_id).where(ProductTag.tag.in_(values))
+
+
+def _products_with_skin_types(values: List[str]):
+    return select(ProductSkinType.product_id).where(ProductSkinType.skin_type.in_(values))
+
+
+def _products_with_flags(values: List[str]):
+    return select(ProductFlag.product_id).where(ProductFlag.flag.in_(values))
+
+
+def _products_with_ingredients(values: List[str]):
+    return (
+        select(ProductIngredient.product_id)
+        .join(Ingredient, Ingredient.id == ProductIngredient.ingredient_id)
+        .where(Ingredient.name.in_(values))
+    )
+
+
+def _providers_with_tags(values: List[str]):
+    return select(ProviderTag.provider_id).where(ProviderTag.tag.in_(values))
 
 
 # Provider CRUD
 
 def create_provider(session: Session, provider: Provider) -> Provider:
     session.add(provider)
+    session.flush()
+    # One transaction for the row and its term rows; refresh after the commit expired it
+    sync_provider_tags(session, [provider.id])
     session.commit()
     session.refresh(provider)
+    invalidate_catalog()
     return provider
 
 
@@ -29,39 +113,57 @@ def get_or_create_provider_by_name(session: Session, name: str) -> Provider:
     return create_provider(session, Provider(name=name))
 
 
+def _sort_key(name: Optional[str], model, rank, columns: Sequence[str]) -> SortKey:
+    """Resolve a sort name ("id", "price_amount", "-rating", "relevance", ...) for `model`.
+    A leading "-" sorts descending; relevance needs a search query and falls back to id."""
+    if not name:
+        name = "relevance" if rank is not None else "id"
+    if name == "relevance":
+        return SortKey("relevance", rank) if rank is not None else SortKey("id", model.id)
+    column = name.lstrip("-")
+    if column != "id" and column not in columns:
+        raise PaginationError(f"Unsupported sort: {name}")
+    return SortKey(name, getattr(model, column), descending=name.startswith("-"), nullable=column != "id")
+
+
 def list_providers(
     session: Session,
     *,
     country: Optional[str] = None,
-    tag: Optional[str] = None,
+    tag: TermFilter = None,
     q: Optional[str] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
-) -> Sequence[Provider]:
+) -> Page[Provider]:
     statement = select(Provider)
     if country:
         statement = statement.where(Provider.country == country)
-    if tag:
-        # Robust text match on JSON/text column
-        statement = statement.where(cast(Provider.tags, String).ilike(f"%{tag}%"))
+    statement = _term_filter(statement, Provider.id, parse_term_filters(tag, canonical_term), _providers_with_tags)
+    rank = None
     if q:
-        like = f"%{q}%"
-        statement = statement.where(Provider.name.ilike(like) | Provider.description.ilike(like))
-    statement = statement.limit(limit).offset(offset)
-    return session.exec(statement).all()
+        statement, rank = apply_text_search(statement, Provider, q, session.get_bind().dialect.name)
+    sort_key = _sort_key(sort, Provider, rank, PROVIDER_SORT_COLUMNS)
+    return paginate(session, statement, sort_key, Provider.id, cursor=cursor, limit=limit, offset=offset)
 
 
 # Product CRUD / search
 
 def create_product(session: Session, product: Product) -> Product:
+    product.url = canonical_url(product.url)
     session.add(product)
+    session.flush()
+    # One transaction for the row and its term rows; refresh after the commit expired it
+    sync_product_terms(session, [product.id])
     session.commit()
     session.refresh(product)
+    invalidate_catalog()
     return product
 
 
 def get_product_by_url(session: Session, url: str) -> Optional[Product]:
-    statement = select(Product).where(Product.url == url)
+    statement = select(Product).where(Product.url == canonical_url(url))
     return session.exec(statement).first()
 
 
@@ -72,27 +174,548 @@ def list_products(
     q: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    tag: Optional[str] = None,
-    skin_type: Optional[str] = None,
-    ingredient: Optional[str] = None,
+    tag: TermFilter = None,
+    skin_type: TermFilter = None,
+    ingredient: TermFilter = None,
+    flag: TermFilter = None,
+    max_comedogenic: Optional[int] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
-) -> Sequence[Product]:
-    statement = select(Product)
+) -> Page[Product]:
+    statement, rank = filter_products(
+        session,
+        select(Product),
+        provider_id=provider_id,
+        q=q,
+        min_price=min_price,
+        max_price=max_price,
+        tag=tag,
+        skin_type=skin_type,
+        ingredient=ingredient,
+        flag=flag,
+        max_comedogenic=max_comedogenic,
+    )
+    sort_key = _sort_key(sort, Product, rank, PRODUCT_SORT_COLUMNS)
+    return paginate(session, statement, sort_key, Product.id, cursor=cursor, limit=limit, offset=offset)
+
+
+def filter_products(
+    session: Session,
+    statement,
+    *,
+    provider_id: Optional[int] = None,
+    q: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    tag: TermFilter = None,
+    skin_type: TermFilter = None,
+    ingredient: TermFilter = None,
+    flag: TermFilter = None,
+    max_comedogenic: Optional[int] = None,
+):
+    """Apply the product list filters to `statement`; returns it with the search rank (or None)."""
     if provider_id is not None:
         statement = statement.where(Product.provider_id == provider_id)
+    rank = None
     if q:
-        like = f"%{q}%"
-        statement = statement.where(Product.name.ilike(like) | Product.description.ilike(like))
+        statement, rank = apply_text_search(statement, Product, q, session.get_bind().dialect.name)
     if min_price is not None:
         statement = statement.where(Product.price_amount >= min_price)
     if max_price is not None:
         statement = statement.where(Product.price_amount <= max_price)
-    if tag:
-        statement = statement.where(cast(Product.tags, String).ilike(f"%{tag}%"))
-    if skin_type:
-        statement = statement.where(cast(Product.skin_types, String).ilike(f"%{skin_type}%"))
-    if ingredient:
-        statement = statement.where(cast(Product.inci, String).ilike(f"%{ingredient}%"))
-    statement = statement.limit(limit).offset(offset)
-    return session.exec(statement).all() 
\ No newline at end of file
+    if max_comedogenic is not None:
+        statement = statement.where(Product.comedogenic_score <= max_comedogenic)
+    statement = filter_products_by_terms(
+        statement, tag=tag, skin_type=skin_type, ingredient=ingredient, flag=flag
+    )
+    return statement, rank
+
+
+def filter_products_by_terms(
+    statement,
+    *,
+    tag: TermFilter = None,
+    skin_type: TermFilter = None,
+    ingredient: TermFilter = None,
+    flag: TermFilter = None,
+):
+    statement = _term_filter(statement, Product.id, parse_term_filters(tag, canonical_term), _products_with_tags)
+    statement = _term_filter(
+        statement, Product.id, parse_term_filters(skin_type, canonical_term), _products_with_skin_types
+    )
+    statement = _term_filter(statement, Product.id, parse_term_filters(flag, canonical_term), _products_with_flags)
+    return _term_filter(
+        statement, Product.id, parse_term_filters(ingredient, canonical_inci), _products_with_ingredients
+    )
+
+
+def product_facets(
+    session: Session,
+    *,
+    provider_id: Optional[int] = None,
+    q: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    tag: TermFilter = None,
+    skin_type: TermFilter = None,
+    ingredient: TermFilter = None,
+    flag: TermFilter = None,
+    max_comedogenic: Optional[int] = None,
+    size: int = FACET_SIZE,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Product counts per tag, skin type, provider and price bucket among the products
+    matching the list filters, the `size` largest values of each facet first."""
+    filters = dict(
+        provider_id=provider_id, q=q, min_price=min_price, max_price=max_price,
+        tag=tag, skin_type=skin_type, ingredient=ingredient, flag=flag, max_comedogenic=max_comedogenic,
+    )
+    if all(v in (None, "", []) for v in filters.values()):
+        statement = select(FacetCount.facet, FacetCount.value, FacetCount.count)
+    else:
+        matching, _ = filter_products(session, select(Product.id), **filters)
+        statement = (
+            select(ProductFacet.facet, ProductFacet.value, func.count())
+            .where(ProductFacet.product_id.in_(matching))
+            .group_by(ProductFacet.facet, ProductFacet.value)
+        )
+    counts: Dict[str, List[Dict[str, Any]]] = {f: [] for f in FACETS}
+    for facet, value, count in session.exec(statement).all():
+        counts.setdefault(facet, []).append({"value": value, "count": count})
+    for facet, values in counts.items():
+        values.sort(key=lambda v: (-v["count"], v["value"]))
+        del values[size:]
+    provider_ids = [int(v["value"]) for v in counts["provider"]]
+    if provider_ids:
+        names = dict(session.exec(select(Provider.id, Provider.name).where(Provider.id.in_(provider_ids))).all())
+        for v in counts["provider"]:
+            v["label"] = names.get(int(v["value"]))
+    return counts
+
+
+# Async reads for the API. The sync query code runs on the async connection through
+# AsyncSession.run_sync, so both paths issue the same SQL.
+
+async def list_providers_async(session: AsyncSession, **filters: Any) -> Page[Provider]:
+    return await session.run_sync(lambda sync_session: list_providers(sync_session, **filters))
+
+
+async def get_provider_by_id_async(session: AsyncSession, provider_id: int) -> Optional[Provider]:
+    return await session.get(Provider, provider_id)
+
+
+async def list_products_async(session: AsyncSession, **filters: Any) -> Page[Product]:
+    return await session.run_sync(lambda sync_session: list_products(sync_session, **filters))
+
+
+async def price_history_async(session: AsyncSession, product_id: int, **options: Any) -> List[Dict[str, Any]]:
+    return await session.run_sync(lambda sync_session: price_history(sync_session, product_id, **options))
+
+
+async def price_drops_async(session: AsyncSession, **options: Any) -> List[Dict[str, Any]]:
+    return await session.run_sync(lambda sync_session: price_drops(sync_session, **options))
+
+
+async def product_offers_async(session: AsyncSession, product_id: int) -> Optional[dict]:
+    return await session.run_sync(lambda sync_session: product_offers(sync_session, product_id))
+
+
+async def product_facets_async(session: AsyncSession, **filters: Any) -> Dict[str, List[Dict[str, Any]]]:
+    return await session.run_sync(lambda sync_session: product_facets(sync_session, **filters))
+
+
+# Normalized term tables
+
+def resolve_ingredient_ids(session: Session, names: Iterable[str]) -> Dict[str, int]:
+    """Map canonical INCI names to ingredient ids, inserting unknown names."""
+    names = sorted(set(names))
+    if not names:
+        return {}
+    session.execute(
+        _dialect_insert(session)(Ingredient.__table__)
+        .values([{"name": n} for n in names])
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    statement = select(Ingredient.name, Ingredient.id).where(Ingredient.name.in_(names))
+    return dict(session.exec(statement).all())
+
+
+def sync_product_terms(session: Session, product_ids: Iterable[int]) -> None:
+    """Rebuild ingredient/tag/skin type rows for the given products from their JSON columns,
+    along with their facet rows, analysis, price history and cross-retailer match. Does not
+    commit; callers write the products and their terms in one transaction."""
+    ids = list(product_ids)
+    if not ids:
+        return
+    rows = session.exec(
+        select(Product.id, Product.inci, Product.tags, Product.skin_types).where(Product.id.in_(ids))
+    ).all()
+    for model in (ProductIngredient, ProductTag, ProductSkinType):
+        session.execute(delete(model).where(model.product_id.in_(ids)))
+    inci = {pid: canonical_inci_list(names) for pid, names, _, _ in rows}
+    ingredient_ids = resolve_ingredient_ids(session, (n for names in inci.values() for n in names))
+    ingredient_rows = [
+        {"product_id": pid, "ingredient_id": ingredient_ids[name], "position": pos}
+        for pid, names in inci.items()
+        for pos, name in enumerate(names)
+    ]
+    tag_rows = [{"product_id": pid, "tag": t} for pid, _, tags, _ in rows for t in canonical_terms(tags)]
+    skin_rows = [
+        {"product_id": pid, "skin_type": t} for pid, _, _, skin_types in rows for t in canonical_terms(skin_types)
+    ]
+    for model, values in ((ProductIngredient, ingredient_rows), (ProductTag, tag_rows), (ProductSkinType, skin_rows)):
+        if values:
+            session.execute(insert(model), values)
+    sync_product_facets(session, ids)
+    sync_product_analysis(
+        session,
+        ids,
+        (
+            [r["product_id"] for r in ingredient_rows],
+            [r["ingredient_id"] for r in ingredient_rows],
+            [r["position"] for r in ingredient_rows],
+        ),
+    )
+    record_price_changes(session, ids)
+    sync_matches(session, ids)
+    mark_dirty_on_commit(session, ids)
+
+
+def sync_product_analysis(
+    session: Session, product_ids: Iterable[int], terms: Optional[Sequence[Sequence[int]]] = None
+) -> None:
+    """Rewrite the flags and comedogenic score (analysis.py) of the given products from
+    their (product_ids, ingredient_ids, positions) term columns, read from
+    `productingredient` when not passed. Skipped without numpy. Does not commit."""
+    ids = list(product_ids)
+    if not ids or not analysis_available():
+        return
+    if terms is None:
+        terms = load_ingredient_terms(session, ids)
+    analyzed, by_flag, scores = analyze(compile_rules(session), *terms)
+    session.execute(delete(ProductFlag).where(ProductFlag.product_id.in_(ids)))
+    flag_rows = [{"product_id": pid, "flag": flag} for flag, pids in by_flag.items() for pid in pids]
+    if flag_rows:
+        session.execute(insert(ProductFlag), flag_rows)
+    score_by_id = dict(zip(analyzed, scores))
+    session.execute(
+        update(Product), [{"id": pid, "comedogenic_score": score_by_id.get(pid)} for pid in ids]
+    )
+
+
+def sync_product_facets(session: Session, product_ids: Iterable[int]) -> None:
+    """Rebuild the facet rows of the given products and move the catalog counts by the
+    difference. Does not commit."""
+    ids = list(product_ids)
+    if not ids:
+        return
+    deltas: Counter = Counter()
+    for facet, value in session.exec(
+        select(ProductFacet.facet, ProductFacet.value).where(ProductFacet.product_id.in_(ids))
+    ).all():
+        deltas[facet, value] -= 1
+    session.execute(delete(ProductFacet).where(ProductFacet.product_id.in_(ids)))
+    rows = session.exec(
+        select(Product.id, Product.provider_id, Product.price_amount, Product.tags, Product.skin_types)
+        .where(Product.id.in_(ids))
+    ).all()
+    memberships = facet_memberships(rows)
+    for _, facet, value in memberships:
+        deltas[facet, value] += 1
+    if memberships:
+        session.execute(
+            insert(ProductFacet), [{"product_id": pid, "facet": f, "value": v} for pid, f, v in memberships]
+        )
+    changed = [{"facet": f, "value": v, "count": n} for (f, v), n in sorted(deltas.items()) if n]
+    if changed:
+        table = FacetCount.__table__
+        statement = _dialect_insert(session)(table).values(changed)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.facet, table.c.value],
+                set_={"count": table.c["count"] + statement.excluded["count"]},
+            )
+        )
+        session.execute(delete(FacetCount).where(FacetCount.count <= 0))
+
+
+def sync_provider_tags(session: Session, provider_ids: Iterable[int]) -> None:
+    ids = list(provider_ids)
+    if not ids:
+        return
+    rows = session.exec(select(Provider.id, Provider.tags).where(Provider.id.in_(ids))).all()
+    session.execute(delete(ProviderTag).where(ProviderTag.provider_id.in_(ids)))
+    values = [{"provider_id": pid, "tag": t} for pid, tags in rows for t in canonical_terms(tags)]
+    if values:
+        session.execute(insert(ProviderTag), values)
+
+
+def backfill_terms(session: Session, batch_size: int = INGEST_BATCH_SIZE) -> None:
+    """Populate the term tables for rows written before they existed."""
+    for model, sync in ((Product, sync_product_terms), (Provider, sync_provider_tags)):
+        last_id = 0
+        while True:
+            ids = session.exec(
+                select(model.id).where(model.id > last_id).order_by(model.id).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            sync(session, ids)
+            session.commit()
+            last_id = ids[-1]
+    invalidate_catalog()
+
+
+# Bulk ingest of scraped products
+
+@dataclass
+class IngestResult:
+    created: int = 0
+    updated: int = 0
+
+
+def resolve_provider_ids(
+    session: Session, names: Iterable[str], cache: Dict[str, int]
+) -> Dict[str, int]:
+    """Map provider names to ids with one lookup for unknown names, creating the missing ones."""
+    missing = {n for n in names if n not in cache}
+    if missing:
+        statement = select(Provider.name, Provider.id).where(Provider.name.in_(missing)).order_by(Provider.id)
+        for name, provider_id in session.exec(statement).all():
+            cache.setdefault(name, provider_id)
+        new = [Provider(name=n) for n in sorted(missing - cache.keys())]
+        if new:
+            session.add_all(new)
+            session.flush()
+            for provider in new:
+                cache[provider.name] = provider.id
+    return cache
+
+
+def _upsert_statement(session: Session, rows: list[dict]):
+    table = Product.__table__
+    statement = _dialect_insert(session)(table).values(rows)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.url],
+        set_={
+            "price_amount": func.coalesce(excluded.price_amount, table.c.price_amount),
+            "price_currency": func.coalesce(excluded.price_currency, table.c.price_currency),
+            "inci": func.coalesce(excluded.inci, table.c.inci),
+            "gtin": func.coalesce(excluded.gtin, table.c.gtin),
+            "sku": func.coalesce(excluded.sku, table.c.sku),
+        },
+    )
+
+
+def ingest_scraped_products(
+    session: Session,
+    items: Iterable[ScrapedProduct],
+    *,
+    tags: Optional[list[str]] = None,
+    provider_ids: Optional[Dict[str, int]] = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> IngestResult:
+    """Upsert scraped products in batches: one provider lookup, one existing-URL query and
+    one multi-row INSERT ... ON CONFLICT (url) DO UPDATE per batch, committed per batch.
+    Products already stored by URL keep their name and get price/currency/INCI refreshed.
+    """
+    result = IngestResult()
+    provider_ids = provider_ids if provider_ids is not None else {}
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        resolve_provider_ids(session, {it.provider_name for it in batch}, provider_ids)
+        by_url: Dict[str, ScrapedProduct] = {}
+        without_url: list[ScrapedProduct] = []
+        for it in batch:
+            url = canonical_url(it.url)
+            if url:
+                by_url[url] = it  # last occurrence in the batch wins
+            else:
+                without_url.append(it)
+        existing: set[str] = set()
+        if by_url:
+            existing = set(session.exec(select(Product.url).where(Product.url.in_(list(by_url)))).all())
+        rows = [
+            {
+                "provider_id": provider_ids[it.provider_name],
+                "name": it.name,
+                "url": url,
+                "price_amount": it.price_amount,
+                "price_currency": it.price_currency,
+                # null() rather than None so JSON columns get SQL NULL, not the JSON 'null' literal
+                "tags": tags or null(),
+                "inci": it.inci or null(),
+                "gtin": it.gtin,
+                "sku": it.sku,
+            }
+            for url, it in [*by_url.items(), *((None, it) for it in without_url)]
+        ]
+        statement = _upsert_statement(session, rows).returning(Product.__table__.c.id)
+        sync_product_terms(session, session.execute(statement).scalars().all())
+        session.commit()
+        invalidate_catalog()
+        result.updated += len(existing)
+        result.created += len(rows) - len(existing)
+    return result
+
+
+# Price history
+
+def _latest_prices(session: Session, product_ids: List[int]) -> Dict[int, tuple]:
+    latest = (
+        select(PriceObservation.product_id, func.max(PriceObservation.observed_at).label("observed_at"))
+        .where(PriceObservation.product_id.in_(product_ids))
+        .group_by(PriceObservation.product_id)
+        .subquery()
+    )
+    statement = select(PriceObservation.product_id, PriceObservation.amount, PriceObservation.currency).join(
+        latest,
+        and_(
+            PriceObservation.product_id == latest.c.product_id,
+            PriceObservation.observed_at == latest.c.observed_at,
+        ),
+    )
+    return {pid: (amount, currency) for pid, amount, currency in session.exec(statement).all()}
+
+
+def record_price_changes(session: Session, product_ids: Iterable[int], observed_at: Optional[datetime] = None) -> int:
+    """Append a price observation for each product whose stored price differs from its last
+    observation, and fold it into that day's rollup. Does not commit; returns the count."""
+    ids = list(product_ids)
+    if not ids:
+        return 0
+    observed_at = observed_at or datetime.utcnow()
+    current = session.exec(
+        select(Product.id, Product.price_amount, Product.price_currency)
+        .where(Product.id.in_(ids), Product.price_amount.isnot(None))
+    ).all()
+    if not current:
+        return 0
+    previous = _latest_prices(session, [pid for pid, _, _ in current])
+    observations, rollups = [], []
+    for pid, amount, currency in current:
+        before = previous.get(pid)
+        if before == (amount, currency):
+            continue
+        observations.append({"product_id": pid, "observed_at": observed_at, "amount": amount, "currency": currency})
+        # The price in effect before the change is part of the day's range too
+        opening = before[0] if before and before[1] == currency else amount
+        rollups.append(
+            {
+                "product_id": pid,
+                "day": observed_at.date(),
+                "low": min(opening, amount),
+                "high": max(opening, amount),
+                "close": amount,
+                "currency": currency,
+            }
+        )
+    if not observations:
+        return 0
+    session.execute(insert(PriceObservation), observations)
+    table = PriceDaily.__table__
+    statement = _dialect_insert(session)(table).values(rollups)
+    # SQLite's two-argument min/max are scalar, like least/greatest on Postgres
+    if session.get_bind().dialect.name == "postgresql":
+        least, greatest = func.least, func.greatest
+    else:
+        least, greatest = func.min, func.max
+    excluded = statement.excluded
+    # A currency change starts the day's range over: amounts in two currencies don't compare
+    same_currency = table.c.currency == excluded.currency
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.day],
+            set_={
+                "low": case((same_currency, least(table.c.low, excluded.low)), else_=excluded.low),
+                "high": case((same_currency, greatest(table.c.high, excluded.high)), else_=excluded.high),
+                "close": excluded.close,
+                "currency": excluded.currency,
+            },
+        )
+    )
+    return len(observations)
+
+
+def price_history(
+    session: Session, product_id: int, *, days: int = 90, resolution: str = "changes"
+) -> List[Dict[str, Any]]:
+    """Price changes of a product over the last `days`, oldest first: every observation
+    ("changes") or one low/high/close row per day with a change ("daily")."""
+    since = datetime.utcnow() - timedelta(days=days)
+    if resolution == "daily":
+        statement = (
+            select(PriceDaily)
+            .where(PriceDaily.product_id == product_id, PriceDaily.day >= since.date())
+            .order_by(PriceDaily.day)
+        )
+        return [
+            {"day": r.day, "low": r.low, "high": r.high, "close": r.close, "currency": r.currency}
+            for r in session.exec(statement).all()
+        ]
+    statement = (
+        select(PriceObservation)
+        .where(PriceObservation.product_id == product_id, PriceObservation.observed_at >= since)
+        .order_by(PriceObservation.observed_at)
+    )
+    return [
+        {"observed_at": r.observed_at, "amount": r.amount, "currency": r.currency}
+        for r in session.exec(statement).all()
+    ]
+
+
+def price_drops(session: Session, *, days: int = 7, limit: int = 50) -> List[Dict[str, Any]]:
+    """Products whose current price is furthest below their highest price of the last
+    `days`, largest relative drop first. Reads only the rollups of days with a change."""
+    since: date = (datetime.utcnow() - timedelta(days=days)).date()
+    high = func.max(PriceDaily.high).label("high")
+    statement = (
+        select(Product, high)
+        .join(PriceDaily, PriceDaily.product_id == Product.id)
+        .where(PriceDaily.day >= since, PriceDaily.currency == Product.price_currency)
+        .group_by(Product.id)
+        .having(high > Product.price_amount)
+        .order_by(((high - Product.price_amount) / high).desc(), Product.id)
+        .limit(limit)
+    )
+    return [
+        {
+            "product": product,
+            "previous_price": previous,
+            "price": product.price_amount,
+            "drop": round(previous - product.price_amount, 2),
+            "drop_pct": round(100 * (previous - product.price_amount) / previous, 1),
+        }
+        for product, previous in session.exec(statement).all()
+    ]
+
+
+def similar_products(session: Session, product_id: int, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """Products with the most similar ingredient lists, most similar first; None when the
+    product does not exist. Raises RuntimeError without numpy/scipy."""
+    if session.get(Product, product_id) is None:
+        return None
+    scored = similar_product_ids(session, product_id, k)
+    products = {p.id: p for p in session.exec(select(Product).where(Product.id.in_([pid for pid, _ in scored])))}
+    return [
+        {"product": products[pid], "score": round(score, 4)} for pid, score in scored if pid in products
+    ]
+
+
+# Crawl state
+
+def get_last_crawl_success(session: Session, domains: Iterable[str]) -> Dict[str, datetime]:
+    statement = select(CrawlState).where(CrawlState.domain.in_(list(domains)))
+    return {s.domain: s.last_success_at for s in session.exec(statement).all() if s.last_success_at}
+
+
+def mark_crawl_success(session: Session, domain: str, started_at: datetime) -> None:
+    state = session.get(CrawlState, domain) or CrawlState(domain=domain)
+    state.last_success_at = started_at
+    session.add(state)
+    session.commit()
@@ -1,6 +1,11 @@
-from typing import Iterator
+from typing import AsyncIterator, Iterator
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
 from .config import get_settings
+from .fulltext import install_fulltext
+from .migrations import apply_migrations
 
 
 def _normalize_database_url(url: str) -> str:
@@ -12,19 +17,81 @@ def _normalize_database_url(url: str) -> str:
     return url
 
 
+def _async_database_url(url: str) -> str:
+    # psycopg 3 serves both engines under the same dialect name
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def _engine_options(url: str, statement_timeout_ms: int = 0) -> dict:
+    options: dict = {"echo": False, "pool_pre_ping": settings.db_pool_pre_ping}
+    connect_args: dict = {}
+    options["connect_args"] = connect_args
+    if url.startswith("sqlite"):
+        # timeout is how long a writer waits for the lock before "database is locked"
+        connect_args.update(check_same_thread=False, timeout=settings.sqlite_busy_timeout_ms / 1000)
+        # In-memory databases live on a single connection, so there is no pool to size
+        if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+            return options
+    elif url.startswith("postgresql"):
+        if statement_timeout_ms > 0:
+            connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+        # psycopg prepares a statement server-side once it has run this many times on a connection
+        connect_args["prepare_threshold"] = settings.db_prepare_threshold if settings.db_prepare_threshold >= 0 else None
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+    )
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """WAL lets readers run alongside an ingest; NORMAL sync is durable under WAL except on power loss."""
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_bytes}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        "PRAGMA temp_store=MEMORY",
+    ):
+        cursor.execute(pragma)
+    cursor.close()
+
+
 settings = get_settings()
 _db_url = _normalize_database_url(settings.database_url)
-engine = create_engine(
-    _db_url,
-    echo=False,
-    connect_args={"check_same_thread": False} if _db_url.startswith("sqlite") else {},
+engine = create_engine(_db_url, **_engine_options(_db_url))
+_async_db_url = _async_database_url(_db_url)
+# Used by the read endpoints so they don't occupy the threadpool while waiting on the database
+async_engine = create_async_engine(
+    _async_db_url, **_engine_options(_async_db_url, settings.db_statement_timeout_ms)
 )
+if _db_url.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
 
 
-def create_db_and_tables() -> None:
+def create_db_and_tables() -> set[str]:
+    """Create missing tables, apply pending migrations and install full-text search;
+    returns the names of tables that were new."""
+    existing = set(inspect(engine).get_table_names())
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        apply_migrations(conn)
+        install_fulltext(conn)
+    return set(SQLModel.metadata.tables) - existing
 
 
 def get_session() -> Iterator[Session]:
     with Session(engine) as session:
-        yield session 
\ No newline at end of file
+        yield session 
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
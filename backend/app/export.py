@@ -0,0 +1,157 @@
+"""Streaming catalog exports (CSV, NDJSON, Parquet).
+
+Rows are read with `yield_per`, which streams from a server-side cursor on Postgres and
+fetches in chunks on SQLite, and each chunk is encoded and handed to the response before
+the next one is read, so an export takes the same memory whatever the catalog size.
+Parquet needs the optional `pyarrow` package.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+import csv
+import io
+import json
+from sqlmodel import Session, select
+
+from .crud import filter_products
+from .database import engine
+from .models import Product, Provider
+
+
+EXPORT_BATCH_SIZE = 1000
+
+# Every Product column; parquet_stream declares the same columns in its schema
+EXPORT_COLUMNS = (
+    "id",
+    "provider_id",
+    "provider_name",
+    "name",
+    "url",
+    "description",
+    "price_amount",
+    "price_currency",
+    "rating",
+    "gtin",
+    "sku",
+    "comedogenic_score",
+    "ingredients",
+    "inci",
+    "tags",
+    "skin_types",
+    "pros",
+    "cons",
+)
+LIST_COLUMNS = {"inci", "tags", "skin_types", "pros", "cons"}
+
+
+def encode_csv(rows: Iterable[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def iter_product_batches(batch_size: int = EXPORT_BATCH_SIZE, **filters: Any) -> Iterator[List[Dict[str, Any]]]:
+    """Products matching the list_products `filters`, in id order, as lists of row dicts.
+
+    Opens its own session: a streaming response outlives the request's dependencies.
+    """
+    with Session(engine) as session:
+        statement = select(
+            *(getattr(Product, c) for c in EXPORT_COLUMNS if c != "provider_name"),
+            Provider.name.label("provider_name"),
+        ).join(Provider, Provider.id == Product.provider_id)
+        statement, _ = filter_products(session, statement, **filters)
+        result = session.execute(statement.order_by(Product.id).execution_options(yield_per=batch_size))
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+
+def csv_stream(batches: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    yield encode_csv([EXPORT_COLUMNS])
+    for batch in batches:
+        yield encode_csv(
+            [
+                [json.dumps(row[c], ensure_ascii=False) if c in LIST_COLUMNS and row[c] is not None else row[c]
+                 for c in EXPORT_COLUMNS]
+                for row in batch
+            ]
+        )
+
+
+def ndjson_stream(batches: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch).encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object that collects what the Parquet writer emits until drained."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_stream(batches: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """One Parquet row group per batch, each sent as soon as it is written."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package") from e
+    text_list = pa.list_(pa.string())
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("provider_id", pa.int64()),
+            ("provider_name", pa.string()),
+            ("name", pa.string()),
+            ("url", pa.string()),
+            ("description", pa.string()),
+            ("price_amount", pa.float64()),
+            ("price_currency", pa.string()),
+            ("rating", pa.float64()),
+            ("gtin", pa.string()),
+            ("sku", pa.string()),
+            ("comedogenic_score", pa.int64()),
+            ("ingredients", pa.string()),
+        ]
+        + [(c, text_list) for c in EXPORT_COLUMNS if c in LIST_COLUMNS]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
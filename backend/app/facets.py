@@ -0,0 +1,45 @@
+"""Facet counts for the search UI, maintained on write.
+
+`productfacet` holds one row per (product, facet, value): the product's canonical tags
+and skin types, its provider and its price bucket. `facetcount` holds the number of
+products per (facet, value) over the whole catalog. Both are rebuilt for a product
+whenever its term rows are (crud.sync_product_terms), and the counts move by the
+difference between the old and new memberships, so no write recounts the table.
+Unfiltered facets are read from `facetcount`; a filtered search groups the
+`productfacet` rows of the matching products in one query.
+"""
+from __future__ import annotations
+from typing import Iterable, List, Optional, Tuple
+
+from .ingredients import canonical_terms
+
+
+FACETS = ("tag", "skin_type", "provider", "price")
+
+# Upper bounds of the price buckets; prices at or above the last bound share one bucket
+PRICE_BUCKET_BOUNDS = (100, 250, 500, 1000)
+
+
+def price_bucket(amount: Optional[float]) -> Optional[str]:
+    """Label of the bucket `amount` falls in ("100-250", "1000+"); None without a price."""
+    if amount is None:
+        return None
+    lower = 0
+    for upper in PRICE_BUCKET_BOUNDS:
+        if amount < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def facet_memberships(rows: Iterable[tuple]) -> List[Tuple[int, str, str]]:
+    """(product_id, facet, value) for rows of (id, provider_id, price_amount, tags, skin_types)."""
+    memberships = set()
+    for product_id, provider_id, price_amount, tags, skin_types in rows:
+        memberships.update((product_id, "tag", t) for t in canonical_terms(tags))
+        memberships.update((product_id, "skin_type", t) for t in canonical_terms(skin_types))
+        memberships.add((product_id, "provider", str(provider_id)))
+        bucket = price_bucket(price_amount)
+        if bucket is not None:
+            memberships.add((product_id, "price", bucket))
+    return sorted(memberships)
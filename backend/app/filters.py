@@ -0,0 +1,41 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Union
+import re
+
+
+_AND = re.compile(r"\s+AND\s+")
+_OR = re.compile(r"\s+OR\s+|\|")
+_NOT = re.compile(r"^(?:NOT\s+|[-!])")
+
+
+@dataclass
+class TermClause:
+    # The product must contain at least one of `values`, or none of them when negated
+    values: List[str]
+    negate: bool = False
+
+
+def parse_term_filters(
+    raw: Optional[Union[str, Sequence[str]]], canonical: Callable[[str], Optional[str]]
+) -> List[TermClause]:
+    """Parse filter values into clauses that are ANDed together.
+
+    Each query value is one or more clauses joined by `AND`; a clause lists alternatives
+    separated by `OR` or `|` and is negated by a leading `NOT`, `-` or `!`. Repeating the
+    parameter also ANDs, so these are equivalent:
+        ingredient=niacinamide AND NOT fragrance
+        ingredient=niacinamide&ingredient=-fragrance
+    """
+    if not raw:
+        return []
+    values = [raw] if isinstance(raw, str) else list(raw)
+    clauses: List[TermClause] = []
+    for value in values:
+        for part in _AND.split(value.strip()):
+            negate = bool(_NOT.match(part))
+            part = _NOT.sub("", part, count=1)
+            terms = [t for t in (canonical(v) for v in _OR.split(part)) if t]
+            if terms:
+                clauses.append(TermClause(list(dict.fromkeys(terms)), negate))
+    return clauses
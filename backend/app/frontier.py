@@ -0,0 +1,213 @@
+"""Persistent crawl frontier.
+
+Every URL a domain crawl discovers is stored in the `frontierurl` table with its status,
+failure count, last fetch time, content hash and the time it is next due. A crawl first
+takes the URLs that are due (left over from an interrupted run, scheduled re-crawls and
+failed URLs whose backoff has passed), then walks the sitemap for URLs the frontier has
+not seen. Results are written back in batches, after the products scraped from them are
+ingested, so a crash loses at most one batch of work.
+
+Re-crawl priority is a moving average of how often a fetch found the page changed: pages
+that changed recently come due sooner and rank first among due URLs, stable pages drift
+towards the maximum interval.
+"""
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import threading
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from .config import get_settings
+from .crud import IngestResult, _dialect_insert, ingest_scraped_products
+from .database import engine
+from .models import FrontierURL
+from .scrapers.base import ScrapedProduct
+
+
+INSERT_BATCH_SIZE = 500
+# Weight of the latest fetch in the changed-page moving average
+CHANGE_WEIGHT = 0.5
+
+# Frontier flushes ingest products; serialized so domains don't race on new providers
+_write_lock = threading.Lock()
+
+
+def _url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class SeenFilter:
+    """Set of URLs kept as sorted 64-bit hashes, 8 bytes per URL, plus a small set of
+    recent additions that is merged in once it grows."""
+
+    def __init__(self, urls: Iterable[str] = ()) -> None:
+        self._sorted = array("q", sorted(_url_hash(u) for u in urls))
+        self._recent: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._recent)
+
+    def _in_sorted(self, h: int) -> bool:
+        i = bisect_left(self._sorted, h)
+        return i < len(self._sorted) and self._sorted[i] == h
+
+    def add(self, url: str) -> bool:
+        """Record `url`; returns False when it was already seen."""
+        h = _url_hash(url)
+        if h in self._recent or self._in_sorted(h):
+            return False
+        self._recent.add(h)
+        if len(self._recent) > max(1024, len(self._sorted) // 8):
+            self._sorted = array("q", sorted([*self._sorted, *self._recent]))
+            self._recent.clear()
+        return True
+
+
+@dataclass
+class _UrlState:
+    priority: float = 1.0
+    content_hash: Optional[str] = None
+    attempts: int = 0
+
+
+class Frontier:
+    """Frontier of one domain. `due`, `add` and `record` are called from the crawl;
+    `flush` does the database writes and is meant to run off the event loop."""
+
+    def __init__(
+        self,
+        domain: str,
+        *,
+        tags: Optional[List[str]] = None,
+        provider_ids: Optional[Dict[str, int]] = None,
+    ) -> None:
+        settings = get_settings()
+        self.domain = domain
+        self.tags = tags
+        self.provider_ids = provider_ids if provider_ids is not None else {}
+        self.min_interval = timedelta(hours=settings.frontier_recrawl_min_hours)
+        self.max_interval = timedelta(hours=settings.frontier_recrawl_max_hours)
+        self.retry_base = timedelta(seconds=settings.frontier_retry_base_seconds)
+        self.ingested = IngestResult()
+        self._seen: Optional[SeenFilter] = None
+        self._claimed: Dict[str, _UrlState] = {}
+        self._new: List[str] = []
+        self._updates: List[dict] = []
+        self._items: List[ScrapedProduct] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _load_seen(self) -> SeenFilter:
+        with Session(engine) as session:
+            urls = session.exec(
+                select(FrontierURL.url).where(FrontierURL.domain == self.domain).execution_options(yield_per=5000)
+            )
+            return SeenFilter(urls)
+
+    def due(self, limit: int) -> List[str]:
+        """Up to `limit` URLs due for fetching, most likely to have changed first."""
+        if self._seen is None:
+            self._seen = self._load_seen()
+        statement = (
+            select(FrontierURL)
+            .where(FrontierURL.domain == self.domain, FrontierURL.next_fetch_at <= datetime.utcnow())
+            .order_by(FrontierURL.priority.desc(), FrontierURL.next_fetch_at)
+            .limit(limit)
+        )
+        with Session(engine) as session:
+            rows = session.exec(statement).all()
+        with self._lock:
+            for row in rows:
+                self._claimed[row.url] = _UrlState(row.priority, row.content_hash, row.attempts)
+        return [row.url for row in rows]
+
+    def add(self, url: str) -> bool:
+        """Queue `url` for insertion unless the frontier already has it; True when new."""
+        if self._seen is None:
+            raise RuntimeError("Frontier.due must be called before add")
+        if not self._seen.add(url):
+            return False
+        with self._lock:
+            self._new.append(url)
+        return True
+
+    def record(
+        self,
+        url: str,
+        *,
+        content: Optional[bytes] = None,
+        item: Optional[ScrapedProduct] = None,
+        failed: bool = False,
+        disallowed: bool = False,
+    ) -> None:
+        """Buffer the outcome of fetching `url` (and the product parsed from it, if any)."""
+        now = datetime.utcnow()
+        with self._lock:
+            state = self._claimed.pop(url, None) or _UrlState()
+            if disallowed:
+                self._updates.append(
+                    {"url": url, "status": "disallowed", "attempts": 0, "next_fetch_at": now + self.max_interval}
+                )
+                return
+            if failed:
+                attempts = state.attempts + 1
+                delay = min(self.retry_base * 2 ** min(attempts - 1, 20), self.max_interval)
+                self._updates.append(
+                    {"url": url, "status": "failed", "attempts": attempts, "next_fetch_at": now + delay}
+                )
+                return
+            digest = hashlib.sha256(content).hexdigest() if content is not None else state.content_hash
+            # The first successful fetch counts as a change
+            changed = digest != state.content_hash
+            priority = (1 - CHANGE_WEIGHT) * state.priority + CHANGE_WEIGHT * changed
+            interval = min(self.min_interval / max(priority, 1e-6), self.max_interval)
+            self._updates.append(
+                {
+                    "url": url,
+                    "status": "fetched",
+                    "attempts": 0,
+                    "priority": priority,
+                    "content_hash": digest,
+                    "last_fetched": now,
+                    "next_fetch_at": now + interval,
+                }
+            )
+            if item is not None:
+                self._items.append(item)
+
+    def pending(self) -> int:
+        return len(self._new) + len(self._updates)
+
+    def flush(self) -> None:
+        """Insert new URLs, ingest buffered products, then store the fetch outcomes."""
+        with self._flush_lock:
+            with self._lock:
+                new, self._new = self._new, []
+                updates, self._updates = self._updates, []
+                items, self._items = self._items, []
+            if not (new or updates or items):
+                return
+            with _write_lock, Session(engine) as session:
+                now = datetime.utcnow()
+                for start in range(0, len(new), INSERT_BATCH_SIZE):
+                    session.execute(
+                        _dialect_insert(session)(FrontierURL.__table__)
+                        .values([
+                            {"url": u, "domain": self.domain, "next_fetch_at": now}
+                            for u in new[start:start + INSERT_BATCH_SIZE]
+                        ])
+                        .on_conflict_do_nothing(index_elements=["url"])
+                    )
+                session.commit()
+                if items:
+                    result = ingest_scraped_products(session, items, tags=self.tags, provider_ids=self.provider_ids)
+                    self.ingested.created += result.created
+                    self.ingested.updated += result.updated
+                if updates:
+                    session.execute(update(FrontierURL), updates)
+                    session.commit()
@@ -0,0 +1,108 @@
+"""Full-text search over product and provider names/descriptions.
+
+SQLite uses external-content FTS5 tables kept in sync by triggers and ranked with bm25.
+Postgres uses a generated `search_vector` tsvector column (Swedish + English stemming)
+with a GIN index, ranked with ts_rank_cd; names also match as substrings through the
+pg_trgm index (see migrations.py), which finds words inside Swedish compounds. Other
+backends fall back to ILIKE.
+"""
+from __future__ import annotations
+from typing import Any, List, Optional, Tuple
+import re
+from sqlalchemy import Float, Integer, func, literal_column, or_, text
+from sqlalchemy.engine import Connection
+
+
+# Table -> columns indexed for search; the first column is weighted highest
+SEARCH_TABLES = {
+    "product": ("name", "description"),
+    "provider": ("name", "description"),
+}
+
+
+def _sqlite_ddl(table: str, columns: Tuple[str, ...]) -> List[str]:
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+        f"content_rowid='id', tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def _postgres_ddl(table: str, columns: Tuple[str, ...]) -> List[str]:
+    weighted = " || ".join(
+        f"setweight(to_tsvector('{config}', coalesce({c}, '')), '{'A' if i == 0 else 'B'}')"
+        for i, c in enumerate(columns)
+        for config in ("swedish", "english")
+    )
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({weighted}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)",
+    ]
+
+
+def install_fulltext(conn: Connection) -> None:
+    """Create the search structures for the connection's dialect (idempotent)."""
+    dialect = conn.dialect.name
+    for table, columns in SEARCH_TABLES.items():
+        if dialect == "sqlite":
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table}_fts",)
+            ).first()
+            for statement in _sqlite_ddl(table, columns):
+                conn.exec_driver_sql(statement)
+            if not exists:
+                # Index rows written before the FTS table existed
+                conn.exec_driver_sql(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+        elif dialect == "postgresql":
+            for statement in _postgres_ddl(table, columns):
+                conn.exec_driver_sql(statement)
+
+
+def _terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def apply_text_search(statement, model: Any, q: str, dialect: str) -> Tuple[Any, Optional[Any]]:
+    """Filter `statement` to rows of `model` matching `q` and return it with a rank expression.
+
+    Every term must match and the last one is matched as a prefix, so partially typed
+    words from the search box already find results. The rank sorts best matches first in
+    ascending order; it is None on backends without full-text support.
+    """
+    terms = _terms(q)
+    if not terms:
+        return statement, None
+    table = model.__tablename__
+    if dialect == "sqlite":
+        match = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        hits = (
+            text(
+                f"SELECT rowid AS id, bm25({table}_fts, 10.0, 1.0) AS rank "
+                f"FROM {table}_fts WHERE {table}_fts MATCH :match"
+            )
+            .bindparams(match=match.strip())
+            .columns(id=Integer, rank=Float)
+            .subquery(f"{table}_hits")
+        )
+        return statement.join(hits, hits.c.id == model.id), hits.c.rank
+    if dialect == "postgresql":
+        tsquery_text = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+        tsquery = func.to_tsquery("swedish", tsquery_text).op("||")(func.to_tsquery("english", tsquery_text))
+        vector = literal_column(f"{table}.search_vector")
+        # One bound pattern rather than '%' || :q || '%', so the planner can use the trigram index
+        pattern = "%" + re.sub(r"([\\%_])", r"\\\1", q.strip()) + "%"
+        matches = or_(vector.op("@@")(tsquery), model.name.ilike(pattern, escape="\\"))
+        return statement.where(matches), -func.ts_rank_cd(vector, tsquery)
+    like = f"%{q}%"
+    return statement.where(model.name.ilike(like) | model.description.ilike(like)), None
@@ -0,0 +1,54 @@
+from __future__ import annotations
+from typing import Iterable, List, Optional
+import re
+import unicodedata
+
+
+# Common non-INCI spellings mapped onto the INCI name used as the canonical form
+INCI_ALIASES = {
+    "water": "aqua",
+    "eau": "aqua",
+    "aqua/water": "aqua",
+    "aqua/water/eau": "aqua",
+    "fragrance": "parfum",
+    "perfume": "parfum",
+    "parfum/fragrance": "parfum",
+    "vitamin e": "tocopherol",
+    "vitamin b3": "niacinamide",
+    "hyaluronic acid": "sodium hyaluronate",
+}
+
+_PARENTHESIS = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]")
+_SPACES = re.compile(r"\s+")
+
+
+def canonical_term(value: str) -> str:
+    """Normalize a tag or skin type for exact, case-insensitive matching."""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", value)).strip().casefold()
+
+
+def canonical_inci(name: str) -> Optional[str]:
+    """Canonical INCI form: casefolded, qualifiers like "(Water)" and footnote marks
+    stripped, and well-known aliases folded onto one name ("Parfum (Fragrance)*" -> "parfum")."""
+    value = canonical_term(name)
+    value = _PARENTHESIS.sub("", value)
+    value = value.strip(" *.†:")
+    value = _SPACES.sub(" ", value.replace(" / ", "/"))
+    if not value:
+        return None
+    return INCI_ALIASES.get(value, value)
+
+
+def canonical_inci_list(names: Optional[Iterable[str]]) -> List[str]:
+    """Canonical names in list order with duplicates dropped (first position wins)."""
+    seen: dict[str, None] = {}
+    for name in names or []:
+        if isinstance(name, str):
+            canonical = canonical_inci(name)
+            if canonical:
+                seen.setdefault(canonical, None)
+    return list(seen)
+
+
+def canonical_terms(values: Optional[Iterable[str]]) -> List[str]:
+    return list(dict.fromkeys(t for t in (canonical_term(v) for v in values or [] if isinstance(v, str)) if t))
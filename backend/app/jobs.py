@@ -0,0 +1,204 @@
+"""Background job queue for long-running scrape work.
+
+Jobs are rows in the `scrapejob` table and run on a thread pool inside the API process,
+so request handlers only enqueue and return a job id. Handlers report progress and save
+checkpoints through a JobContext; progress writes also poll for cancellation. On
+startup, queued jobs and jobs that were running when the process died are picked up
+again from their last checkpoint; this assumes one API process owns the queue (the
+Procfile runs a single uvicorn worker).
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import time
+import traceback
+import uuid
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from .config import get_settings
+from .database import engine
+from .models import ScrapeJob
+
+
+JobHandler = Callable[["JobContext", dict], Optional[dict]]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+FINISHED_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def register(fn: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Handle passed to job handlers for progress, checkpoints and cancellation."""
+
+    def __init__(self, job_id: str, checkpoint: Optional[dict], progress: Optional[dict]) -> None:
+        self.job_id = job_id
+        self.checkpoint: dict = dict(checkpoint or {})
+        self.counters: dict = dict(progress or {})
+        self._started = time.monotonic()
+        self._done_at_start = self.counters.get("done", 0)
+        self._last_write = 0.0
+
+    def progress(self, force: bool = False, **counters: Any) -> None:
+        """Merge counters into the job's progress and persist them (at most once a second
+        unless forced). Raises JobCancelled once cancellation has been requested."""
+        self.counters.update(counters)
+        now = time.monotonic()
+        if not force and now - self._last_write < 1.0:
+            return
+        self._last_write = now
+        total, done = self.counters.get("total"), self.counters.get("done")
+        if total and done is not None:
+            rate = (done - self._done_at_start) / max(now - self._started, 1e-6)
+            self.counters["eta_seconds"] = round((total - done) / rate, 1) if rate > 0 else None
+        with Session(engine) as session:
+            job = session.get(ScrapeJob, self.job_id)
+            if job is None:
+                raise JobCancelled()
+            job.progress = dict(self.counters)
+            job.checkpoint = dict(self.checkpoint)
+            job.updated_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+            if job.cancel_requested:
+                raise JobCancelled()
+
+    def save_checkpoint(self, **state: Any) -> None:
+        self.checkpoint.update(state)
+        self.progress(force=True)
+
+
+class JobManager:
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = workers or get_settings().job_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scrape-job")
+        return self._executor
+
+    def enqueue(self, kind: str, params: Optional[dict] = None) -> ScrapeJob:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = ScrapeJob(id=uuid.uuid4().hex, kind=kind, params=params or {}, progress={}, checkpoint={})
+        with Session(engine) as session:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+        self.executor.submit(self._run, job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[ScrapeJob]:
+        with Session(engine) as session:
+            return session.get(ScrapeJob, job_id)
+
+    def list(self, limit: int = 50) -> List[ScrapeJob]:
+        with Session(engine) as session:
+            statement = select(ScrapeJob).order_by(ScrapeJob.created_at.desc()).limit(limit)
+            return list(session.exec(statement).all())
+
+    def cancel(self, job_id: str) -> Optional[ScrapeJob]:
+        with Session(engine) as session:
+            job = session.get(ScrapeJob, job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def resume(self, job_id: str) -> Optional[ScrapeJob]:
+        """Re-queue a failed or cancelled job; its handler continues from the checkpoint."""
+        with Session(engine) as session:
+            job = session.get(ScrapeJob, job_id)
+            if job is None or job.status not in {"failed", "cancelled"}:
+                return job
+            job.status = "queued"
+            job.cancel_requested = False
+            job.error = None
+            job.finished_at = None
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+        self.executor.submit(self._run, job_id)
+        return job
+
+    def recover(self) -> None:
+        """Re-queue jobs interrupted by a restart and submit everything queued."""
+        with Session(engine) as session:
+            session.execute(
+                update(ScrapeJob)
+                .where(ScrapeJob.status == "running")
+                .values(status="queued")
+            )
+            session.commit()
+            job_ids = session.exec(select(ScrapeJob.id).where(ScrapeJob.status == "queued")).all()
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _claim(self, job_id: str) -> Optional[ScrapeJob]:
+        # Conditional update so only one worker (or process) runs a given job
+        with Session(engine) as session:
+            claimed = session.execute(
+                update(ScrapeJob)
+                .where(ScrapeJob.id == job_id, ScrapeJob.status == "queued")
+                .values(status="running", started_at=datetime.utcnow(), updated_at=datetime.utcnow())
+            ).rowcount
+            session.commit()
+            return session.get(ScrapeJob, job_id) if claimed else None
+
+    def _finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None,
+                ctx: Optional[JobContext] = None) -> None:
+        with Session(engine) as session:
+            job = session.get(ScrapeJob, job_id)
+            if job is None:
+                return
+            job.status = status
+            job.result = result
+            job.error = error
+            if ctx is not None:
+                job.progress = dict(ctx.counters, eta_seconds=0 if status == "succeeded" else None)
+                job.checkpoint = dict(ctx.checkpoint)
+            job.finished_at = job.updated_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+
+    def _run(self, job_id: str) -> None:
+        job = self._claim(job_id)
+        if job is None:
+            return
+        ctx = JobContext(job.id, job.checkpoint, job.progress)
+        try:
+            result = JOB_HANDLERS[job.kind](ctx, job.params or {})
+        except JobCancelled:
+            self._finish(job_id, "cancelled", ctx=ctx)
+        except Exception as e:
+            self._finish(job_id, "failed", error=f"{e}\n{traceback.format_exc(limit=5)}", ctx=ctx)
+        else:
+            self._finish(job_id, "succeeded", result=result, ctx=ctx)
+
+
+job_manager = JobManager()
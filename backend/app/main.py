@@ -2,22 +2,20 @@ from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from typing import List, Iterator
-import csv
-import io
-from sqlmodel import Session, select
-from sqlalchemy import cast, String
-from urllib.parse import urlparse
+from typing import AsyncIterator, Iterator, List
+from sqlmodel import Session
 from .config import get_settings
-from .database import create_db_and_tables, get_session
-from .routers import providers, products, search, health
+from .database import async_engine, create_db_and_tables, engine, get_session
+from .routers import providers, products, search, health, jobs
 from .scrapers.example import ExampleScraper
-from .scrapers.generic_jsonld import GenericJSONLDScraper
 from .scrapers.kicks_catalog import KicksCatalogScraper
 from .scrapers.lyko_catalog import LykoCatalogScraper
-from .scrapers.registry import TARGET_DOMAINS
-from .models import Provider, Product
-from .crud import create_provider, create_product, get_or_create_provider_by_name, get_product_by_url
+from .models import Provider
+from .jobs import job_manager
+from .scrapers.parse_pool import shutdown_parse_pool
+from . import tasks  # noqa: F401  (registers the scrape job handlers)
+from .crud import backfill_terms, ingest_scraped_products
+from .export import encode_csv
 
 settings = get_settings()
 app = FastAPI(title=settings.app_name)
@@ -28,17 +26,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 app.include_router(health.router, prefix="/api")
 app.include_router(providers.router, prefix="/api")
 app.include_router(products.router, prefix="/api")
 app.include_router(search.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
 
 
 @app.on_event("startup")
 def on_startup() -> None:
-    create_db_and_tables()
+    created = create_db_and_tables()
+    if created & {"producttag", "productfacet", "priceobservation", "productflag"}:
+        with Session(engine) as session:
+            backfill_terms(session)
+    job_manager.recover()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    job_manager.shutdown()
+    shutdown_parse_pool()
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -50,72 +61,35 @@ def root():
 def run_example_scraper(session: Session = Depends(get_session)):
     scraper = ExampleScraper()
     items = scraper.run()
-    provider = get_or_create_provider_by_name(session, "ExampleBrand")
-
-    created = 0
-    for it in items:
-        if it.url and get_product_by_url(session, it.url):
-            continue
-        product = Product(
-            provider_id=provider.id,
-            name=it.name,
-            url=it.url,
-            price_amount=it.price_amount,
-            price_currency=it.price_currency,
-            tags=["mock"],
-            inci=it.inci,
-        )
-        create_product(session, product)
-        created += 1
-    return {"created": created}
-
-
-@app.post("/api/scrape/run_all")
-def run_all_scrapers(limit_per_domain: int = 50, session: Session = Depends(get_session)):
-    total_created = 0
-    for domain in TARGET_DOMAINS:
-        scraper = GenericJSONLDScraper(domain=domain, max_pages=limit_per_domain)
-        items = scraper.run()
-        for it in items:
-            provider = get_or_create_provider_by_name(session, it.provider_name)
-            if it.url and get_product_by_url(session, it.url):
-                continue
-            product = Product(
-                provider_id=provider.id,
-                name=it.name,
-                url=it.url,
-                price_amount=it.price_amount,
-                price_currency=it.price_currency,
-                tags=["scraped", domain],
-                inci=it.inci,
-            )
-            create_product(session, product)
-            total_created += 1
-    return {"created": total_created, "domains": TARGET_DOMAINS}
-
-
-@app.post("/api/scrape/run_domain")
-def run_single_domain(domain: str, limit: int = 50, session: Session = Depends(get_session)):
-    """Scrape a single domain, e.g., kicks.se or kicks.com, with a page limit."""
-    scraper = GenericJSONLDScraper(domain=domain, max_pages=limit)
-    items = scraper.run()
-    created = 0
-    for it in items:
-        provider = get_or_create_provider_by_name(session, it.provider_name)
-        if it.url and get_product_by_url(session, it.url):
-            continue
-        product = Product(
-            provider_id=provider.id,
-            name=it.name,
-            url=it.url,
-            price_amount=it.price_amount,
-            price_currency=it.price_currency,
-            tags=["scraped", domain],
-            inci=it.inci,
-        )
-        create_product(session, product)
-        created += 1
-    return {"created": created, "domain": domain}
+    result = ingest_scraped_products(session, items, tags=["mock"])
+    return {"created": result.created}
+
+
+def _job_accepted(job) -> dict:
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.post("/api/scrape/run_all", status_code=202)
+def run_all_scrapers(
+    limit_per_domain: int = 50,
+    domain_timeout: float | None = None,
+    incremental: bool = False,
+):
+    """Queue a concurrent crawl of every registered domain; poll /api/scrape/jobs/{job_id}.
+    With incremental=true only sitemap URLs modified since each domain's last complete crawl are visited.
+    """
+    job = job_manager.enqueue(
+        "run_all",
+        {"limit_per_domain": limit_per_domain, "domain_timeout": domain_timeout, "incremental": incremental},
+    )
+    return _job_accepted(job)
+
+
+@app.post("/api/scrape/run_domain", status_code=202)
+def run_single_domain(domain: str, limit: int = 50, incremental: bool = False):
+    """Queue a scrape of a single domain, e.g., kicks.se or kicks.com, with a page limit."""
+    job = job_manager.enqueue("run_domain", {"domain": domain, "limit": limit, "incremental": incremental})
+    return _job_accepted(job)
 
 
 class URLList(BaseModel):
@@ -123,47 +97,25 @@ class URLList(BaseModel):
     domain: str | None = None
 
 
-@app.post("/api/scrape/run_urls")
-def run_urls(payload: URLList, session: Session = Depends(get_session)):
+@app.post("/api/scrape/run_urls", status_code=202)
+def run_urls(payload: URLList):
     domain = payload.domain or (payload.urls[0].split("/")[2] if payload.urls else "unknown")
-    scraper = GenericJSONLDScraper(domain=domain, max_pages=len(payload.urls))
-    created = 0
-    for url in payload.urls:
-        try:
-            item = scraper.scrape_url(url)
-        except Exception:
-            continue
-        if not item:
-            continue
-        provider = get_or_create_provider_by_name(session, item.provider_name)
-        if item.url and get_product_by_url(session, item.url):
-            continue
-        product = Product(
-            provider_id=provider.id,
-            name=item.name,
-            url=item.url,
-            price_amount=item.price_amount,
-            price_currency=item.price_currency,
-            tags=["scraped", domain],
-            inci=item.inci,
-        )
-        create_product(session, product)
-        created += 1
-    return {"created": created, "count": len(payload.urls), "domain": domain}
+    job = job_manager.enqueue("run_urls", {"urls": payload.urls, "domain": domain})
+    return _job_accepted(job)
 
 
 @app.get("/api/kicks/catalog.csv")
 def kicks_catalog_csv(max_brands: int | None = 50, max_pages_per_brand: int = 2):
+    """Stream (brand_slug, product_url) rows, flushing each brand as soon as its listing is crawled."""
     scraper = KicksCatalogScraper()
-    pairs = scraper.list_all_products(max_brands=max_brands, max_pages_per_brand=max_pages_per_brand)
 
-    def generate() -> Iterator[bytes]:
-        buffer = io.StringIO()
-        writer = csv.writer(buffer)
-        writer.writerow(["brand_slug", "product_url"])
-        for slug, url in pairs:
-            writer.writerow([slug, url])
-        yield buffer.getvalue().encode("utf-8")
+    async def generate() -> AsyncIterator[bytes]:
+        try:
+            yield encode_csv([["brand_slug", "product_url"]])
+            async for _, slug, urls in scraper.iter_brands(max_brands, max_pages_per_brand):
+                yield encode_csv([slug, u] for u in urls)
+        finally:
+            scraper.close()
 
     return StreamingResponse(generate(), media_type="text/csv",
                               headers={"Content-Disposition": "attachment; filename=kicks_catalog.csv"})
@@ -182,14 +134,13 @@ def lyko_brands_json():
 @app.get("/api/lyko/brands.csv")
 def lyko_brands_csv():
     scraper = LykoCatalogScraper()
-    urls = scraper.list_brand_roots()
     def generate() -> Iterator[bytes]:
-        buffer = io.StringIO()
-        writer = csv.writer(buffer)
-        writer.writerow(["brand_url"])
-        for u in urls:
-            writer.writerow([u])
-        yield buffer.getvalue().encode("utf-8")
+        try:
+            yield encode_csv([["brand_url"]])
+            for u in scraper.iter_brand_roots():
+                yield encode_csv([[u]])
+        finally:
+            scraper.close()
     return StreamingResponse(generate(), media_type="text/csv",
                               headers={"Content-Disposition": "attachment; filename=lyko_brands.csv"})
 
@@ -200,46 +151,25 @@ def lyko_brand_products(brand_root: str, limit: int = 100):
     return {"brand_root": brand_root, "count": len(urls), "urls": urls}
 
 
-@app.post("/api/scrape/enrich_missing")
-def enrich_missing(tag: str | None = None, limit: int = 100, session: Session = Depends(get_session)):
-    """Enrich existing products by scraping their URLs and updating missing price/currency/INCI.
+@app.post("/api/scrape/match_products", status_code=202)
+def match_products():
+    """Queue matching of products written before matching existed (see /api/products/{id}/offers);
+    new and changed products are matched when they are written."""
+    job = job_manager.enqueue("match_products")
+    return _job_accepted(job)
+
+
+@app.post("/api/scrape/analyze_products", status_code=202)
+def analyze_products():
+    """Queue re-scoring of every product's ingredient flags and comedogenic score, e.g. after the rules in analysis.py change."""
+    job = job_manager.enqueue("analyze_products")
+    return _job_accepted(job)
+
+
+@app.post("/api/scrape/enrich_missing", status_code=202)
+def enrich_missing(tag: str | None = None, limit: int = 100):
+    """Queue enrichment of existing products by scraping their URLs and updating missing price/currency/INCI.
     Optionally filter by tag (e.g., 'lyko.com').
     """
-    stmt = select(Product).where(
-        (Product.inci == None) | (Product.price_amount == None) | (Product.price_currency == None)
-    )
-    if tag:
-        stmt = stmt.where(cast(Product.tags, String).ilike(f"%{tag}%"))
-    stmt = stmt.limit(limit)
-    products_to_fix = session.exec(stmt).all()
-
-    updated = 0
-    scrapers: dict[str, GenericJSONLDScraper] = {}
-
-    for p in products_to_fix:
-        if not p.url:
-            continue
-        domain = urlparse(p.url).netloc
-        if domain not in scrapers:
-            scrapers[domain] = GenericJSONLDScraper(domain=domain, max_pages=1)
-        try:
-            item = scrapers[domain].scrape_url(p.url)
-        except Exception:
-            continue
-        if not item:
-            continue
-        changed = False
-        if item.price_amount is not None and p.price_amount is None:
-            p.price_amount = item.price_amount
-            changed = True
-        if item.price_currency and (p.price_currency is None or p.price_currency == "SEK"):
-            p.price_currency = item.price_currency
-            changed = True
-        if item.inci and not p.inci:
-            p.inci = item.inci
-            changed = True
-        if changed:
-            session.add(p)
-            session.commit()
-            updated += 1
-    return {"checked": len(products_to_fix), "updated": updated} 
\ No newline at end of file
+    job = job_manager.enqueue("enrich_missing", {"tag": tag, "limit": limit})
+    return _job_accepted(job)
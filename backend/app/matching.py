@@ -0,0 +1,307 @@
+"""Cross-retailer product matching.
+
+Every product is assigned to a CanonicalProduct, so the offers of all retailers selling
+it are one indexed lookup on `productmatch.canonical_id`. Products are matched when they
+are written (crud.sync_product_terms calls sync_matches), and matched again when their
+GTIN or SKU changes, trying in this order:
+
+1. GTIN/EAN (normalized to 14 digits) of a canonical product.
+2. SKU of another product of the same brand (provider).
+3. MinHash similarity. Each product gets a signature over character trigrams of its name
+   (brand words and pack size removed) and one over its first INCI names. The name
+   signature is split into LSH bands, hashed together with the brand, and stored in
+   `matchbucket`; products sharing a bucket are candidates, accepted when the estimated
+   name similarity reaches NAME_THRESHOLD, their INCI lists agree (when both have one),
+   their pack sizes and GTINs do not differ and they are sold by different retailers
+   (one shop does not list the same product twice).
+4. Otherwise the product starts a new canonical product.
+"""
+from __future__ import annotations
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import hashlib
+import random
+import re
+from sqlalchemy import delete, insert, tuple_
+from sqlmodel import Session, select
+
+from .ingredients import canonical_inci_list, canonical_term
+from .models import CanonicalProduct, MatchBucket, Product, ProductMatch, Provider
+
+
+NUM_PERM = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+NAME_THRESHOLD = 0.7
+INCI_THRESHOLD = 0.5
+# INCI names (highest concentration first) that go into the ingredient signature
+INCI_PREFIX = 20
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed: signatures must stay comparable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_SIZE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(ml|l|g|kg|oz|st|pcs)\b")
+_WORDS = re.compile(r"\w+")
+
+
+def normalize_gtin(value: Optional[str]) -> Optional[str]:
+    """GTIN-8/12/13/14 as 14 digits when the check digit is valid, else None."""
+    digits = re.sub(r"\D", "", value or "")
+    if len(digits) not in (8, 12, 13, 14):
+        return None
+    digits = digits.zfill(14)
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(digits[:-1]))
+    return digits if (10 - total % 10) % 10 == int(digits[-1]) else None
+
+
+def brand_key(provider_name: Optional[str]) -> str:
+    """Blocking key of the brand. Providers named after a shop domain carry no brand."""
+    if not provider_name or "." in provider_name:
+        return ""
+    return canonical_term(provider_name)
+
+
+def pack_size(name: str) -> Optional[str]:
+    match = _SIZE.search(canonical_term(name))
+    return f"{match.group(1).replace(',', '.')}{match.group(2)}" if match else None
+
+
+def name_shingles(name: str, brand: str) -> List[str]:
+    """Character trigrams of the name without brand words and pack size."""
+    text = _SIZE.sub(" ", canonical_term(name))
+    brand_words = set(_WORDS.findall(brand))
+    words = [w for w in _WORDS.findall(text) if w not in brand_words]
+    joined = " ".join(words)
+    if len(joined) < 3:
+        return [joined] if joined else []
+    return [joined[i:i + 3] for i in range(len(joined) - 2)]
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(tokens: Iterable[str]) -> Optional[bytes]:
+    """NUM_PERM-value MinHash signature, packed as unsigned 64-bit ints; None without tokens."""
+    hashes = [_token_hash(t) for t in set(tokens)]
+    if not hashes:
+        return None
+    return array("Q", [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]).tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of the token sets behind two signatures."""
+    left, right = array("Q", a), array("Q", b)
+    return sum(x == y for x, y in zip(left, right)) / len(left)
+
+
+def band_buckets(brand: str, signature: bytes) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs of a name signature; the bucket hash includes the brand."""
+    values = array("Q", signature)
+    buckets = []
+    for band in range(BANDS):
+        chunk = values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(brand.encode("utf-8") + b"\0" + chunk, digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+    return buckets
+
+
+def retailer(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host or None
+
+
+def _similar_canonical(
+    session: Session,
+    buckets: Sequence[Tuple[int, int]],
+    name: str,
+    name_signature: bytes,
+    inci_signature: Optional[bytes],
+    gtin: Optional[str],
+    shop: Optional[str],
+) -> Optional[int]:
+    """Canonical product of the most similar bucket-sharing product that passes the checks."""
+    statement = (
+        select(
+            ProductMatch.canonical_id,
+            Product.name,
+            ProductMatch.name_signature,
+            ProductMatch.inci_signature,
+            Product.gtin,
+            Product.url,
+            CanonicalProduct.gtin,
+        )
+        .join(Product, Product.id == ProductMatch.product_id)
+        .join(CanonicalProduct, CanonicalProduct.id == ProductMatch.canonical_id)
+        .where(
+            ProductMatch.product_id.in_(
+                select(MatchBucket.product_id).where(tuple_(MatchBucket.band, MatchBucket.bucket).in_(buckets))
+            )
+        )
+    )
+    size = pack_size(name)
+    best: Tuple[float, Optional[int]] = (NAME_THRESHOLD, None)
+    for (
+        canonical_id, other_name, other_name_signature, other_inci_signature, other_gtin, other_url, canonical_gtin
+    ) in session.exec(statement).all():
+        score = similarity(name_signature, other_name_signature)
+        if score < best[0] or (best[1] is not None and score == best[0]):
+            continue
+        if gtin and any(g and g != gtin for g in (normalize_gtin(other_gtin), canonical_gtin)):
+            continue
+        if shop and retailer(other_url) == shop:
+            continue
+        other_size = pack_size(other_name)
+        if size and other_size and size != other_size:
+            continue
+        if inci_signature and other_inci_signature:
+            if similarity(inci_signature, other_inci_signature) < INCI_THRESHOLD:
+                continue
+        best = (score, canonical_id)
+    return best[1]
+
+
+def match_products(session: Session, product_ids: Iterable[int]) -> Dict[str, int]:
+    """Assign the given unmatched products to canonical products; returns counts per method.
+    Products are matched one after another, so later ones can match earlier ones of the
+    same batch. Does not commit."""
+    ids = list(product_ids)
+    counts: Dict[str, int] = {}
+    if not ids:
+        return counts
+    rows = session.exec(
+        select(
+            Product.id, Product.name, Product.url, Product.inci, Product.gtin, Product.sku, Product.provider_id,
+            Provider.name,
+        )
+        .join(Provider, Provider.id == Product.provider_id)
+        .where(Product.id.in_(ids), Product.id.notin_(select(ProductMatch.product_id)))
+        .order_by(Product.id)
+    ).all()
+    for product_id, name, url, inci, gtin, sku, provider_id, provider_name in rows:
+        brand = brand_key(provider_name)
+        gtin = normalize_gtin(gtin)
+        name_signature = minhash(name_shingles(name, brand)) or minhash([canonical_term(name)])
+        inci_signature = minhash(canonical_inci_list(inci)[:INCI_PREFIX])
+        buckets = band_buckets(brand, name_signature)
+        canonical_id, method = None, "new"
+        if gtin:
+            canonical_id = session.exec(select(CanonicalProduct.id).where(CanonicalProduct.gtin == gtin)).first()
+            method = "gtin"
+        if canonical_id is None and sku:
+            statement = (
+                select(ProductMatch.canonical_id)
+                .join(Product, Product.id == ProductMatch.product_id)
+                .join(CanonicalProduct, CanonicalProduct.id == ProductMatch.canonical_id)
+                .where(Product.provider_id == provider_id, Product.sku == sku)
+            )
+            if gtin:
+                # A different GTIN means a different product despite the shared SKU
+                statement = statement.where(CanonicalProduct.gtin.is_(None) | (CanonicalProduct.gtin == gtin))
+            canonical_id = session.exec(statement).first()
+            method = "sku"
+        if canonical_id is None:
+            canonical_id = _similar_canonical(
+                session, buckets, name, name_signature, inci_signature, gtin, retailer(url)
+            )
+            method = "similar"
+        if canonical_id is None:
+            canonical = CanonicalProduct(name=name, brand=provider_name if brand else None, gtin=gtin)
+            session.add(canonical)
+            session.flush()
+            canonical_id, method = canonical.id, "new"
+        elif gtin:
+            canonical = session.get(CanonicalProduct, canonical_id)
+            if canonical.gtin is None:
+                canonical.gtin = gtin
+                session.add(canonical)
+        session.execute(
+            insert(ProductMatch).values(
+                product_id=product_id,
+                canonical_id=canonical_id,
+                method=method,
+                name_signature=name_signature,
+                inci_signature=inci_signature,
+                gtin=gtin,
+                sku=sku,
+            )
+        )
+        session.execute(
+            insert(MatchBucket), [{"band": band, "bucket": bucket, "product_id": product_id} for band, bucket in buckets]
+        )
+        counts[method] = counts.get(method, 0) + 1
+    return counts
+
+
+def sync_matches(session: Session, product_ids: Iterable[int]) -> Dict[str, int]:
+    """Match the given products that have no match yet, after dropping the matches of those
+    whose GTIN or SKU changed since they were matched; returns counts per method. Canonical
+    products left without any product are deleted. Does not commit."""
+    ids = list(product_ids)
+    if not ids:
+        return {}
+    rows = session.exec(
+        select(Product.id, Product.gtin, Product.sku, ProductMatch.canonical_id, ProductMatch.gtin, ProductMatch.sku)
+        .join(ProductMatch, ProductMatch.product_id == Product.id)
+        .where(Product.id.in_(ids))
+    ).all()
+    changed = {
+        product_id: canonical_id
+        for product_id, gtin, sku, canonical_id, matched_gtin, matched_sku in rows
+        if (normalize_gtin(gtin), sku) != (matched_gtin, matched_sku)
+    }
+    if changed:
+        session.execute(delete(MatchBucket).where(MatchBucket.product_id.in_(changed)))
+        session.execute(delete(ProductMatch).where(ProductMatch.product_id.in_(changed)))
+        session.execute(
+            delete(CanonicalProduct).where(
+                CanonicalProduct.id.in_(set(changed.values())),
+                CanonicalProduct.id.notin_(select(ProductMatch.canonical_id)),
+            )
+        )
+    return match_products(session, ids)
+
+
+def unmatched_product_ids(session: Session, after_id: int, limit: int) -> List[int]:
+    return session.exec(
+        select(Product.id)
+        .where(Product.id > after_id, Product.id.notin_(select(ProductMatch.product_id)))
+        .order_by(Product.id)
+        .limit(limit)
+    ).all()
+
+
+def product_offers(session: Session, product_id: int) -> Optional[dict]:
+    """Every retailer's offer for the canonical product of `product_id`, cheapest first;
+    None when the product does not exist."""
+    product = session.get(Product, product_id)
+    if product is None:
+        return None
+    canonical_id = session.exec(
+        select(ProductMatch.canonical_id).where(ProductMatch.product_id == product_id)
+    ).first()
+    statement = select(Product, Provider.name).join(Provider, Provider.id == Product.provider_id)
+    if canonical_id is None:
+        statement = statement.where(Product.id == product_id)
+    else:
+        statement = statement.join(ProductMatch, ProductMatch.product_id == Product.id).where(
+            ProductMatch.canonical_id == canonical_id
+        )
+    offers = [
+        {
+            "product_id": p.id,
+            "retailer": retailer(p.url),
+            "provider": provider_name,
+            "name": p.name,
+            "url": p.url,
+            "price_amount": p.price_amount,
+            "price_currency": p.price_currency,
+        }
+        for p, provider_name in session.exec(statement).all()
+    ]
+    offers.sort(key=lambda o: (o["price_amount"] is None, o["price_amount"] or 0, o["product_id"]))
+    return {"canonical_id": canonical_id, "offers": offers}
@@ -0,0 +1,184 @@
+"""Versioned schema migrations.
+
+`SQLModel.metadata.create_all` creates missing tables together with their indexes, but it
+never changes a table that already exists. Changes to existing tables are listed here as
+numbered steps: each runs once per database, in order, inside the startup transaction,
+and is recorded in the `schemamigration` table. Steps must also be harmless on a
+database that create_all has just built, where their DDL is already in place.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import delete, func, insert, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from .models import Product, ProductIngredient, ProductSkinType, ProductTag, SchemaMigration
+from .urls import canonical_url
+
+
+BATCH_SIZE = 1000
+
+
+# Term rows derived from each JSON column, moved along with it when duplicates merge
+_TERM_TABLES = {"inci": ProductIngredient, "tags": ProductTag, "skin_types": ProductSkinType}
+
+
+def _merge_duplicate_product(conn: Connection, columns: List[str], keep_id: int, drop_id: int) -> None:
+    """Fill the empty fields of product `keep_id` from `drop_id`, then delete `drop_id`.
+    Term rows follow the JSON column they were derived from; the price moves together with
+    its currency."""
+    product = Product.__table__
+    cols = [product.c[name] for name in columns]
+    keep, drop = (
+        conn.execute(select(*cols).where(product.c.id == pid)).mappings().first() for pid in (keep_id, drop_id)
+    )
+    values = {
+        name: drop[name]
+        for name in columns
+        if name not in ("id", "url", "price_currency") and keep[name] in (None, [], "") and drop[name] not in (None, [], "")
+    }
+    if "price_amount" in values and "price_currency" in columns:
+        values["price_currency"] = drop["price_currency"]
+    if values:
+        conn.execute(update(product).where(product.c.id == keep_id).values(**values))
+    for name, model in _TERM_TABLES.items():
+        if name in values:
+            conn.execute(update(model).where(model.product_id == drop_id).values(product_id=keep_id))
+        else:
+            conn.execute(delete(model).where(model.product_id == drop_id))
+    conn.execute(delete(product).where(product.c.id == drop_id))
+
+
+def _product_url_unique(conn: Connection) -> None:
+    """Unique index on product.url. Older versions never checked URLs on insert, so products
+    sharing one are first merged into the lowest id (see _merge_duplicate_product)."""
+    product = Product.__table__
+    columns = [c["name"] for c in inspect(conn).get_columns("product")]
+    duplicated = conn.execute(
+        select(product.c.url).where(product.c.url.isnot(None)).group_by(product.c.url).having(func.count() > 1)
+    ).scalars().all()
+    for url in duplicated:
+        keep_id, *drop_ids = conn.execute(
+            select(product.c.id).where(product.c.url == url).order_by(product.c.id)
+        ).scalars()
+        for drop_id in drop_ids:
+            _merge_duplicate_product(conn, columns, keep_id, drop_id)
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS uq_product_url ON product (url)")
+
+
+def _canonical_product_urls(conn: Connection) -> None:
+    """Rewrite stored URLs to urls.canonical_url. When the canonical URL is already taken,
+    the duplicate is merged into the row stored under it (see _merge_duplicate_product)."""
+    product = Product.__table__
+    # Only the columns this database has; later steps add the newer ones
+    columns = [c["name"] for c in inspect(conn).get_columns("product")]
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(product.c.id, product.c.url)
+            .where(product.c.id > last_id, product.c.url.isnot(None))
+            .order_by(product.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for product_id, url in rows:
+            canonical = canonical_url(url)
+            if canonical == url:
+                continue
+            existing = conn.execute(
+                select(product.c.id).where(product.c.url == canonical).order_by(product.c.id)
+            ).first()
+            if existing:
+                _merge_duplicate_product(conn, columns, existing.id, product_id)
+            else:
+                conn.execute(update(product).where(product.c.id == product_id).values(url=canonical))
+
+
+def _create_product_indexes(conn: Connection, *names: str) -> None:
+    for index in Product.__table__.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+def _product_filter_indexes(conn: Connection) -> None:
+    """Replace the single-column product indexes with the composite ones in models.Product."""
+    _create_product_indexes(
+        conn,
+        "ix_product_provider_price",
+        "ix_product_provider_rating",
+        "ix_product_price_id",
+        "ix_product_rating_id",
+        "ix_product_currency_price",
+    )
+    for name in ("ix_product_provider_id", "ix_product_price_amount", "ix_product_price_currency", "ix_product_rating"):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+def _product_name_trigram(conn: Connection) -> None:
+    """Trigram index for substring matches on product names (Postgres only)."""
+    if conn.dialect.name != "postgresql":
+        return
+    try:
+        with conn.begin_nested():
+            conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DBAPIError:
+        # Needs a role allowed to create extensions; name search then scans instead
+        return
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING GIN (name gin_trgm_ops)"
+    )
+
+
+def _product_identifiers(conn: Connection) -> None:
+    """GTIN and SKU columns for cross-retailer matching."""
+    columns = {c["name"] for c in inspect(conn).get_columns("product")}
+    for name in ("gtin", "sku"):
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE product ADD COLUMN {name} VARCHAR")
+    _create_product_indexes(conn, "ix_product_gtin", "ix_product_provider_sku")
+
+
+def _product_analysis(conn: Connection) -> None:
+    """Comedogenic score column; the flags live in the new productflag table."""
+    if "comedogenic_score" not in {c["name"] for c in inspect(conn).get_columns("product")}:
+        conn.exec_driver_sql("ALTER TABLE product ADD COLUMN comedogenic_score INTEGER")
+    _create_product_indexes(conn, "ix_product_comedogenic_id")
+
+
+def _product_match_identifiers(conn: Connection) -> None:
+    """Identifiers a product was matched with. Existing matches keep NULL, so products whose
+    GTIN or SKU arrived after they were matched are re-matched on their next write."""
+    columns = {c["name"] for c in inspect(conn).get_columns("productmatch")}
+    for name in ("gtin", "sku"):
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE productmatch ADD COLUMN {name} VARCHAR")
+
+
+# (version, name, step) in the order they are applied; never renumber or remove a step.
+# URLs are canonicalized and deduplicated before the unique index is created on them.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (2, "canonical_product_urls", _canonical_product_urls),
+    (1, "product_url_unique", _product_url_unique),
+    (3, "product_filter_indexes", _product_filter_indexes),
+    (4, "product_name_trigram", _product_name_trigram),
+    (5, "product_identifiers", _product_identifiers),
+    (6, "product_analysis", _product_analysis),
+    (7, "product_match_identifiers", _product_match_identifiers),
+]
+
+
+def apply_migrations(conn: Connection) -> List[str]:
+    """Run the steps this database has not recorded yet; returns their names."""
+    table = SchemaMigration.__table__
+    applied = set(conn.execute(select(table.c.version)).scalars())
+    ran = []
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        step(conn)
+        conn.execute(insert(table).values(version=version, name=name, applied_at=datetime.utcnow()))
+        ran.append(name)
+    return ran
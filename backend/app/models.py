@@ -1,7 +1,8 @@
 from __future__ import annotations
+from datetime import date, datetime
 from typing import Optional, List
 from sqlmodel import SQLModel, Field
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, BigInteger, Column, Index
 
 
 class Provider(SQLModel, table=True):
@@ -16,14 +17,30 @@ class Provider(SQLModel, table=True):
 
 
 class Product(SQLModel, table=True):
+    __table_args__ = (
+        # url holds urls.canonical_url, so links to the same page dedupe onto one row
+        Index("uq_product_url", "url", unique=True),
+        # Filters combine provider and price range with a price or rating sort; the trailing
+        # id serves the keyset pagination tiebreak
+        Index("ix_product_provider_price", "provider_id", "price_amount", "id"),
+        Index("ix_product_provider_rating", "provider_id", "rating", "id"),
+        Index("ix_product_price_id", "price_amount", "id"),
+        Index("ix_product_rating_id", "rating", "id"),
+        Index("ix_product_currency_price", "price_currency", "price_amount"),
+        # Identifiers used by cross-retailer matching (matching.py)
+        Index("ix_product_gtin", "gtin"),
+        Index("ix_product_provider_sku", "provider_id", "sku"),
+        Index("ix_product_comedogenic_id", "comedogenic_score", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    provider_id: int = Field(index=True, foreign_key="provider.id")
+    provider_id: int = Field(foreign_key="provider.id")
     name: str = Field(index=True)
-    url: Optional[str] = Field(default=None, index=True)
+    url: Optional[str] = None
     description: Optional[str] = None
 
-    price_amount: Optional[float] = Field(default=None, index=True)
-    price_currency: Optional[str] = Field(default="SEK", index=True)
+    price_amount: Optional[float] = None
+    price_currency: Optional[str] = "SEK"
 
     ingredients: Optional[str] = None
     inci: Optional[list[str]] = Field(default=None, sa_column=Column(JSON))
@@ -32,4 +49,186 @@ class Product(SQLModel, table=True):
     pros: Optional[list[str]] = Field(default=None, sa_column=Column(JSON))
     cons: Optional[list[str]] = Field(default=None, sa_column=Column(JSON))
 
-    rating: Optional[float] = Field(default=None, index=True) 
\ No newline at end of file
+    rating: Optional[float] = None
+
+    # GTIN/EAN and retailer SKU from the product page's JSON-LD
+    gtin: Optional[str] = None
+    sku: Optional[str] = None
+
+    # Highest 0-5 comedogenic rating among the INCI ingredients (analysis.py); None without INCI
+    comedogenic_score: Optional[int] = None
+
+
+class CanonicalProduct(SQLModel, table=True):
+    """One product as sold by any number of retailers; see matching.py."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    brand: Optional[str] = None
+    # Normalized to 14 digits
+    gtin: Optional[str] = Field(default=None, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProductMatch(SQLModel, table=True):
+    """The canonical product a Product row was matched to, with its MinHash signatures."""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    canonical_id: int = Field(foreign_key="canonicalproduct.id", index=True)
+    # gtin | sku | similar | new
+    method: str
+    name_signature: bytes
+    inci_signature: Optional[bytes] = None
+    # Normalized GTIN and SKU of the product when it was matched; a change re-matches it
+    gtin: Optional[str] = None
+    sku: Optional[str] = None
+    matched_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MatchBucket(SQLModel, table=True):
+    """LSH band buckets of the name signatures; products sharing a bucket are match candidates."""
+    band: int = Field(primary_key=True)
+    bucket: int = Field(sa_column=Column(BigInteger, primary_key=True))
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+
+
+class PriceObservation(SQLModel, table=True):
+    """Append-only price history: one row each time a product's stored price changes."""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    observed_at: datetime = Field(primary_key=True)
+    amount: float
+    currency: Optional[str] = None
+
+
+class PriceDaily(SQLModel, table=True):
+    """Daily rollup of PriceObservation for days on which the price changed. low/high cover
+    the price in effect at the start of the day as well, close is the price at day end."""
+    __table_args__ = (Index("ix_pricedaily_day_product", "day", "product_id"),)
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    low: float
+    high: float
+    close: float
+    currency: Optional[str] = None
+
+
+class EnrichmentAttempt(SQLModel, table=True):
+    """Enrichment history of a product that is still missing fields (see tasks.enrich_missing)."""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    # Consecutive attempts that left the product incomplete
+    attempts: int = 0
+    last_attempt_at: Optional[datetime] = None
+    # The product is not picked again before this time
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    # no_data (fetch failed or no product parsed) | no_new_data | partial
+    outcome: Optional[str] = None
+
+
+class CrawlState(SQLModel, table=True):
+    domain: str = Field(primary_key=True)
+    # Start time (UTC) of the last crawl that walked the whole sitemap without timing out
+    last_success_at: Optional[datetime] = None
+
+
+class SchemaMigration(SQLModel, table=True):
+    """A migration from migrations.py that has been applied to this database."""
+    version: int = Field(primary_key=True)
+    name: str
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class FrontierURL(SQLModel, table=True):
+    """One URL of the persistent crawl frontier, see frontier.py."""
+    __table_args__ = (Index("ix_frontierurl_domain_next_fetch_at", "domain", "next_fetch_at"),)
+
+    url: str = Field(primary_key=True)
+    domain: str
+    # Moving average of how often a fetch found the page changed; new URLs start at 1
+    priority: float = 1.0
+    # pending (never fetched) -> fetched | failed (retried with backoff) | disallowed (by
+    # robots.txt; checked again after the maximum re-crawl interval)
+    status: str = "pending"
+    # Consecutive failed fetches
+    attempts: int = 0
+    last_fetched: Optional[datetime] = None
+    next_fetch_at: datetime = Field(default_factory=datetime.utcnow)
+    content_hash: Optional[str] = None
+
+
+# Normalized lookup tables, maintained on write from the JSON list columns above
+
+class Ingredient(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Canonical INCI name, see ingredients.canonical_inci
+    name: str = Field(unique=True, index=True)
+
+
+class ProductIngredient(SQLModel, table=True):
+    __table_args__ = (Index("ix_productingredient_ingredient_product", "ingredient_id", "product_id"),)
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    ingredient_id: int = Field(foreign_key="ingredient.id", primary_key=True)
+    # 0-based position in the INCI list (higher concentration first)
+    position: int = 0
+
+
+class ProductTag(SQLModel, table=True):
+    __table_args__ = (Index("ix_producttag_tag_product", "tag", "product_id"),)
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    tag: str = Field(primary_key=True)
+
+
+class ProductSkinType(SQLModel, table=True):
+    __table_args__ = (Index("ix_productskintype_skin_type_product", "skin_type", "product_id"),)
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    skin_type: str = Field(primary_key=True)
+
+
+class ProductFlag(SQLModel, table=True):
+    """Flags derived from the INCI list ("fragrance_free", "allergen", "retinoid", ...); see analysis.py."""
+    __table_args__ = (Index("ix_productflag_flag_product", "flag", "product_id"),)
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    flag: str = Field(primary_key=True)
+
+
+class ProductFacet(SQLModel, table=True):
+    """Facet values of a product, see facets.py."""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    # tag | skin_type | provider | price
+    facet: str = Field(primary_key=True)
+    value: str = Field(primary_key=True)
+
+
+class FacetCount(SQLModel, table=True):
+    """Number of products per facet value over the whole catalog, kept in step with ProductFacet."""
+    facet: str = Field(primary_key=True)
+    value: str = Field(primary_key=True)
+    count: int = 0
+
+
+class ProviderTag(SQLModel, table=True):
+    __table_args__ = (Index("ix_providertag_tag_provider", "tag", "provider_id"),)
+
+    provider_id: int = Field(foreign_key="provider.id", primary_key=True)
+    tag: str = Field(primary_key=True)
+
+
+class ScrapeJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    kind: str = Field(index=True)
+    # queued -> running -> succeeded | failed | cancelled
+    status: str = Field(default="queued", index=True)
+    params: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # Live counters (fetched, created, failed, done/total, eta_seconds, ...)
+    progress: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # Handler-defined state for resuming after a restart or cancellation
+    checkpoint: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    started_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,106 @@
+"""Keyset (cursor) pagination.
+
+A cursor records the sort key and id of the last row returned, so the next page is a
+range scan on (key, id) instead of an OFFSET that re-reads every earlier row. Rows whose
+sort key is NULL come last, in id order, as a second segment of the same listing.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Generic, List, Optional, TypeVar
+import base64
+import json
+from sqlalchemy import nulls_last, tuple_
+from sqlmodel import Session
+
+
+T = TypeVar("T")
+
+
+class PaginationError(ValueError):
+    pass
+
+
+@dataclass
+class Page(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
+@dataclass
+class SortKey:
+    name: str
+    expr: Any
+    descending: bool = False
+    nullable: bool = False
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise PaginationError("Malformed cursor")
+    if not isinstance(data, dict) or "s" not in data or "id" not in data:
+        raise PaginationError("Malformed cursor")
+    return data
+
+
+def _cursor_for(sort: SortKey, row_id: Any, value: Any) -> str:
+    return encode_cursor({"s": sort.name, "v": value, "id": row_id, "n": value is None and sort.nullable})
+
+
+def paginate(
+    session: Session,
+    statement,
+    sort: SortKey,
+    id_column,
+    *,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> Page:
+    """Run `statement` ordered by `sort` then id and return one page plus the next cursor.
+
+    Without a cursor, `offset` is still honoured for older clients; the returned cursor
+    lets them continue with keyset pages from there.
+    """
+    state = decode_cursor(cursor) if cursor else None
+    if state and state["s"] != sort.name:
+        raise PaginationError("Cursor was issued for a different sort order")
+    key, ident = sort.expr, id_column
+    statement = statement.add_columns(key)
+
+    def fetch(stmt, count: int) -> list:
+        return session.execute(stmt.limit(count + 1)).all()
+
+    if state is None and offset:
+        ordered = (key.desc() if sort.descending else key, ident.desc() if sort.descending else ident)
+        if sort.nullable:
+            ordered = (nulls_last(ordered[0]), ordered[1])
+        rows = fetch(statement.order_by(*ordered).offset(offset), limit)
+    else:
+        rows = []
+        in_null_segment = bool(state and state.get("n"))
+        if not in_null_segment:
+            stmt = statement.where(key.isnot(None)) if sort.nullable else statement
+            if state:
+                after = tuple_(key, ident)
+                last = tuple_(state["v"], state["id"])
+                stmt = stmt.where(after < last if sort.descending else after > last)
+            order = (key.desc(), ident.desc()) if sort.descending else (key, ident)
+            rows = fetch(stmt.order_by(*order), limit)
+        if sort.nullable and len(rows) <= limit:
+            stmt = statement.where(key.is_(None))
+            if in_null_segment:
+                stmt = stmt.where(ident > state["id"])
+            rows += fetch(stmt.order_by(ident), limit - len(rows))
+
+    page = Page(items=[row[0] for row in rows[:limit]])
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        page.next_cursor = _cursor_for(sort, getattr(last_row[0], "id"), last_row[-1])
+    return page
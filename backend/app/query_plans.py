@@ -0,0 +1,104 @@
+"""Check that the hot product list queries are answered from indexes.
+
+    python -m app.query_plans
+
+Each entry of HOT_QUERIES is run through crud.list_products against the configured
+database; the SQL it issues is captured and EXPLAINed. The plans are printed, and the
+exit status is 1 when any of them reads a whole table, so an index or query change that
+loses an index is caught before it reaches a full catalog. Postgres runs the check with
+sequential scans disabled: on a small development database the planner rightly prefers
+them, which says nothing about the plan on production data.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Tuple
+import json
+import re
+import sys
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from .crud import list_products
+from .database import create_db_and_tables, engine
+
+
+HOT_QUERIES: Dict[str, Dict[str, Any]] = {
+    "provider + price range by price": {"provider_id": 1, "min_price": 100, "max_price": 500, "sort": "price_amount"},
+    "provider by rating": {"provider_id": 1, "sort": "-rating"},
+    "price range by price": {"min_price": 100, "max_price": 500, "sort": "price_amount"},
+    "top rated": {"sort": "-rating"},
+    "cheapest": {"sort": "price_amount"},
+    "provider + tag": {"provider_id": 1, "tag": "serum"},
+    "ingredient": {"ingredient": "niacinamide"},
+    "search": {"q": "serum"},
+}
+
+# SQLite "SCAN product" without "USING ... INDEX" reads the whole table
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def _captured_statements(conn: Connection, filters: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    statements: List[Tuple[str, Any]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", capture)
+    try:
+        list_products(Session(bind=conn), **filters)
+    finally:
+        event.remove(conn, "before_cursor_execute", capture)
+    return statements
+
+
+def _postgres_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _postgres_nodes(child)
+
+
+def explain(conn: Connection, statement: str, parameters: Any) -> Tuple[List[str], List[str]]:
+    """Plan lines of `statement` and the tables it reads in full."""
+    if conn.dialect.name == "postgresql":
+        raw = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+        lines = [
+            f"{n['Node Type']} {n.get('Relation Name', '')} {n.get('Index Name', '')}".strip()
+            for n in _postgres_nodes(plan)
+        ]
+        scans = [n["Relation Name"] for n in _postgres_nodes(plan) if n["Node Type"] == "Seq Scan"]
+        return lines, scans
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    lines = [row[-1] for row in rows]
+    scans = [m.group(1) for m in map(_SQLITE_FULL_SCAN.match, lines) if m]
+    return lines, scans
+
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """Tables read in full by each hot query (empty when every plan uses indexes)."""
+    failures: Dict[str, List[str]] = {}
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for name, filters in HOT_QUERIES.items():
+            print(f"{name}: {filters}")
+            for statement, parameters in _captured_statements(conn, filters):
+                lines, scans = explain(conn, statement, parameters)
+                for line in lines:
+                    print(f"    {line}")
+                if scans:
+                    failures.setdefault(name, []).extend(scans)
+        conn.rollback()
+    return failures
+
+
+def main() -> int:
+    create_db_and_tables()
+    failures = check_query_plans()
+    for name, tables in failures.items():
+        print(f"FULL SCAN in {name!r}: {', '.join(sorted(set(tables)))}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Cache for read endpoints, invalidated by a catalog generation counter.
+
+Cache keys embed the current generation, so bumping it on every catalog write makes all
+earlier entries unreachable at once; they then age out through the TTL/LRU. The default
+backend is in-process. Setting `response_cache_url` to a redis:// URL (Redis or any
+RESP-compatible server such as Valkey or KeyDB) shares entries and the generation
+across workers; that needs the optional `redis` package.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple, Union
+import hashlib
+import json
+import threading
+import time
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .config import get_settings
+
+
+CATALOG_GENERATION_KEY = "gen:catalog"
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def get_counter(self, key: str) -> int: ...
+
+    def incr(self, key: str) -> int: ...
+
+
+class MemoryBackend:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("response_cache_url requires the 'redis' package") from e
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    def get_counter(self, key: str) -> int:
+        return int(self.client.get(key) or 0)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+
+@lru_cache
+def get_backend() -> CacheBackend:
+    settings = get_settings()
+    if settings.response_cache_url:
+        return RedisBackend(settings.response_cache_url)
+    return MemoryBackend(settings.response_cache_max_entries)
+
+
+def invalidate_catalog() -> None:
+    """Call after any write that changes products, providers or their derived tables."""
+    get_backend().incr(CATALOG_GENERATION_KEY)
+
+
+def _cache_key(request: Request, generation: int) -> str:
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"resp:{generation}:{request.url.path}?{params}"
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def _respond(request: Request, body: bytes, headers: Dict[str, str]) -> Response:
+    etag = _etag(body)
+    headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+BuildResult = Union[Response, Any, Tuple[Any, Dict[str, str]]]
+
+
+def _lookup(request: Request) -> Tuple[Optional[CacheBackend], Optional[str], Optional[Response]]:
+    ttl = get_settings().response_cache_ttl_seconds
+    if ttl <= 0:
+        return None, None, None
+    backend = get_backend()
+    key = _cache_key(request, backend.get_counter(CATALOG_GENERATION_KEY))
+    cached = backend.get(key)
+    if cached is None:
+        return backend, key, None
+    entry = json.loads(cached)
+    return backend, key, _respond(request, entry["body"].encode("utf-8"), entry["headers"])
+
+
+def _store(request: Request, backend: Optional[CacheBackend], key: Optional[str], result: BuildResult) -> Response:
+    if isinstance(result, Response):
+        return result
+    payload, headers = result if isinstance(result, tuple) else (result, {})
+    body = _dumps(payload)
+    if backend is not None:
+        entry = {"headers": headers, "body": body.decode("utf-8")}
+        backend.set(key, json.dumps(entry).encode("utf-8"), get_settings().response_cache_ttl_seconds)
+    return _respond(request, body, headers)
+
+
+def cached_response(request: Request, build: Callable[[], BuildResult]) -> Response:
+    """Serve a GET from the cache, or call `build` and cache its JSON.
+
+    `build` returns the payload, or `(payload, headers)` to add response headers. If it
+    returns a Response it is passed through uncached (e.g. error payloads). Responses carry
+    an ETag and a matching If-None-Match gets a 304.
+    """
+    backend, key, hit = _lookup(request)
+    if hit is not None:
+        return hit
+    return _store(request, backend, key, build())
+
+
+async def cached_response_async(request: Request, build: Callable[[], Awaitable[BuildResult]]) -> Response:
+    """cached_response for async handlers; `build` is a coroutine function."""
+    backend, key, hit = _lookup(request)
+    if hit is not None:
+        return hit
+    return _store(request, backend, key, await build())
+
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
@@ -0,0 +1,37 @@
+from typing import List
+from fastapi import APIRouter, HTTPException
+from ..jobs import job_manager
+from ..models import ScrapeJob
+
+router = APIRouter(prefix="/scrape/jobs", tags=["jobs"])
+
+
+@router.get("/", response_model=List[ScrapeJob])
+def get_jobs(limit: int = 50):
+    return job_manager.list(limit)
+
+
+@router.get("/{job_id}", response_model=ScrapeJob)
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/{job_id}/cancel", response_model=ScrapeJob)
+def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/{job_id}/resume", response_model=ScrapeJob)
+def resume_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in {"failed", "cancelled"}:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job_manager.resume(job_id)
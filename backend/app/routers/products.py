@@ -1,40 +1,195 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import Any, Dict, List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
-from ..database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..database import get_async_session, get_session
 from ..models import Product
-from ..crud import list_products, create_product
+from ..crud import (
+    create_product,
+    list_products_async,
+    price_drops_async,
+    price_history_async,
+    product_offers_async,
+    similar_products,
+)
+from ..export import csv_stream, iter_product_batches, ndjson_stream, parquet_available, parquet_stream
+from ..pagination import PaginationError
+from ..response_cache import cached_response, cached_response_async
+from ..similarity import similarity_available
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 
 @router.get("/", response_model=List[Product])
-def get_products(
+async def get_products(
+    request: Request,
     provider_id: int | None = None,
     q: str | None = None,
     min_price: float | None = None,
     max_price: float | None = None,
-    tag: str | None = None,
-    skin_type: str | None = None,
-    ingredient: str | None = None,
+    tag: List[str] | None = Query(None),
+    skin_type: List[str] | None = Query(None),
+    ingredient: List[str] | None = Query(None),
+    flag: List[str] | None = Query(None),
+    max_comedogenic: int | None = Query(None, ge=0, le=5),
+    sort: str | None = None,
+    cursor: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """List products. Pass the X-Next-Cursor response header back as `cursor` for the next page."""
+
+    async def build():
+        try:
+            page = await list_products_async(
+                session,
+                provider_id=provider_id,
+                q=q,
+                min_price=min_price,
+                max_price=max_price,
+                tag=tag,
+                skin_type=skin_type,
+                ingredient=ingredient,
+                flag=flag,
+                max_comedogenic=max_comedogenic,
+                sort=sort,
+                cursor=cursor,
+                limit=limit,
+                offset=offset,
+            )
+        except PaginationError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page.items, {"X-Next-Cursor": page.next_cursor} if page.next_cursor else {}
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/price-drops")
+async def get_price_drops(
+    request: Request,
+    days: int = Query(7, ge=1, le=365),
+    limit: int = Query(50, ge=1, le=500),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Products priced furthest below their highest price of the last `days`."""
+
+    async def build():
+        return await price_drops_async(session, days=days, limit=limit)
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/{product_id}/prices")
+async def get_price_history(
+    request: Request,
+    product_id: int,
+    days: int = Query(90, ge=1, le=3650),
+    resolution: Literal["changes", "daily"] = "changes",
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Price changes of a product, oldest first; `resolution=daily` gives low/high/close per day."""
+
+    async def build():
+        if await session.get(Product, product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return await price_history_async(session, product_id, days=days, resolution=resolution)
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/{product_id}/offers")
+async def get_product_offers(
+    request: Request, product_id: int, session: AsyncSession = Depends(get_async_session)
+):
+    """Every retailer's listing of the same product (see matching.py), cheapest first."""
+
+    async def build():
+        offers = await product_offers_async(session, product_id)
+        if offers is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return offers
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/{product_id}/similar")
+def get_similar_products(
+    request: Request,
+    product_id: int,
+    k: int = Query(10, ge=1, le=100),
     session: Session = Depends(get_session),
 ):
-    return list_products(
-        session,
-        provider_id=provider_id,
-        q=q,
-        min_price=min_price,
-        max_price=max_price,
-        tag=tag,
-        skin_type=skin_type,
-        ingredient=ingredient,
-        limit=limit,
-        offset=offset,
-    )
+    """Products with the most similar ingredient lists (see similarity.py). Sync so that
+    building the index runs on the threadpool, not the event loop."""
+    if not similarity_available():
+        raise HTTPException(status_code=501, detail="Ingredient similarity requires numpy and scipy")
+
+    def build():
+        similar = similar_products(session, product_id, k)
+        if similar is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return similar
+
+    return cached_response(request, build)
 
 
 @router.post("/", response_model=Product)
 def post_product(product: Product, session: Session = Depends(get_session)):
-    return create_product(session, product) 
\ No newline at end of file
+    return create_product(session, product) 
+
+def export_filters(
+    provider_id: int | None = None,
+    q: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    tag: List[str] | None = Query(None),
+    skin_type: List[str] | None = Query(None),
+    ingredient: List[str] | None = Query(None),
+    flag: List[str] | None = Query(None),
+    max_comedogenic: int | None = Query(None, ge=0, le=5),
+) -> Dict[str, Any]:
+    return {
+        "provider_id": provider_id,
+        "q": q,
+        "min_price": min_price,
+        "max_price": max_price,
+        "tag": tag,
+        "skin_type": skin_type,
+        "ingredient": ingredient,
+        "flag": flag,
+        "max_comedogenic": max_comedogenic,
+    }
+
+
+def _attachment(filename: str) -> Dict[str, str]:
+    return {"Content-Disposition": f"attachment; filename={filename}"}
+
+
+@router.get("/export.csv")
+def export_products_csv(filters: Dict[str, Any] = Depends(export_filters)):
+    """Stream every product matching the list filters as CSV; list columns are JSON-encoded."""
+    return StreamingResponse(
+        csv_stream(iter_product_batches(**filters)), media_type="text/csv", headers=_attachment("products.csv")
+    )
+
+
+@router.get("/export.ndjson")
+def export_products_ndjson(filters: Dict[str, Any] = Depends(export_filters)):
+    return StreamingResponse(
+        ndjson_stream(iter_product_batches(**filters)),
+        media_type="application/x-ndjson",
+        headers=_attachment("products.ndjson"),
+    )
+
+
+@router.get("/export.parquet")
+def export_products_parquet(filters: Dict[str, Any] = Depends(export_filters)):
+    if not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires the 'pyarrow' package")
+    return StreamingResponse(
+        parquet_stream(iter_product_batches(**filters)),
+        media_type="application/vnd.apache.parquet",
+        headers=_attachment("products.parquet"),
+    )
@@ -1,28 +1,43 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlmodel import Session
-from ..database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..database import get_async_session, get_session
 from ..models import Provider
-from ..crud import list_providers, create_provider, get_provider_by_id
+from ..crud import list_providers_async, create_provider, get_provider_by_id_async
+from ..pagination import PaginationError
+from ..response_cache import cached_response_async
 
 router = APIRouter(prefix="/providers", tags=["providers"])
 
 
 @router.get("/", response_model=List[Provider])
-def get_providers(
+async def get_providers(
+    request: Request,
     country: str | None = None,
-    tag: str | None = None,
+    tag: List[str] | None = Query(None),
     q: str | None = None,
+    sort: str | None = None,
+    cursor: str | None = None,
     limit: int = 50,
     offset: int = 0,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    return list_providers(session, country=country, tag=tag, q=q, limit=limit, offset=offset)
+    async def build():
+        try:
+            page = await list_providers_async(
+                session, country=country, tag=tag, q=q, sort=sort, cursor=cursor, limit=limit, offset=offset
+            )
+        except PaginationError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page.items, {"X-Next-Cursor": page.next_cursor} if page.next_cursor else {}
+
+    return await cached_response_async(request, build)
 
 
 @router.get("/{provider_id}", response_model=Provider)
-def get_provider(provider_id: int, session: Session = Depends(get_session)):
-    provider = get_provider_by_id(session, provider_id)
+async def get_provider(provider_id: int, session: AsyncSession = Depends(get_async_session)):
+    provider = await get_provider_by_id_async(session, provider_id)
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
     return provider
@@ -1,75 +1,167 @@
 from typing import Any, Dict, List
-from fastapi import APIRouter, Depends
-from sqlmodel import Session
-from ..database import get_session, engine
-from ..crud import list_providers, list_products
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..database import async_engine, get_async_session
+from ..crud import list_products_async, list_providers_async, product_facets_async
+from ..pagination import Page, PaginationError, decode_cursor, encode_cursor
+from ..response_cache import cached_response_async
 
 router = APIRouter(prefix="/search", tags=["search"])
 
 
+def _split_cursor(cursor: str | None) -> tuple[str | None, str | None, bool]:
+    """Return (providers cursor, products cursor, continuing) from a combined search cursor."""
+    if not cursor:
+        return None, None, False
+    data = decode_cursor(cursor)
+    return data.get("providers"), data.get("products"), True
+
+
+def _combine_cursor(providers: Page, products: Page) -> str | None:
+    if not providers.next_cursor and not products.next_cursor:
+        return None
+    # "id" keeps the shape decode_cursor expects; the sub-cursors carry the positions
+    return encode_cursor({"s": "search", "id": None, "providers": providers.next_cursor, "products": products.next_cursor})
+
+
 @router.get("/")
-def search(
+async def search(
+    request: Request,
+    q: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    tag: List[str] | None = Query(None),
+    skin_type: List[str] | None = Query(None),
+    ingredient: List[str] | None = Query(None),
+    flag: List[str] | None = Query(None),
+    max_comedogenic: int | None = Query(None, ge=0, le=5),
+    sort: str | None = None,
+    cursor: str | None = None,
+    limit: int = 25,
+    offset: int = 0,
+    session: AsyncSession = Depends(get_async_session),
+) -> Dict[str, Any]:
+    async def build() -> Dict[str, Any]:
+        try:
+            providers_cursor, products_cursor, continuing = _split_cursor(cursor)
+        except PaginationError:
+            providers_cursor, products_cursor, continuing = None, None, False
+        providers = Page()
+        # A list whose sub-cursor is missing on a follow-up page has already been exhausted
+        if not continuing or providers_cursor:
+            try:
+                providers = await list_providers_async(session, q=q, cursor=providers_cursor, limit=limit, offset=offset)
+            except Exception:
+                providers = Page()
+        products = Page()
+        if not continuing or products_cursor:
+            try:
+                products = await list_products_async(
+                    session,
+                    q=q,
+                    min_price=min_price,
+                    max_price=max_price,
+                    tag=tag,
+                    skin_type=skin_type,
+                    ingredient=ingredient,
+                    flag=flag,
+                    max_comedogenic=max_comedogenic,
+                    sort=sort,
+                    cursor=products_cursor,
+                    limit=limit,
+                    offset=offset,
+                )
+            except Exception:
+                products = Page()
+        return {
+            "providers": providers.items,
+            "products": products.items,
+            "next_cursor": _combine_cursor(providers, products),
+        }
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/products")
+async def search_products(
+    request: Request,
     q: str | None = None,
     min_price: float | None = None,
     max_price: float | None = None,
-    tag: str | None = None,
-    skin_type: str | None = None,
-    ingredient: str | None = None,
+    tag: List[str] | None = Query(None),
+    skin_type: List[str] | None = Query(None),
+    ingredient: List[str] | None = Query(None),
+    flag: List[str] | None = Query(None),
+    max_comedogenic: int | None = Query(None, ge=0, le=5),
+    sort: str | None = None,
+    cursor: str | None = None,
     limit: int = 25,
     offset: int = 0,
-    session: Session = Depends(get_session),
-) -> Dict[str, List[Any]]:
-    try:
-        providers = list_providers(session, q=q, limit=limit, offset=offset)
-    except Exception:
-        providers = []
-    try:
-        products = list_products(
+) -> Dict[str, Any]:
+    async def build():
+        try:
+            async with AsyncSession(async_engine) as session:
+                page = await list_products_async(
+                    session,
+                    q=q,
+                    min_price=min_price,
+                    max_price=max_price,
+                    tag=tag,
+                    skin_type=skin_type,
+                    ingredient=ingredient,
+                    flag=flag,
+                    max_comedogenic=max_comedogenic,
+                    sort=sort,
+                    cursor=cursor,
+                    limit=limit,
+                    offset=offset,
+                )
+        except Exception as e:
+            # Return empty list plus error hint to avoid 500 for the UI (not cached)
+            return JSONResponse({"providers": [], "products": [], "error": str(e)})
+        return {"providers": [], "products": page.items, "next_cursor": page.next_cursor}
+
+    return await cached_response_async(request, build)
+
+
+@router.get("/facets")
+async def search_facets(
+    request: Request,
+    q: str | None = None,
+    provider_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    tag: List[str] | None = Query(None),
+    skin_type: List[str] | None = Query(None),
+    ingredient: List[str] | None = Query(None),
+    flag: List[str] | None = Query(None),
+    max_comedogenic: int | None = Query(None, ge=0, le=5),
+    size: int = 20,
+    session: AsyncSession = Depends(get_async_session),
+) -> Dict[str, Any]:
+    """Product counts per tag, skin type, provider and price bucket for the same filters as
+    /search/products, e.g. {"facets": {"tag": [{"value": "serum", "count": 12}, ...], ...}}."""
+
+    async def build():
+        facets = await product_facets_async(
             session,
             q=q,
+            provider_id=provider_id,
             min_price=min_price,
             max_price=max_price,
             tag=tag,
             skin_type=skin_type,
             ingredient=ingredient,
-            limit=limit,
-            offset=offset,
+            flag=flag,
+            max_comedogenic=max_comedogenic,
+            size=size,
         )
-    except Exception:
-        products = []
-    return {"providers": providers, "products": products}
-
+        return {"facets": facets}
 
-@router.get("/products")
-def search_products(
-    q: str | None = None,
-    min_price: float | None = None,
-    max_price: float | None = None,
-    tag: str | None = None,
-    skin_type: str | None = None,
-    ingredient: str | None = None,
-    limit: int = 25,
-    offset: int = 0,
-) -> Dict[str, List[Any]]:
-    try:
-        with Session(engine) as session:
-            products = list_products(
-                session,
-                q=q,
-                min_price=min_price,
-                max_price=max_price,
-                tag=tag,
-                skin_type=skin_type,
-                ingredient=ingredient,
-                limit=limit,
-                offset=offset,
-            )
-    except Exception as e:
-        # Return empty list plus error hint to avoid 500 for the UI
-        return {"providers": [], "products": [], "error": str(e)}
-    return {"providers": [], "products": products}
+    return await cached_response_async(request, build)
 
 
 @router.get("/ping")
-def search_ping():
-    return {"ok": True} 
\ No newline at end of file
+async def search_ping():
+    return {"ok": True}
@@ -1,9 +1,13 @@
 from __future__ import annotations
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+import time
 import httpx
 from bs4 import BeautifulSoup
-from tenacity import retry, stop_after_attempt, wait_exponential
 from ..config import get_settings
+from .fetcher import RETRY_STATUSES, RobotsDisallowed, backoff_seconds, retry_after_seconds
+from .http_cache import FetchResult, get_http_cache
+from .robots import RobotsRules, origin, robots_cache, rules_for_response
 
 
 class ScrapedProduct:
@@ -15,6 +19,8 @@ class ScrapedProduct:
         price_amount: float | None,
         price_currency: str | None = "SEK",
         inci: Optional[list[str]] = None,
+        gtin: Optional[str] = None,
+        sku: Optional[str] = None,
     ):
         self.provider_name = provider_name
         self.name = name
@@ -22,6 +28,8 @@ class ScrapedProduct:
         self.price_amount = price_amount
         self.price_currency = price_currency or "SEK"
         self.inci = inci
+        self.gtin = gtin
+        self.sku = sku
 
 
 class BaseScraper:
@@ -32,15 +40,74 @@ class BaseScraper:
             timeout=20,
             follow_redirects=True,
         )
+        self.cache = get_http_cache(self.settings.scraper_cache_dir)
+        # Earliest next request per host under its robots.txt Crawl-delay
+        self._next_request_at: Dict[str, float] = {}
 
     def close(self) -> None:
         self.client.close()
 
-    @retry(wait=wait_exponential(multiplier=0.5, min=1, max=8), stop=stop_after_attempt(3))
-    def fetch_html(self, url: str) -> str:
-        resp = self.client.get(url)
+    def robots(self, url: str) -> RobotsRules:
+        """robots.txt rules for `url`'s origin, from the cache AsyncFetcher also uses."""
+        key = origin(url)
+        rules = robots_cache.get(key)
+        if rules is None:
+            try:
+                resp = self.client.get(f"{key}/robots.txt")
+            except httpx.HTTPError:
+                status, content = None, b""
+            else:
+                status, content = resp.status_code, resp.content
+            rules, ttl = rules_for_response(
+                status, content, self.settings.scraper_user_agent, self.settings.scraper_robots_ttl_seconds
+            )
+            robots_cache.put(key, rules, ttl)
+        return rules
+
+    def _get(self, url: str, headers: Dict[str, str], crawl_delay: Optional[float]) -> httpx.Response:
+        host = urlparse(url).netloc.lower()
+        if crawl_delay:
+            wait = self._next_request_at.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_request_at[host] = time.monotonic() + crawl_delay
+        return self.client.get(url, headers=headers)
+
+    def fetch(self, url: str) -> FetchResult:
+        """GET `url`, retrying 429/5xx responses after their Retry-After (or a backoff) and
+        network errors after a backoff; other 4xx responses are not retried. Raises
+        RobotsDisallowed without a request when robots.txt forbids the URL, and keeps
+        requests to a host at least its Crawl-delay apart."""
+        crawl_delay = None
+        if self.settings.scraper_respect_robots:
+            rules = self.robots(url)
+            if not rules.allowed(url):
+                raise RobotsDisallowed(url)
+            crawl_delay = rules.crawl_delay
+        headers = self.cache.conditional_headers(url) if self.cache else {}
+        attempts = max(self.settings.scraper_fetch_attempts, 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                resp = self._get(url, headers, crawl_delay)
+            except httpx.TransportError:
+                if attempt == attempts:
+                    raise
+                time.sleep(backoff_seconds(attempt))
+                continue
+            if resp.status_code not in RETRY_STATUSES or attempt == attempts:
+                break
+            wait = retry_after_seconds(resp)
+            wait = backoff_seconds(attempt) if wait is None else wait
+            if wait > self.settings.scraper_max_retry_after_seconds:
+                break
+            time.sleep(wait)
+        if self.cache:
+            return self.cache.resolve(url, resp)
         resp.raise_for_status()
-        return resp.text
+        return FetchResult(url, resp.content, resp.encoding, resp.status_code)
+
+    def fetch_html(self, url: str) -> str:
+        return self.fetch(url).text
 
     def parse(self, html: str) -> List[ScrapedProduct]:
         raise NotImplementedError
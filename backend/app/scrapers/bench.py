@@ -0,0 +1,149 @@
+"""Benchmark product extraction, in pages/sec on one core.
+
+    python -m app.scrapers.bench [--rounds N] [page.html ...]
+
+Without files a synthetic corpus is used: JSON-LD pages in the canonical and in variant
+markup, @graph pages and pages that need the meta/ingredients fallback, each padded to a
+realistic size. "before" is the previous BeautifulSoup-based extraction, kept here only
+for comparison.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import re
+import time
+from bs4 import BeautifulSoup
+
+from .extract import extract_product
+
+
+_PADDING = "".join(
+    f'<div class="tile"><a href="/p/{i}"><img src="/img/{i}.jpg" alt="Item {i}"></a>'
+    f'<span class="price">{100 + i} kr</span><p>Lorem ipsum dolor sit amet {i}</p></div>'
+    for i in range(400)
+)
+
+_PRODUCT = {
+    "@context": "https://schema.org",
+    "@type": "Product",
+    "name": "Hydrating Serum",
+    "brand": {"@type": "Brand", "name": "Acme"},
+    "offers": {"@type": "Offer", "price": "249.00", "priceCurrency": "SEK"},
+    "ingredients": "Aqua, Glycerin, Niacinamide, Sodium Hyaluronate, Parfum",
+}
+
+
+def _page(head: str, body: str = "") -> str:
+    return (
+        f"<!doctype html><html><head><title>Hydrating Serum | Shop</title>{head}</head>"
+        f"<body><nav>{_PADDING}</nav>{body}</body></html>"
+    )
+
+
+def synthetic_corpus() -> Dict[str, str]:
+    blob = json.dumps(_PRODUCT)
+    return {
+        "jsonld": _page(f'<script type="application/ld+json">{blob}</script>'),
+        "jsonld_variant": _page(f"<script data-x='1' type='application/ld+json; charset=utf-8'>{blob}</script>"),
+        "jsonld_graph": _page(
+            f'<script type="application/ld+json">{json.dumps({"@graph": [{"@type": "WebPage"}, _PRODUCT]})}</script>'
+        ),
+        "fallback": _page(
+            '<meta property="og:title" content="Hydrating Serum">'
+            '<meta property="product:price:amount" content="249.00">'
+            '<meta property="product:price:currency" content="SEK">',
+            "<section><h2>Ingredienser</h2><p>Aqua, Glycerin, Niacinamide, Parfum</p></section>",
+        ),
+    }
+
+
+def _legacy_extract(html: str) -> Optional[dict]:
+    start_tag = '<script type="application/ld+json">'
+    pos = 0
+    while True:
+        idx = html.find(start_tag, pos)
+        if idx == -1:
+            break
+        end = html.find("</script>", idx)
+        if end == -1:
+            break
+        chunk = html[idx + len(start_tag): end]
+        pos = end + 9
+        try:
+            data = json.loads(chunk)
+        except Exception:
+            continue
+        for c in data if isinstance(data, list) else [data]:
+            t = c.get("@type")
+            if t == "Product" or (isinstance(t, list) and "Product" in t):
+                return c
+    soup = BeautifulSoup(html, "lxml")
+    for script in soup.find_all("script", {"type": "application/ld+json"}):
+        try:
+            data = json.loads(script.string or "{}")
+        except Exception:
+            continue
+        for c in data if isinstance(data, list) else [data]:
+            t = c.get("@type")
+            if t == "Product" or (isinstance(t, list) and "Product" in t):
+                return c
+    soup = BeautifulSoup(html, "lxml")
+    name = None
+    og_title = soup.find("meta", property="og:title")
+    if og_title and og_title.get("content"):
+        name = og_title["content"].strip()
+    if not name and soup.title:
+        name = soup.title.text.strip()
+    price = currency = None
+    mp = soup.find("meta", property="product:price:amount") or soup.find("meta", itemprop="price")
+    if mp and mp.get("content"):
+        price = mp["content"].strip()
+    mc = soup.find("meta", property="product:price:currency") or soup.find("meta", itemprop="priceCurrency")
+    if mc and mc.get("content"):
+        currency = mc["content"].strip()
+    inci: List[str] = []
+    heading = soup.find(string=re.compile(r"Ingredienser|Ingredients", re.IGNORECASE))
+    if heading and heading.parent:
+        parts = re.split(r"Ingredienser|Ingredients", heading.parent.get_text(" ", strip=True), flags=re.IGNORECASE)
+        if len(parts) > 1:
+            inci = [s.strip() for s in re.split(r",|;|\n", parts[1]) if s.strip()]
+    if not any([name, price, inci]):
+        return None
+    return {
+        "name": name,
+        "offers": {"price": price, "priceCurrency": currency} if price else {},
+        "ingredients": ", ".join(inci) if inci else None,
+    }
+
+
+def pages_per_second(extract: Callable[[str], Optional[dict]], html: str, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        extract(html)
+    return rounds / max(time.process_time() - started, 1e-9)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="HTML pages to benchmark instead of the synthetic corpus")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args(argv)
+    if args.files:
+        corpus = {}
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                corpus[path] = f.read()
+    else:
+        corpus = synthetic_corpus()
+
+    print(f"{'page':<24}{'KiB':>7}{'before/s':>12}{'after/s':>12}{'speedup':>9}  found (before/after)")
+    for label, html in corpus.items():
+        before = pages_per_second(_legacy_extract, html, args.rounds)
+        after = pages_per_second(extract_product, html, args.rounds)
+        found = f"{_legacy_extract(html) is not None}/{extract_product(html) is not None}"
+        print(f"{label:<24}{len(html) / 1024:>7.0f}{before:>12.0f}{after:>12.0f}{after / before:>8.1f}x  {found}")
+
+
+if __name__ == "__main__":
+    main()
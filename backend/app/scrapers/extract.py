@@ -0,0 +1,231 @@
+"""Single-pass product extraction from HTML.
+
+JSON-LD is first looked for with a string scan, which needs no tree at all and tolerates
+attribute order, quoting and extra `type` parameters. Pages without a Product block are
+parsed once with lxml, and one compiled XPath union then selects every JSON-LD script,
+meta/itemprop value, the title and the ingredients label in document order. The
+selection runs in C, so Python only touches the handful of matching nodes instead of
+every element of the page.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import re
+import threading
+from lxml import etree, html as lxml_html
+
+
+_JSONLD_OPEN = re.compile(
+    r"""<script\b[^>]*?\btype\s*=\s*(["']?)\s*application/ld\+json[^"'>]*\1[^>]*>""", re.IGNORECASE
+)
+_SCRIPT_CLOSE = re.compile(r"</script\s*>", re.IGNORECASE)
+# Most pages write the opening tag exactly like this; it is recognised without the regex
+_CANONICAL_OPEN = '<script type="application/ld+json">'
+_CANONICAL_OFFSET = _CANONICAL_OPEN.index("ld+json")
+_JSONLD_WRAPPERS = re.compile(r"^\s*(?:<!--|//\s*<!\[CDATA\[|<!\[CDATA\[)|(?:-->|//\s*\]\]>|\]\]>)\s*$")
+INGREDIENTS_LABEL = re.compile(r"Ingredienser|Ingredients", re.IGNORECASE)
+_SEPARATORS = re.compile(r",|;|\n")
+
+_NODES = "//script[@type] | //meta[@content] | //title | //*[@itemprop][@content]"
+# Text nodes are only searched when the raw markup mentions the label at all
+_SELECT = etree.XPath(_NODES)
+_SELECT_WITH_LABEL = etree.XPath(
+    _NODES + " | //text()[contains(., 'ngredien') or contains(., 'NGREDIEN')][not(parent::script or parent::style)]"
+)
+_NON_TEXT = {"script", "style"}
+_LINKS = etree.XPath("//a[@href]")
+
+_local = threading.local()
+# json.loads builds a new decoder on every call that passes options
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _parser() -> etree.HTMLParser:
+    # lxml parsers must not be shared between threads
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = lxml_html.HTMLParser(encoding="utf-8", remove_comments=True)
+    return parser
+
+
+def split_ingredients(raw: str) -> List[str]:
+    return [s.strip() for s in _SEPARATORS.split(raw) if s.strip()]
+
+
+def load_jsonld(text: Optional[str]) -> Optional[Any]:
+    if not text:
+        return None
+    text = text.strip()
+    if text[:1] in ("<", "/"):
+        # Legacy pages wrap the block in <!-- --> or CDATA markers
+        text = _JSONLD_WRAPPERS.sub("", text)
+    try:
+        return _DECODER.decode(text)
+    except ValueError:
+        return None
+
+
+def _is_product(node: Any) -> bool:
+    if not isinstance(node, dict):
+        return False
+    types = node.get("@type")
+    if types == "Product":
+        return True
+    for t in types if isinstance(types, list) else [types]:
+        # "Product", "schema:Product" and "https://schema.org/Product" all count
+        if isinstance(t, str) and re.split(r"[/:#]", t)[-1] == "Product":
+            return True
+    return False
+
+
+def _jsonld_nodes(data: Any) -> Iterator[Any]:
+    for node in data if isinstance(data, list) else [data]:
+        yield node
+        if isinstance(node, dict) and isinstance(node.get("@graph"), list):
+            yield from node["@graph"]
+
+
+def find_product(blocks: Iterable[Any]) -> Optional[dict]:
+    """First schema.org Product in decoded JSON-LD blocks, including @graph members."""
+    for data in blocks:
+        # Most pages have a single top-level Product block
+        if _is_product(data):
+            return data
+        for node in _jsonld_nodes(data):
+            if _is_product(node):
+                return node
+    return None
+
+
+def scan_jsonld(html: str) -> Iterator[Any]:
+    """Decoded JSON-LD blocks found by scanning the raw markup, without parsing it."""
+    pos = 0
+    while True:
+        idx = html.find("ld+json", pos)
+        if idx == -1:
+            return
+        pos = idx + 7
+        start = idx - _CANONICAL_OFFSET
+        if start >= 0 and html.startswith(_CANONICAL_OPEN, start):
+            body = start + len(_CANONICAL_OPEN)
+        else:
+            opening = _JSONLD_OPEN.match(html, html.rfind("<", 0, idx))
+            if not opening:
+                continue
+            body = opening.end()
+        closing = _SCRIPT_CLOSE.search(html, body)
+        if not closing:
+            return
+        pos = closing.end()
+        data = load_jsonld(html[body:closing.start()])
+        if data is not None:
+            yield data
+
+
+@dataclass
+class PageData:
+    jsonld: List[Any] = field(default_factory=list)
+    # <meta> property/name/itemprop values and itemprop content attributes; first one wins
+    meta: Dict[str, str] = field(default_factory=dict)
+    title: Optional[str] = None
+    ingredients: List[str] = field(default_factory=list)
+
+    def product(self) -> Optional[dict]:
+        return find_product(self.jsonld)
+
+    def fallback_product(self) -> Optional[dict]:
+        """Product dict shaped like JSON-LD, assembled from meta tags and page text."""
+        name = self.meta.get("og:title") or self.title
+        price = self.meta.get("product:price:amount") or self.meta.get("price")
+        currency = self.meta.get("product:price:currency") or self.meta.get("priceCurrency")
+        if not any([name, price, self.ingredients]):
+            return None
+        return {
+            "name": name,
+            "offers": {"price": price, "priceCurrency": currency} if price else {},
+            "ingredients": ", ".join(self.ingredients) if self.ingredients else None,
+        }
+
+
+def _block_text(element) -> str:
+    parts = []
+    for el in element.iter():
+        if el.tag not in _NON_TEXT and el.text:
+            parts.append(el.text)
+        if el is not element and el.tail:
+            parts.append(el.tail)
+    return " ".join(t.strip() for t in parts if t.strip())
+
+
+def _ingredients_block(element):
+    """The element holding the label plus the list. A label alone in its own element
+    (a heading, a <dt>) takes the list from the following sibling."""
+    text = _block_text(element)
+    parts = INGREDIENTS_LABEL.split(text)
+    if len(parts) > 1 and not parts[1].strip(" :") and element.getnext() is not None:
+        return text + " " + _block_text(element.getnext())
+    return text
+
+
+def extract_page(html: str | bytes) -> PageData:
+    """Parse `html` once and collect everything product extraction needs."""
+    page = PageData()
+    data = html.encode("utf-8", "surrogatepass") if isinstance(html, str) else html
+    try:
+        root = lxml_html.document_fromstring(data, parser=_parser())
+    except (etree.ParserError, ValueError):
+        return page
+    select = _SELECT_WITH_LABEL if b"ngredien" in data or b"NGREDIEN" in data else _SELECT
+    ingredients_block = None
+    for node in select(root):
+        if isinstance(node, str):
+            if ingredients_block is None and INGREDIENTS_LABEL.search(node):
+                owner = node.getparent()
+                ingredients_block = owner.getparent() if node.is_tail else owner
+            continue
+        tag = node.tag
+        if tag == "script":
+            if "ld+json" in node.get("type", "").lower():
+                block = load_jsonld(node.text)
+                if block is not None:
+                    page.jsonld.append(block)
+        elif tag == "title":
+            if page.title is None:
+                page.title = node.text_content().strip() or None
+        elif tag == "meta":
+            content = node.get("content").strip()
+            for attr in ("property", "name", "itemprop"):
+                key = node.get(attr)
+                if key:
+                    page.meta.setdefault(key, content)
+        else:
+            page.meta.setdefault(node.get("itemprop"), node.get("content").strip())
+    if ingredients_block is not None:
+        parts = INGREDIENTS_LABEL.split(_ingredients_block(ingredients_block))
+        if len(parts) > 1:
+            page.ingredients = split_ingredients(parts[1].lstrip(" :"))
+    return page
+
+
+def iter_links(html: str | bytes) -> Iterator[Tuple[str, str]]:
+    """(href, text) of every non-empty <a href> in document order, from one lxml parse."""
+    data = html.encode("utf-8", "surrogatepass") if isinstance(html, str) else html
+    try:
+        root = lxml_html.document_fromstring(data, parser=_parser())
+    except (etree.ParserError, ValueError):
+        return
+    for a in _LINKS(root):
+        href = a.get("href").strip()
+        if href:
+            yield href, "".join(a.itertext()).strip()
+
+
+def extract_product(html: str) -> Optional[dict]:
+    """JSON-LD Product of the page, or a fallback dict built from meta tags and the
+    ingredients section. Only pages without a regex-visible Product get an lxml parse."""
+    product = find_product(scan_jsonld(html))
+    if product is not None:
+        return product
+    page = extract_page(html)
+    return page.product() or page.fallback_product()
@@ -0,0 +1,267 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import time
+import httpx
+
+from ..config import get_settings
+from .http_cache import FetchResult, get_http_cache
+from .robots import RobotsRules, origin, robots_cache, rules_for_response
+
+
+try:  # HTTP/2 needs the optional h2 package
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Responses asking us to slow down: the host's rate is cut and Retry-After honoured
+THROTTLE_STATUSES = {429, 503}
+# Responses worth another attempt
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+
+
+class RobotsDisallowed(Exception):
+    """robots.txt disallows the URL for our user agent; it was not fetched."""
+
+
+def retry_after_seconds(resp: httpx.Response) -> Optional[float]:
+    """The response's Retry-After (delay seconds or an HTTP date) as seconds from now."""
+    value = (resp.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Wait after failed `attempt` (1-based) when the server gave no Retry-After."""
+    return min(2.0 ** (attempt - 1), 8.0)
+
+
+class TokenBucket:
+    """Per-host token bucket: `rate_per_minute` tokens refill continuously up to `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1) -> None:
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostThrottle:
+    """Adaptive request rate of one host: additive increase, multiplicative decrease.
+
+    Requests are spaced by a TokenBucket. Every response within `scraper_fast_response_seconds`
+    adds `scraper_rate_increase_per_minute` to its rate; a 429/503 or a timeout multiplies
+    it by `scraper_rate_decrease_factor` and pauses the host for the Retry-After (or one
+    request interval). Throttle signals arriving while the host is paused only extend
+    the pause, so a burst of 429s from requests already in flight cuts the rate once.
+    A robots.txt Crawl-delay caps the rate and disables bursts.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1) -> None:
+        settings = get_settings()
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.min_rate = min(settings.scraper_rate_limit_min_per_host_per_minute / 60.0, self.bucket.rate)
+        self.max_rate = max(settings.scraper_rate_limit_max_per_host_per_minute / 60.0, self.bucket.rate)
+        self.fast_seconds = settings.scraper_fast_response_seconds
+        self.increase = settings.scraper_rate_increase_per_minute / 60.0
+        self.decrease = settings.scraper_rate_decrease_factor
+        self.max_pause = settings.scraper_max_retry_after_seconds
+        self.paused_until = 0.0
+
+    @property
+    def rate_per_minute(self) -> float:
+        return self.bucket.rate * 60.0
+
+    def set_crawl_delay(self, seconds: Optional[float]) -> None:
+        if not seconds or seconds <= 0:
+            return
+        self.max_rate = min(self.max_rate, 1.0 / seconds)
+        self.min_rate = min(self.min_rate, self.max_rate)
+        self.bucket.rate = min(self.bucket.rate, self.max_rate)
+        self.bucket.capacity = 1.0
+        self.bucket.tokens = min(self.bucket.tokens, 1.0)
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+            # A pause that started while waiting for the token holds this request back too
+            if self.paused_until <= time.monotonic():
+                return
+
+    def observe(self, status: Optional[int], elapsed: float, retry_after: Optional[float] = None) -> None:
+        """Adapt to one response; `status` is None for a timeout."""
+        now = time.monotonic()
+        if status is None or status in THROTTLE_STATUSES:
+            if now >= self.paused_until:
+                self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+                self.bucket.tokens = 0.0
+                self.bucket.updated = now
+            pause = retry_after if retry_after is not None else 1.0 / self.bucket.rate
+            self.paused_until = max(self.paused_until, now + min(pause, self.max_pause))
+        elif status < 400 and elapsed <= self.fast_seconds:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+
+
+class AsyncFetcher:
+    """Shared async HTTP client for crawls.
+
+    Keeps one keep-alive connection pool (HTTP/2 when available) for all hosts, caps the
+    number of in-flight requests at `scraper_concurrency` and throttles every host through
+    its own HostThrottle, starting at `scraper_rate_limit_per_host_per_minute`. URLs that
+    the host's robots.txt disallows are refused before any request is made.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        rate_per_minute: Optional[int] = None,
+    ) -> None:
+        self.settings = get_settings()
+        self.concurrency = concurrency or self.settings.scraper_concurrency
+        self.rate_per_minute = rate_per_minute or self.settings.scraper_rate_limit_per_host_per_minute
+        self.cache = get_http_cache(self.settings.scraper_cache_dir)
+        self._throttles: Dict[str, HostThrottle] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": self.settings.scraper_user_agent},
+            timeout=20,
+            follow_redirects=True,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.concurrency * 2,
+                max_keepalive_connections=self.concurrency,
+                keepalive_expiry=30,
+            ),
+        )
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _throttle(self, url: str) -> HostThrottle:
+        host = urlparse(url).netloc.lower()
+        throttle = self._throttles.get(host)
+        if throttle is None:
+            throttle = HostThrottle(self.rate_per_minute, burst=min(self.concurrency, 4))
+            self._throttles[host] = throttle
+        return throttle
+
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """One GET through the host's throttle, which then adapts to the outcome."""
+        throttle = self._throttle(url)
+        # Wait for the host's turn before taking a slot so throttled hosts don't starve others
+        await throttle.acquire()
+        async with self._slots:
+            started = time.monotonic()
+            try:
+                resp = await self.client.get(url, headers=headers)
+            except httpx.TimeoutException:
+                throttle.observe(None, time.monotonic() - started)
+                raise
+        throttle.observe(resp.status_code, time.monotonic() - started, retry_after_seconds(resp))
+        return resp
+
+    async def robots(self, url: str) -> RobotsRules:
+        """robots.txt rules for `url`'s origin, fetched at most once per TTL per process.
+        Also applies the origin's Crawl-delay to its throttle. Never raises. The cache is
+        shared with scraper threads and the rules are parsed in a worker thread, off the loop."""
+        key = origin(url)
+        rules = await asyncio.to_thread(robots_cache.get, key)
+        if rules is None:
+            async with self._robots_locks.setdefault(key, asyncio.Lock()):
+                rules = await asyncio.to_thread(robots_cache.get, key)
+                if rules is None:
+                    rules, ttl = await self._fetch_robots(key)
+                    await asyncio.to_thread(robots_cache.put, key, rules, ttl)
+        self._throttle(url).set_crawl_delay(rules.crawl_delay)
+        return rules
+
+    async def _fetch_robots(self, key: str) -> Tuple[RobotsRules, float]:
+        try:
+            resp = await self._get(f"{key}/robots.txt")
+        except httpx.HTTPError:
+            status, content = None, b""
+        else:
+            status, content = resp.status_code, resp.content
+        return await asyncio.to_thread(
+            rules_for_response,
+            status,
+            content,
+            self.settings.scraper_user_agent,
+            self.settings.scraper_robots_ttl_seconds,
+        )
+
+    async def allowed(self, url: str) -> bool:
+        if not self.settings.scraper_respect_robots:
+            return True
+        return (await self.robots(url)).allowed(url)
+
+    async def fetch(self, url: str) -> FetchResult:
+        """GET `url`. Throttle responses (429/503) are retried once the host's pause is over,
+        other 5xx responses and network errors after an exponential backoff; other 4xx
+        responses are not retried. Raises RobotsDisallowed without a request when
+        robots.txt forbids the URL, and gives up at once on a Retry-After longer than
+        `scraper_max_retry_after_seconds`."""
+        if not await self.allowed(url):
+            raise RobotsDisallowed(url)
+        # The cache reads and writes files, so it runs in a worker thread, not on the loop
+        headers = await asyncio.to_thread(self.cache.conditional_headers, url) if self.cache else {}
+        attempts = max(self.settings.scraper_fetch_attempts, 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                resp = await self._get(url, headers)
+            except httpx.TransportError:
+                if attempt == attempts:
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt))
+                continue
+            if resp.status_code not in RETRY_STATUSES or attempt == attempts:
+                break
+            if resp.status_code in THROTTLE_STATUSES:
+                retry_after = retry_after_seconds(resp)
+                if retry_after is not None and retry_after > self.settings.scraper_max_retry_after_seconds:
+                    break
+                # The host's throttle holds the retry back until the pause is over
+            else:
+                await asyncio.sleep(backoff_seconds(attempt))
+        if self.cache:
+            return await asyncio.to_thread(self.cache.resolve, url, resp)
+        resp.raise_for_status()
+        return FetchResult(url, resp.content, resp.encoding, resp.status_code)
+
+    async def fetch_html(self, url: str) -> str:
+        return (await self.fetch(url)).text
@@ -1,227 +1,274 @@
 from __future__ import annotations
-from typing import List, Optional
+from datetime import datetime
+from contextlib import aclosing
+from typing import TYPE_CHECKING, AsyncIterator, Callable, List, Optional
 from urllib.parse import urlparse
+import asyncio
 import re
-import json
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
 
 from .base import BaseScraper, ScrapedProduct
+from .extract import extract_product, split_ingredients
+from .fetcher import AsyncFetcher, RobotsDisallowed
+from .http_cache import FetchResult
+from .parse_pool import ParsePipeline
+from .sitemap import iter_sitemap_entries
 
+if TYPE_CHECKING:
+    from ..frontier import Frontier
+
+
+# Buffered frontier records that trigger a write-back during the crawl
+FRONTIER_FLUSH_SIZE = 100
 
 PRODUCT_KEYWORDS = re.compile(r"product|/p/|/prod/|/artiklar/|/produkt/|/sku/|/item/|/shop/", re.IGNORECASE)
 
 
+def _extract_inci(pdata: dict) -> Optional[list[str]]:
+    props = pdata.get("additionalProperty")
+    items: list[str] = []
+    if isinstance(props, list):
+        for p in props:
+            if isinstance(p, dict) and str(p.get("name", "")).lower() in {"inci", "ingredients"}:
+                val = p.get("value")
+                if isinstance(val, str):
+                    items.extend(split_ingredients(val))
+    val = pdata.get("ingredients")
+    if isinstance(val, str):
+        items.extend(split_ingredients(val))
+    has_ing = pdata.get("hasIngredient")
+    if isinstance(has_ing, list):
+        for v in has_ing:
+            if isinstance(v, dict) and "name" in v:
+                items.append(str(v["name"]).strip())
+            elif isinstance(v, str):
+                items.append(v.strip())
+    return list(dict.fromkeys(items)) if items else None
+
+
+# schema.org properties carrying a GTIN/EAN, most specific first
+GTIN_KEYS = ("gtin13", "gtin", "gtin14", "gtin12", "gtin8", "ean")
+
+
+def _identifier(pdata: dict, offers: object, keys: tuple) -> Optional[str]:
+    for source in (pdata, offers):
+        if isinstance(source, dict):
+            for key in keys:
+                value = source.get(key)
+                if isinstance(value, (str, int)) and str(value).strip():
+                    return str(value).strip()
+    return None
+
+
+def parse_product_html(domain: str, url: str, html: str) -> Optional[ScrapedProduct]:
+    pdata = extract_product(html)
+    if not pdata:
+        return None
+    brand_name = None
+    brand = pdata.get("brand")
+    if isinstance(brand, dict):
+        brand_name = brand.get("name")
+    elif isinstance(brand, str):
+        brand_name = brand
+    name = pdata.get("name") or pdata.get("sku") or url
+    offers = pdata.get("offers")
+    price = None
+    currency = None
+    if isinstance(offers, dict):
+        price = offers.get("price") or offers.get("lowPrice")
+        currency = offers.get("priceCurrency")
+    return ScrapedProduct(
+        brand_name or domain,
+        name,
+        url,
+        float(price) if price else None,
+        currency or "SEK",
+        _extract_inci(pdata),
+        gtin=_identifier(pdata, offers, GTIN_KEYS),
+        sku=_identifier(pdata, offers, ("sku",)),
+    )
+
+
+def parse_product_page(domain: str, url: str, content: bytes, encoding: Optional[str]) -> Optional[ScrapedProduct]:
+    """Parser-process entry point: decode a fetched body and parse it."""
+    return parse_product_html(domain, url, FetchResult(url, content, encoding).text)
+
+
 class GenericJSONLDScraper(BaseScraper):
-    def __init__(self, domain: str, max_pages: int = 50) -> None:
+    def __init__(self, domain: str, max_pages: int = 50, modified_since: Optional[datetime] = None) -> None:
         super().__init__()
         self.domain = domain
         self.max_pages = max_pages
+        # Only visit sitemap URLs whose <lastmod> is at or after this (naive UTC) time
+        self.modified_since = modified_since
+        # Set when the sitemap walk ran to the end instead of stopping at max_pages
+        self.exhausted = False
+        self.skip_unchanged = self.settings.scraper_skip_unchanged
+        self.fetched = 0
+        self.failed = 0
+        self.unchanged = 0
+        self.disallowed = 0
+        # Called after every page attempt, e.g. to publish live crawl progress
+        self.on_page: Optional[Callable[["GenericJSONLDScraper"], None]] = None
 
-    def _robots_sitemaps(self) -> List[str]:
-        candidates = [f"https://{self.domain}/robots.txt", f"https://www.{self.domain}/robots.txt"]
+    async def _robots_sitemaps(self, fetcher: AsyncFetcher) -> List[str]:
+        """Sitemap URLs listed in the robots.txt of both host variants (cached, see robots.py)."""
         urls: List[str] = []
-        for r in candidates:
-            try:
-                txt = self.fetch_html(r)
-                for line in txt.splitlines():
-                    if line.lower().startswith("sitemap:"):
-                        u = line.split(":", 1)[1].strip()
-                        if u and u not in urls:
-                            urls.append(u)
-            except Exception:
-                continue
+        for origin in (f"https://{self.domain}", f"https://www.{self.domain}"):
+            for url in (await fetcher.robots(origin)).sitemaps:
+                if url not in urls:
+                    urls.append(url)
         return urls
 
-    def _sitemap_urls(self) -> List[str]:
+    async def iter_sitemap_urls(self, fetcher: AsyncFetcher) -> AsyncIterator[str]:
+        """Lazily yield product URLs from the domain's sitemaps.
+
+        Child sitemaps are only downloaded once the consumer has used up the URLs before
+        them, so stopping after max_pages leaves the rest of the sitemap tree untouched.
+        """
         roots = [
             f"https://{self.domain}/sitemap.xml",
             f"https://www.{self.domain}/sitemap.xml",
             f"http://{self.domain}/sitemap.xml",
-        ] + self._robots_sitemaps()
+        ] + await self._robots_sitemaps(fetcher)
+        visited: set[str] = set()
         seen: set[str] = set()
-        found: List[str] = []
         for root in roots:
-            try:
-                xml = self.fetch_html(root)
-                for url in self._parse_sitemap(xml):
-                    if url not in seen:
-                        seen.add(url)
-                        found.append(url)
-            except Exception:
-                continue
-        return found
-
-    def _parse_sitemap(self, xml_text: str) -> List[str]:
-        urls: List[str] = []
+            async for url in self._walk_sitemap(fetcher, root, visited):
+                if url not in seen:
+                    seen.add(url)
+                    yield url
+
+    async def _walk_sitemap(self, fetcher: AsyncFetcher, sitemap_url: str, visited: set[str]) -> AsyncIterator[str]:
+        if not sitemap_url or sitemap_url in visited:
+            return
+        visited.add(sitemap_url)
         try:
-            tree = ET.fromstring(xml_text.encode("utf-8"))
+            content = (await fetcher.fetch(sitemap_url)).content
         except Exception:
-            return urls
-        ns = {
-            "sm": "http://www.sitemaps.org/schemas/sitemap/0.9",
-            "image": "http://www.google.com/schemas/sitemap-image/1.1",
-        }
-        for loc in tree.findall(".//sm:sitemap/sm:loc", ns):
-            try:
-                xml = self.fetch_html(loc.text or "")
-                urls.extend(self._parse_sitemap(xml))
-            except Exception:
-                continue
-        for loc in tree.findall(".//sm:url/sm:loc", ns):
-            if not loc.text:
-                continue
-            url = loc.text.strip()
-            if self.domain in urlparse(url).netloc and PRODUCT_KEYWORDS.search(url):
-                urls.append(url)
-        return urls
+            return
+        for entry in iter_sitemap_entries(content):
+            modified_before = (
+                self.modified_since is not None
+                and entry.lastmod is not None
+                and entry.lastmod < self.modified_since
+            )
+            if entry.is_index:
+                # A child sitemap not modified since the cutoff has no newer URLs in it
+                if not modified_before:
+                    async for url in self._walk_sitemap(fetcher, entry.loc, visited):
+                        yield url
+            elif not modified_before and self.domain in urlparse(entry.loc).netloc and PRODUCT_KEYWORDS.search(entry.loc):
+                yield entry.loc
+
+    def run(self) -> List[ScrapedProduct]:
+        return asyncio.run(self.crawl())
+
+    async def _frontier_urls(self, fetcher: AsyncFetcher, frontier: "Frontier") -> AsyncIterator[str]:
+        """URLs the frontier has due first, then sitemap URLs it has not seen before."""
+        for url in await asyncio.to_thread(frontier.due, self.max_pages):
+            yield url
+        async with aclosing(self.iter_sitemap_urls(fetcher)) as urls:
+            async for url in urls:
+                if frontier.add(url):
+                    yield url
 
-    def _extract_inci(self, pdata: dict) -> Optional[list[str]]:
-        props = pdata.get("additionalProperty")
-        items: list[str] = []
-        if isinstance(props, list):
-            for p in props:
-                if isinstance(p, dict) and str(p.get("name", "")).lower() in {"inci", "ingredients"}:
-                    val = p.get("value")
-                    if isinstance(val, str):
-                        items.extend([s.strip() for s in re.split(r",|;|\n", val) if s.strip()])
-        val = pdata.get("ingredients")
-        if isinstance(val, str):
-            items.extend([s.strip() for s in re.split(r",|;|\n", val) if s.strip()])
-        has_ing = pdata.get("hasIngredient")
-        if isinstance(has_ing, list):
-            for v in has_ing:
-                if isinstance(v, dict) and "name" in v:
-                    items.append(str(v["name"]).strip())
-                elif isinstance(v, str):
-                    items.append(v.strip())
-        return list(dict.fromkeys(items)) if items else None
-
-    def _extract_jsonld_product(self, html: str) -> Optional[dict]:
-        # 1) Fast scan
+    async def crawl(
+        self,
+        fetcher: Optional[AsyncFetcher] = None,
+        sink: Optional[List[ScrapedProduct]] = None,
+        parser: Optional[ParsePipeline] = None,
+        frontier: Optional["Frontier"] = None,
+    ) -> List[ScrapedProduct]:
+        """Fetch up to max_pages sitemap URLs concurrently through a shared AsyncFetcher.
+
+        Fetched bodies are parsed by `parser` (a ParsePipeline over the shared parser
+        processes unless one is passed in), so parsing runs on other cores while fetching
+        continues. Items are appended to `sink` as they are parsed, so a caller that
+        cancels the crawl (e.g. on timeout) keeps everything scraped so far.
+
+        With a `frontier`, due URLs are crawled before new sitemap URLs and every outcome is
+        recorded there; the caller flushes it once more after the crawl.
+        """
+        results: List[ScrapedProduct] = sink if sink is not None else []
+        owns_fetcher = fetcher is None
+        fetcher = fetcher or AsyncFetcher()
+        parser = parser or ParsePipeline()
+        tasks: List[asyncio.Task] = []
+        urls = self._frontier_urls(fetcher, frontier) if frontier else self.iter_sitemap_urls(fetcher)
         try:
-            start_tag = '<script type="application/ld+json">'
-            pos = 0
-            while True:
-                idx = html.find(start_tag, pos)
-                if idx == -1:
-                    break
-                end = html.find("</script>", idx)
-                if end == -1:
+            async for url in urls:
+                if len(tasks) >= self.max_pages:
                     break
-                chunk = html[idx + len(start_tag): end]
-                pos = end + 9
-                try:
-                    data = json.loads(chunk)
-                except Exception:
-                    continue
-                candidates = data if isinstance(data, list) else [data]
-                for c in candidates:
-                    t = c.get("@type")
-                    if t == "Product" or (isinstance(t, list) and "Product" in t):
-                        return c
-        except Exception:
-            pass
-        # 2) Robust parse via BeautifulSoup
-        try:
-            soup = BeautifulSoup(html, "lxml")
-            for script in soup.find_all("script", {"type": "application/ld+json"}):
-                try:
-                    data = json.loads(script.string or "{}")
-                except Exception:
+                # Checked up front so disallowed URLs don't use up the page budget
+                if not await fetcher.allowed(url):
+                    self._disallowed(url, frontier)
                     continue
-                candidates = data if isinstance(data, list) else [data]
-                for c in candidates:
-                    t = c.get("@type")
-                    if t == "Product" or (isinstance(t, list) and "Product" in t):
-                        return c
-        except Exception:
-            return None
-        return None
+                tasks.append(asyncio.create_task(self._crawl_url(fetcher, parser, url, results, frontier)))
+            else:
+                self.exhausted = True
+            await asyncio.gather(*tasks)
+        finally:
+            await urls.aclose()
+            for task in tasks:
+                task.cancel()
+            if owns_fetcher:
+                await fetcher.aclose()
+        return results
 
-    def _extract_html_fallback(self, html: str) -> Optional[dict]:
+    async def crawl_urls(
+        self, urls: List[str], fetcher: AsyncFetcher, parser: Optional[ParsePipeline] = None
+    ) -> List[ScrapedProduct]:
+        """Fetch and parse an explicit list of URLs concurrently."""
+        results: List[ScrapedProduct] = []
+        parser = parser or ParsePipeline()
+        await asyncio.gather(*(self._crawl_url(fetcher, parser, url, results) for url in urls))
+        return results
+
+    async def _crawl_url(
+        self,
+        fetcher: AsyncFetcher,
+        parser: ParsePipeline,
+        url: str,
+        results: List[ScrapedProduct],
+        frontier: Optional["Frontier"] = None,
+    ) -> None:
         try:
-            soup = BeautifulSoup(html, "lxml")
-            # Name
-            name = None
-            og_title = soup.find("meta", property="og:title")
-            if og_title and og_title.get("content"):
-                name = og_title["content"].strip()
-            if not name and soup.title:
-                name = soup.title.text.strip()
-
-            # Price & currency from common meta/itemprop
-            price = None
-            currency = None
-            mp = soup.find("meta", property="product:price:amount") or soup.find("meta", itemprop="price")
-            if mp and mp.get("content"):
-                price = mp["content"].strip()
-            mc = soup.find("meta", property="product:price:currency") or soup.find("meta", itemprop="priceCurrency")
-            if mc and mc.get("content"):
-                currency = mc["content"].strip()
-
-            # Ingredients by heading labels
-            inci: list[str] = []
-            heading = soup.find(string=re.compile(r"Ingredienser|Ingredients", re.IGNORECASE))
-            if heading:
-                # try parent block
-                block = heading.parent
-                if block:
-                    text = block.get_text(" ", strip=True)
-                    # extract after label
-                    parts = re.split(r"Ingredienser|Ingredients", text, flags=re.IGNORECASE)
-                    if len(parts) > 1:
-                        raw = parts[1]
-                        inci = [s.strip() for s in re.split(r",|;|\n", raw) if s.strip()]
-            if not any([name, price, inci]):
-                return None
-            return {
-                "name": name,
-                "offers": {"price": price, "priceCurrency": currency} if price else {},
-                "ingredients": ", ".join(inci) if inci else None,
-            }
+            # The slot is held from fetch until the page is parsed, bounding unparsed bodies in memory
+            async with parser.slot():
+                page = await fetcher.fetch(url)
+                self.fetched += 1
+                item = None
+                if page.unchanged and self.skip_unchanged:
+                    self.unchanged += 1
+                else:
+                    item = await parser.run(parse_product_page, self.domain, url, page.content, page.encoding)
+                    if item:
+                        results.append(item)
+            if frontier:
+                frontier.record(url, content=page.content, item=item)
+        except RobotsDisallowed:
+            self._disallowed(url, frontier)
         except Exception:
-            return None
+            self.failed += 1
+            if frontier:
+                frontier.record(url, failed=True)
+        if frontier and frontier.pending() >= FRONTIER_FLUSH_SIZE:
+            await asyncio.to_thread(frontier.flush)
+        if self.on_page:
+            self.on_page(self)
 
-    def run(self) -> List[ScrapedProduct]:
-        urls = self._sitemap_urls()
-        results: List[ScrapedProduct] = []
-        for url in urls[: self.max_pages]:
-            try:
-                result = self.scrape_url(url)
-                if result:
-                    results.append(result)
-            except Exception:
-                continue
-        return results
+    def _disallowed(self, url: str, frontier: Optional["Frontier"]) -> None:
+        self.disallowed += 1
+        if frontier:
+            frontier.record(url, disallowed=True)
 
     # NEW: scrape a single URL
-    def scrape_url(self, url: str) -> Optional[ScrapedProduct]:
-        html = self.fetch_html(url)
-        pdata = self._extract_jsonld_product(html)
-        if not pdata:
-            pdata = self._extract_html_fallback(html)
-            if not pdata:
-                return None
-        brand_name = None
-        brand = pdata.get("brand")
-        if isinstance(brand, dict):
-            brand_name = brand.get("name")
-        elif isinstance(brand, str):
-            brand_name = brand
-        name = pdata.get("name") or pdata.get("sku") or url
-        offers = pdata.get("offers")
-        price = None
-        currency = None
-        if isinstance(offers, dict):
-            price = offers.get("price") or offers.get("lowPrice")
-            currency = offers.get("priceCurrency")
-        inci = self._extract_inci(pdata) if pdata else None
-        return ScrapedProduct(
-            brand_name or self.domain,
-            name,
-            url,
-            float(price) if price else None,
-            currency or "SEK",
-            inci,
-        ) 
\ No newline at end of file
+    def scrape_url(self, url: str, skip_unchanged: bool = False) -> Optional[ScrapedProduct]:
+        """Scrape one URL; with skip_unchanged, return None without parsing if the page is unchanged."""
+        page = self.fetch(url)
+        if skip_unchanged and page.unchanged:
+            return None
+        return self.parse_product(url, page.text)
+
+    def parse_product(self, url: str, html: str) -> Optional[ScrapedProduct]:
+        return parse_product_html(self.domain, url, html)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+import httpx
+
+
+@dataclass
+class FetchResult:
+    url: str
+    content: bytes
+    encoding: Optional[str] = None
+    status_code: int = 200
+    # True when the server answered 304 or the body hash matches the cached copy
+    unchanged: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HTTPCache:
+    """On-disk cache of fetched pages keyed by URL.
+
+    Each entry keeps the validators (ETag / Last-Modified), a SHA-256 of the body and the
+    zlib-compressed body itself, so re-crawls can send conditional requests and tell an
+    unchanged page from a changed one without parsing it.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+
+    def _paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = self.directory / key[:2] / key
+        return base.with_suffix(".json"), base.with_suffix(".body")
+
+    def load_meta(self, url: str) -> Optional[dict]:
+        meta_path, _ = self._paths(url)
+        try:
+            return json.loads(meta_path.read_text("utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        meta = self.load_meta(url)
+        headers: Dict[str, str] = {}
+        # Only revalidate when the body is on disk to answer a 304 with
+        if not meta or not self._paths(url)[1].exists():
+            return headers
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def cached_result(self, url: str) -> Optional[FetchResult]:
+        meta = self.load_meta(url)
+        _, body_path = self._paths(url)
+        if not meta:
+            return None
+        try:
+            content = zlib.decompress(body_path.read_bytes())
+        except (OSError, zlib.error):
+            return None
+        return FetchResult(url, content, meta.get("encoding"), 304, unchanged=True)
+
+    def store(self, url: str, resp: httpx.Response) -> FetchResult:
+        """Record a 200 response and report whether its body differs from the cached one."""
+        content = resp.content
+        digest = hashlib.sha256(content).hexdigest()
+        previous = self.load_meta(url)
+        unchanged = bool(previous and previous.get("content_hash") == digest)
+        meta = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_hash": digest,
+            "encoding": resp.encoding,
+            "fetched_at": time.time(),
+        }
+        meta_path, body_path = self._paths(url)
+        try:
+            meta_path.parent.mkdir(parents=True, exist_ok=True)
+            if not unchanged:
+                _atomic_write(body_path, zlib.compress(content))
+            _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError:
+            pass
+        return FetchResult(url, content, resp.encoding, resp.status_code, unchanged=unchanged)
+
+    def resolve(self, url: str, resp: httpx.Response) -> FetchResult:
+        """Turn a (possibly conditional) response into a FetchResult, raising on HTTP errors."""
+        if resp.status_code == 304:
+            cached = self.cached_result(url)
+            if cached:
+                return cached
+        resp.raise_for_status()
+        return self.store(url, resp)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    # Unique per thread: AsyncFetcher stores from worker threads
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def get_http_cache(directory: Optional[str]) -> Optional[HTTPCache]:
+    return HTTPCache(directory) if directory else None
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import Iterable, List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
+import asyncio
 import re
-from bs4 import BeautifulSoup
 
 from .base import BaseScraper
+from .extract import iter_links
+from .fetcher import AsyncFetcher
+from .parse_pool import ParsePipeline
 
 
 CATEGORY_STOP_SLUGS = {
@@ -19,13 +22,66 @@ CATEGORY_STOP_SLUGS = {
 }
 
 
+def _absolute(base_url: str, href: str) -> str:
+    return urljoin(base_url + "/", href)
+
+
+def brand_candidates(html: str, base_url: str) -> List[Tuple[str, str]]:
+    """(slug, url) of single-segment brand links on /varumarken, in page order."""
+    seen: set[str] = set()
+    candidates: List[Tuple[str, str]] = []
+    for href, text in iter_links(html):
+        text = text.lower()
+        if href.startswith("#"):
+            continue
+        url = _absolute(base_url, href)
+        if not urlparse(url).netloc.endswith("kicks.se"):
+            continue
+        path = urlparse(url).path.rstrip("/")
+        if not path or path in {"/", "/varumarken"}:
+            continue
+        segments = [s for s in path.split("/") if s]
+        if len(segments) != 1:
+            continue
+        slug = segments[0]
+        if slug in CATEGORY_STOP_SLUGS or (text and text in CATEGORY_STOP_SLUGS):
+            continue
+        if not re.fullmatch(r"[a-z0-9-]{2,}", slug):
+            continue
+        if slug in seen:
+            continue
+        seen.add(slug)
+        candidates.append((slug, _absolute(base_url, path)))
+    return candidates
+
+
+def brand_product_urls(html: str, base_url: str, brand_slug: str) -> List[str]:
+    """Product URLs under /{brand_slug}/ linked from one brand listing page."""
+    urls: Dict[str, None] = {}
+    for href, _ in iter_links(html):
+        url = _absolute(base_url, href)
+        if not urlparse(url).netloc.endswith("kicks.se"):
+            continue
+        path = urlparse(url).path.rstrip("/")
+        segs = [s for s in path.split("/") if s]
+        if len(segs) >= 2 and segs[0] == brand_slug:
+            if any(x in path for x in ["/filter", "/filtrera", "/bilder", "/image"]):
+                continue
+            urls[_absolute(base_url, path)] = None
+    return list(urls)
+
+
 class KicksCatalogScraper(BaseScraper):
-    def __init__(self, base_url: str = "https://www.kicks.se") -> None:
+    def __init__(self, base_url: str = "https://www.kicks.se", workers: Optional[int] = None) -> None:
         super().__init__()
         self.base_url = base_url.rstrip("/")
+        # Brands verified and paginated at once
+        self.workers = workers or self.settings.scraper_concurrency
+        # (slug, url) candidates from the last /varumarken walk
+        self.candidates: List[Tuple[str, str]] = []
 
     def _absolute(self, href: str) -> str:
-        return urljoin(self.base_url + "/", href)
+        return _absolute(self.base_url, href)
 
     def _is_internal(self, href: str) -> bool:
         netloc = urlparse(self._absolute(href)).netloc
@@ -34,10 +90,8 @@ class KicksCatalogScraper(BaseScraper):
     def list_brand_roots(self) -> List[str]:
         """Return absolute URLs for brand root pages like /aco, /abercrombie-fitch, sorted A-Z."""
         html = self.fetch_html(self._absolute("/varumarken"))
-        soup = BeautifulSoup(html, "lxml")
         slugs: set[str] = set()
-        for a in soup.find_all("a", href=True):
-            href = a.get("href") or ""
+        for href, _ in iter_links(html):
             if not href or href.startswith("#"):
                 continue
             if not self._is_internal(href):
@@ -54,92 +108,121 @@ class KicksCatalogScraper(BaseScraper):
             slugs.add(slug)
         return [self._absolute(f"/{s}") for s in sorted(slugs)]
 
-    def _looks_like_brand(self, slug: str) -> bool:
-        """Fetch the candidate brand page and ensure it contains product links under /{slug}/..."""
+    async def _brand_listing(
+        self, fetcher: AsyncFetcher, parser: ParsePipeline, brand_slug: str, max_pages: int
+    ) -> List[str]:
+        """Product URLs from a brand's paginated listing, stopping at the first page that adds
+        none. An empty result from page 1 means the slug is not a brand."""
+        collected: Dict[str, None] = {}
+        for page in range(1, max_pages + 1):
+            url = self._absolute(f"/{brand_slug}?page={page}") if page > 1 else self._absolute(f"/{brand_slug}")
+            try:
+                html = await fetcher.fetch_html(url)
+            except Exception:
+                break
+            urls = await parser.run(brand_product_urls, html, self.base_url, brand_slug)
+            new = [u for u in urls if u not in collected]
+            if not new:
+                break
+            collected.update(dict.fromkeys(new))
+        return sorted(collected)
+
+    async def iter_brands(
+        self,
+        max_brands: int | None = None,
+        max_pages_per_brand: int = 1,
+        fetcher: Optional[AsyncFetcher] = None,
+    ) -> AsyncIterator[Tuple[int, str, List[str]]]:
+        """Yield (candidate_index, slug, product_urls) for each verified brand, in /varumarken order.
+
+        Candidates are handled by `workers` concurrent workers. Page 1 of a candidate's
+        listing doubles as its verification: the slug is a brand when that page links to
+        products under /{slug}/, and the page is not fetched again. Brands finishing out of
+        order are held back until every candidate before them is done, so the result is
+        the first `max_brands` brands of the list whatever the network timing.
+        """
+        owns_fetcher = fetcher is None
+        fetcher = fetcher or AsyncFetcher()
+        parser = ParsePipeline()
+        found: asyncio.Queue = asyncio.Queue()
+        workers: List[asyncio.Task] = []
         try:
-            html = self.fetch_html(self._absolute(f"/{slug}"))
-        except Exception:
-            return False
-        soup = BeautifulSoup(html, "lxml")
-        for a in soup.find_all("a", href=True):
-            path = urlparse(self._absolute(a.get("href") or "")).path.rstrip("/")
-            segs = [s for s in path.split("/") if s]
-            if len(segs) >= 2 and segs[0] == slug:
-                return True
-        return False
+            html = await fetcher.fetch_html(self._absolute("/varumarken"))
+            self.candidates = await parser.run(brand_candidates, html, self.base_url)
+            pending = iter(enumerate(self.candidates))
+            verified = 0
+
+            async def work() -> None:
+                nonlocal verified
+                # Workers share one iterator, so each candidate is taken exactly once
+                for index, (slug, _) in pending:
+                    # Enough brands among the candidates taken so far: the first `max_brands`
+                    # of the list are all among them, finished or in progress
+                    if max_brands and verified >= max_brands:
+                        return
+                    urls = await self._brand_listing(fetcher, parser, slug, max_pages_per_brand)
+                    if urls:
+                        verified += 1
+                    # Non-brands are reported too, so the consumer can move past their index
+                    await found.put((index, slug, urls))
+
+            async def run_workers() -> None:
+                try:
+                    await asyncio.gather(*(work() for _ in range(self.workers)))
+                finally:
+                    await found.put(None)
+
+            workers.append(asyncio.create_task(run_workers()))
+            finished: Dict[int, Tuple[str, List[str]]] = {}
+            next_index = 0
+            yielded = 0
+            while not (max_brands and yielded >= max_brands):
+                result = await found.get()
+                if result is None:
+                    # Re-raises a worker failure
+                    await workers[0]
+                    break
+                finished[result[0]] = result[1:]
+                while next_index in finished and not (max_brands and yielded >= max_brands):
+                    slug, urls = finished.pop(next_index)
+                    if urls:
+                        yield next_index, slug, urls
+                        yielded += 1
+                    next_index += 1
+        finally:
+            for task in workers:
+                task.cancel()
+            if owns_fetcher:
+                await fetcher.aclose()
+
+    def _collect_brands(self, max_brands: int | None, max_pages_per_brand: int) -> List[Tuple[str, List[str]]]:
+        async def collect() -> List[Tuple[int, str, List[str]]]:
+            return [b async for b in self.iter_brands(max_brands, max_pages_per_brand)]
+
+        return [(slug, urls) for _, slug, urls in asyncio.run(collect())]
 
     def list_brands(self, max_brands: int | None = None) -> List[Tuple[str, str]]:
         """Return list of (brand_slug, brand_url) discovered on /varumarken.
         Filters out known category slugs and keeps only single-segment paths, then verifies page contains products.
         """
-        html = self.fetch_html(self._absolute("/varumarken"))
-        soup = BeautifulSoup(html, "lxml")
-        seen: set[str] = set()
-        verified: List[Tuple[str, str]] = []
-        candidates: List[Tuple[str, str]] = []
-        for a in soup.find_all("a", href=True):
-            href = a.get("href") or ""
-            text = (a.get_text(strip=True) or "").lower()
-            if not href or href.startswith("#"):
-                continue
-            if not self._is_internal(href):
-                continue
-            path = urlparse(self._absolute(href)).path.rstrip("/")
-            if not path or path in {"/", "/varumarken"}:
-                continue
-            segments = [s for s in path.split("/") if s]
-            if len(segments) != 1:
-                continue
-            slug = segments[0]
-            if slug in CATEGORY_STOP_SLUGS or (text and text in CATEGORY_STOP_SLUGS):
-                continue
-            if not re.fullmatch(r"[a-z0-9-]{2,}", slug):
-                continue
-            if slug in seen:
-                continue
-            seen.add(slug)
-            candidates.append((slug, self._absolute(path)))
-            if self._looks_like_brand(slug):
-                verified.append((slug, self._absolute(path)))
-                if max_brands and len(verified) >= max_brands:
-                    return verified
+        verified = [(slug, self._absolute(f"/{slug}")) for slug, _ in self._collect_brands(max_brands, 1)]
         # Fallback: if verification yields nothing, return top candidates (up to max_brands)
         if not verified:
-            return candidates[: (max_brands or len(candidates))]
+            return self.candidates[: (max_brands or len(self.candidates))]
         return verified
 
     def list_brand_products(self, brand_slug: str, max_pages: int = 5) -> List[str]:
         """Return product URLs for a given brand by crawling brand listing pages."""
-        collected: set[str] = set()
-        page = 1
-        while page <= max_pages:
-            url = self._absolute(f"/{brand_slug}?page={page}") if page > 1 else self._absolute(f"/{brand_slug}")
-            try:
-                html = self.fetch_html(url)
-            except Exception:
-                break
-            soup = BeautifulSoup(html, "lxml")
-            for a in soup.find_all("a", href=True):
-                href = a.get("href") or ""
-                if not href or not self._is_internal(href):
-                    continue
-                path = urlparse(self._absolute(href)).path.rstrip("/")
-                segs = [s for s in path.split("/") if s]
-                if len(segs) >= 2 and segs[0] == brand_slug:
-                    if any(x in path for x in ["/filter", "/filtrera", "/bilder", "/image"]):
-                        continue
-                    collected.add(self._absolute(path))
-            page += 1
-        return sorted(collected)
+        async def crawl() -> List[str]:
+            async with AsyncFetcher() as fetcher:
+                return await self._brand_listing(fetcher, ParsePipeline(), brand_slug, max_pages)
+
+        return asyncio.run(crawl())
 
     def list_all_products(self, max_brands: int | None = None, max_pages_per_brand: int = 3) -> List[Tuple[str, str]]:
         """Return list of (brand_slug, product_url) across brands."""
-        pairs: List[Tuple[str, str]] = []
-        for slug, _ in self.list_brands(max_brands=max_brands):
-            try:
-                urls = self.list_brand_products(slug, max_pages=max_pages_per_brand)
-            except Exception:
-                continue
-            for u in urls:
-                pairs.append((slug, u))
-        return pairs 
\ No newline at end of file
+        return [
+            (slug, u)
+            for slug, urls in self._collect_brands(max_brands, max_pages_per_brand)
+            for u in urls
+        ]
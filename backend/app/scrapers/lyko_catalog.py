@@ -1,10 +1,10 @@
 from __future__ import annotations
-from typing import List, Set
+from typing import Iterator, List, Set
 from urllib.parse import urljoin, urlparse
 import re
-from bs4 import BeautifulSoup
 
 from .base import BaseScraper
+from .extract import iter_links
 
 
 STOP_SLUGS: Set[str] = {
@@ -48,19 +48,18 @@ class LykoCatalogScraper(BaseScraper):
             return None
         return slug
 
-    def list_brand_roots(self) -> List[str]:
-        """Return absolute brand root URLs sorted A-Z from /sv/varumarken page."""
+    def iter_brand_roots(self) -> Iterator[str]:
+        """Yield absolute brand root URLs as each brand index page is parsed, A-Z per page."""
         # Try both with and without locale prefix
         urls_to_try = ["/sv/varumarken", "/varumarken"]
-        slugs: set[str] = set()
+        seen: set[str] = set()
         for path in urls_to_try:
             try:
                 html = self.fetch_html(self._abs(path))
             except Exception:
                 continue
-            soup = BeautifulSoup(html, "lxml")
-            for a in soup.find_all("a", href=True):
-                href = a.get("href") or ""
+            slugs: set[str] = set()
+            for href, _ in iter_links(html):
                 if not href or href.startswith("#"):
                     continue
                 if not self._is_internal(href):
@@ -71,8 +70,14 @@ class LykoCatalogScraper(BaseScraper):
                 if not slug:
                     continue
                 slugs.add(slug.lower())
-        # Build canonical URLs as /sv/<slug>
-        return [urljoin(self.base_url + "/", f"/sv/{s}") for s in sorted(slugs)]
+            # Build canonical URLs as /sv/<slug>
+            for slug in sorted(slugs - seen):
+                yield urljoin(self.base_url + "/", f"/sv/{slug}")
+            seen |= slugs
+
+    def list_brand_roots(self) -> List[str]:
+        """Return absolute brand root URLs sorted A-Z from /sv/varumarken page."""
+        return sorted(self.iter_brand_roots())
 
     def list_brand_products(self, brand_root: str, limit: int = 100) -> List[str]:
         """Return product-like URLs found under a brand root page (best-effort)."""
@@ -80,11 +85,9 @@ class LykoCatalogScraper(BaseScraper):
             html = self.fetch_html(brand_root)
         except Exception:
             return []
-        soup = BeautifulSoup(html, "lxml")
         product_urls: list[str] = []
         seen: set[str] = set()
-        for a in soup.find_all("a", href=True):
-            href = a.get("href") or ""
+        for href, _ in iter_links(html):
             if not href or href.startswith("#"):
                 continue
             if not self._is_internal(href):
@@ -0,0 +1,89 @@
+"""Parsing stage that runs apart from the fetching event loop.
+
+Fetched pages are handed to a process-wide ProcessPoolExecutor, so HTML parsing uses
+every core while the event loop keeps downloading. Parse functions must be module-level
+(picklable) and take plain arguments: raw bytes and their encoding rather than response
+objects.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, TypeVar
+import asyncio
+import multiprocessing
+import os
+import threading
+
+from ..config import get_settings
+
+
+T = TypeVar("T")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def parse_workers() -> int:
+    """Configured number of parser processes; 0 means parse inline on the fetching thread."""
+    workers = get_settings().scraper_parse_workers
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(workers, 0)
+
+
+def get_parse_executor() -> Optional[Executor]:
+    """The shared parser process pool, created on first use (None when parsing inline)."""
+    global _executor
+    workers = parse_workers()
+    if workers == 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the API process has threads (job workers, uvicorn) that fork would copy mid-lock
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def shutdown_parse_pool() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _discard_broken(executor: Executor) -> None:
+    # A crashed worker breaks the whole pool; drop it so the next parse starts a fresh one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ParsePipeline:
+    """Bounded hand-off from fetchers to parser processes for one crawl.
+
+    `slot()` caps the pages between "fetch started" and "parse finished" at `queue_size`:
+    a fetcher takes a slot before downloading and gives it back once its page is parsed,
+    so when parsers fall behind, fetching pauses instead of piling raw bodies up in memory.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None, executor: Optional[Executor] = None) -> None:
+        self.queue_size = queue_size or get_settings().scraper_parse_queue_size
+        self.executor = executor if executor is not None else get_parse_executor()
+        self._slots = asyncio.Semaphore(self.queue_size)
+
+    def slot(self) -> asyncio.Semaphore:
+        return self._slots
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run `fn(*args)` in a parser process, or inline when the pool is disabled."""
+        if self.executor is None:
+            return fn(*args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except BrokenProcessPool:
+            _discard_broken(self.executor)
+            self.executor = get_parse_executor()
+            raise
@@ -0,0 +1,133 @@
+"""robots.txt parsing and a process-wide cache of the parsed rules (RFC 9309).
+
+The rules of the group naming our user agent's product token apply, else those of the
+`*` groups. The longest matching Allow/Disallow pattern wins and Allow wins a tie; `*`
+matches any run of characters and a trailing `$` anchors the end of the path.
+`Crawl-delay` (not part of the RFC, but widely used) is read from the same group.
+
+AsyncFetcher.robots and BaseScraper.robots fetch the rules of an origin into one shared
+cache, for `scraper_robots_ttl_seconds`. A missing robots.txt (4xx) allows everything;
+an unreachable one (5xx or a network error) disallows everything, as the RFC asks, but
+is only cached for ERROR_TTL_SECONDS so the host is retried soon.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Tuple
+from urllib.parse import urlsplit
+import re
+import threading
+import time
+
+
+ERROR_TTL_SECONDS = 600
+# RFC 9309: crawlers must parse at least the first 500 KiB
+MAX_ROBOTS_BYTES = 500 * 1024
+
+
+@dataclass
+class RobotsRules:
+    # (pattern length, allow, compiled pattern) of the group that applies to us
+    rules: List[Tuple[int, bool, Pattern[str]]] = field(default_factory=list)
+    crawl_delay: Optional[float] = None
+    sitemaps: List[str] = field(default_factory=list)
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        if path == "/robots.txt":
+            return True
+        best: Tuple[int, bool] = (-1, True)
+        for length, allow, pattern in self.rules:
+            if pattern.match(path) and (length, allow) > best:
+                best = (length, allow)
+        return best[1]
+
+
+ALLOW_ALL = RobotsRules()
+DISALLOW_ALL = RobotsRules(rules=[(1, False, re.compile("/"))])
+
+
+def _compile(pattern: str) -> Pattern[str]:
+    anchored = pattern.endswith("$")
+    body = ".*".join(re.escape(part) for part in pattern.rstrip("$").split("*"))
+    return re.compile(body + ("$" if anchored else ""))
+
+
+def agent_token(user_agent: str) -> str:
+    """Product token of a User-Agent header ("SkincareCompareBot/0.1 (...)" -> "skincarecomparebot")."""
+    return re.split(r"[/\s]", user_agent.strip(), maxsplit=1)[0].lower()
+
+
+def parse_robots(text: str, user_agent: str) -> RobotsRules:
+    token = agent_token(user_agent)
+    groups: Dict[str, RobotsRules] = {}
+    current: List[RobotsRules] = []
+    sitemaps: List[str] = []
+    in_agents = False
+    for raw in text.splitlines():
+        line = raw.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        key, value = (part.strip() for part in line.split(":", 1))
+        key = key.lower()
+        if key == "sitemap":
+            if value and value not in sitemaps:
+                sitemaps.append(value)
+        elif key == "user-agent":
+            # Consecutive user-agent lines share the rules that follow them
+            if not in_agents:
+                current = []
+                in_agents = True
+            current.append(groups.setdefault(value.lower(), RobotsRules()))
+        elif key in ("allow", "disallow"):
+            in_agents = False
+            if value:
+                for group in current:
+                    group.rules.append((len(value), key == "allow", _compile(value)))
+        elif key == "crawl-delay":
+            in_agents = False
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for group in current:
+                group.crawl_delay = delay
+    group = groups.get(token) or groups.get("*") or RobotsRules()
+    return RobotsRules(group.rules, group.crawl_delay, sitemaps)
+
+
+def rules_for_response(status: Optional[int], content: bytes, user_agent: str, ttl: float) -> Tuple[RobotsRules, float]:
+    """(rules, seconds to cache them) for a robots.txt response; `status` None when it
+    could not be fetched at all."""
+    if status is None or status >= 500 or status == 429:
+        return DISALLOW_ALL, min(ttl, ERROR_TTL_SECONDS)
+    if status >= 400:
+        return ALLOW_ALL, ttl
+    return parse_robots(content[:MAX_ROBOTS_BYTES].decode("utf-8", errors="replace"), user_agent), ttl
+
+
+def origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+class RobotsCache:
+    """Parsed rules per origin, each kept until it expires."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[float, RobotsRules]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[RobotsRules]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key: str, rules: RobotsRules, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, rules)
+
+
+robots_cache = RobotsCache()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Sequence
+import asyncio
+import time
+
+from ..config import get_settings
+from .base import ScrapedProduct
+from .fetcher import AsyncFetcher
+from .generic_jsonld import GenericJSONLDScraper
+
+if TYPE_CHECKING:
+    from ..frontier import Frontier
+
+
+@dataclass
+class DomainResult:
+    domain: str
+    items: List[ScrapedProduct] = field(default_factory=list)
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    fetched: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    # Not fetched because robots.txt disallows them
+    disallowed: int = 0
+    created: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    timed_out: bool = False
+    # True when the whole sitemap was walked, i.e. the crawl may serve as an incremental baseline
+    complete: bool = False
+    error: Optional[str] = None
+
+    def summary(self) -> dict:
+        return {
+            "domain": self.domain,
+            "scraped": len(self.items),
+            "fetched": self.fetched,
+            "unchanged": self.unchanged,
+            "created": self.created,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "disallowed": self.disallowed,
+            "elapsed": round(self.elapsed, 2),
+            "timed_out": self.timed_out,
+            "complete": self.complete,
+            "error": self.error,
+        }
+
+    def copy_counts(self, scraper: GenericJSONLDScraper) -> None:
+        self.fetched = scraper.fetched
+        self.unchanged = scraper.unchanged
+        self.failed = scraper.failed
+        self.disallowed = scraper.disallowed
+
+
+async def _crawl_domain(
+    domain: str,
+    max_pages: int,
+    fetcher: AsyncFetcher,
+    slots: asyncio.Semaphore,
+    timeout: Optional[float],
+    modified_since: Optional[datetime],
+    result: DomainResult,
+    on_result: Optional[Callable[[DomainResult], Awaitable[None]]],
+    frontier: Optional["Frontier"],
+) -> DomainResult:
+    async with slots:
+        result.started_at = datetime.utcnow()
+        scraper = GenericJSONLDScraper(domain=domain, max_pages=max_pages, modified_since=modified_since)
+        scraper.on_page = result.copy_counts
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(scraper.crawl(fetcher, sink=result.items, frontier=frontier), timeout)
+            result.complete = scraper.exhausted
+        except asyncio.TimeoutError:
+            # Keep whatever was scraped before the deadline
+            result.timed_out = True
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            result.elapsed = time.monotonic() - started
+            result.copy_counts(scraper)
+            scraper.close()
+    if on_result:
+        await on_result(result)
+    return result
+
+
+async def crawl_domains(
+    domains: Sequence[str],
+    max_pages_per_domain: int = 50,
+    *,
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    modified_since: Optional[Dict[str, datetime]] = None,
+    results: Optional[List[DomainResult]] = None,
+    on_result: Optional[Callable[[DomainResult], Awaitable[None]]] = None,
+    frontier_for: Optional[Callable[[str], "Frontier"]] = None,
+) -> List[DomainResult]:
+    """Crawl all domains concurrently, each with its own page budget and deadline.
+
+    At most `concurrency` domains run at once (default `scraper_domain_concurrency`) and
+    all of them share one AsyncFetcher, so per-host rate limits and the global in-flight
+    cap still apply. `modified_since` maps a domain to its sitemap <lastmod> cutoff for
+    incremental crawls. Results are returned in the order of `domains`.
+
+    Pass a `results` list to watch counters while the crawl runs; `on_result` is awaited
+    as each domain finishes, e.g. to ingest it without waiting for slower domains.
+    `frontier_for` returns the persistent frontier each domain's crawl resumes from.
+    """
+    settings = get_settings()
+    slots = asyncio.Semaphore(concurrency or settings.scraper_domain_concurrency)
+    timeout = timeout if timeout is not None else settings.scraper_domain_timeout_seconds
+    modified_since = modified_since or {}
+    pending = [DomainResult(domain=d) for d in domains]
+    if results is not None:
+        results.extend(pending)
+    async with AsyncFetcher() as fetcher:
+        return list(
+            await asyncio.gather(
+                *(
+                    _crawl_domain(
+                        r.domain, max_pages_per_domain, fetcher, slots, timeout,
+                        modified_since.get(r.domain), r, on_result,
+                        frontier_for(r.domain) if frontier_for else None,
+                    )
+                    for r in pending
+                )
+            )
+        )
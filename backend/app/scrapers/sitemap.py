@@ -0,0 +1,63 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Iterator, Optional
+import gzip
+import xml.etree.ElementTree as ET
+
+
+@dataclass
+class SitemapEntry:
+    loc: str
+    lastmod: Optional[datetime] = None
+    # True for <sitemap> entries of a sitemap index, False for <url> entries
+    is_index: bool = False
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """Parse a W3C datetime (2024-05-01, 2024-05-01T10:00:00+02:00, ...) as naive UTC."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def iter_sitemap_entries(content: bytes) -> Iterator[SitemapEntry]:
+    """Yield entries of a sitemap or sitemap index one at a time.
+
+    Uses `iterparse` and clears each element once read, so memory stays flat regardless of
+    the number of URLs. Gzip-compressed sitemaps (.xml.gz) are decompressed on the fly.
+    Parsing stops quietly at the first malformed element.
+    """
+    stream = gzip.GzipFile(fileobj=BytesIO(content)) if content[:2] == b"\x1f\x8b" else BytesIO(content)
+    try:
+        for _, elem in ET.iterparse(stream, events=("end",)):
+            name = _local(elem.tag)
+            if name not in {"url", "sitemap"}:
+                continue
+            loc = None
+            lastmod = None
+            for child in elem:
+                child_name = _local(child.tag)
+                if child_name == "loc" and child.text:
+                    loc = child.text.strip()
+                elif child_name == "lastmod":
+                    lastmod = parse_lastmod(child.text)
+            elem.clear()
+            if loc:
+                yield SitemapEntry(loc, lastmod, is_index=name == "sitemap")
+    except (ET.ParseError, OSError, EOFError):
+        return
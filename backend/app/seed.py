@@ -1,4 +1,5 @@
 from sqlmodel import Session, select
+from .crud import sync_product_terms, sync_provider_tags
 from .database import engine, create_db_and_tables
 from .models import Provider, Product
 
@@ -48,6 +49,9 @@ def seed() -> None:
         ]
         for p in products:
             session.add(p)
+        session.flush()
+        sync_provider_tags(session, [provider.id])
+        sync_product_terms(session, [p.id for p in products])
         session.commit()
 
 
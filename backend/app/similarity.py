@@ -0,0 +1,213 @@
+"""Ingredient similarity ("products like this one").
+
+Each product's INCI list is a sparse vector over the ingredient vocabulary (ids of the
+`ingredient` table): position weight times IDF, L2-normalized, so cosine similarity is a
+dot product. Ingredients listed first (higher concentration) weigh more, and ones nearly
+every product has, like aqua, weigh little. The matrix is also kept transposed
+(ingredient x product), so scoring one product only reads the columns of its own
+ingredients.
+
+The index lives in process memory. It is built from `productingredient` on first use and
+rebuilt after `similarity_rebuild_seconds`; in between, products whose terms changed in
+this process (crud.sync_product_terms marks them, effective when its transaction commits)
+are re-vectorized into a small delta matrix on the next query. Needs numpy and scipy.
+"""
+from __future__ import annotations
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from .config import get_settings
+from .models import ProductIngredient
+
+
+# Rebuild instead of growing the delta past this fraction of the indexed products
+MAX_DELTA_FRACTION = 0.05
+
+_index: Optional["SimilarityIndex"] = None
+# Guards building and querying the index
+_lock = threading.Lock()
+# Guards only _dirty, so writers never wait for a query or a rebuild
+_dirty_lock = threading.Lock()
+_dirty: set[int] = set()
+
+_PENDING_KEY = "similarity_dirty"
+
+
+def similarity_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def mark_dirty(product_ids: Iterable[int]) -> None:
+    """Record products whose ingredients changed, for the next query to pick up."""
+    if _index is None:
+        return
+    with _dirty_lock:
+        _dirty.update(product_ids)
+
+
+def mark_dirty_on_commit(session: Session, product_ids: Iterable[int]) -> None:
+    """mark_dirty once `session` commits: a query before that would still read the old rows."""
+    session.info.setdefault(_PENDING_KEY, set()).update(product_ids)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _mark_committed(session: OrmSession) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        mark_dirty(pending)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_rolled_back(session: OrmSession) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _take_dirty() -> set[int]:
+    global _dirty
+    with _dirty_lock:
+        dirty, _dirty = _dirty, set()
+    return dirty
+
+
+def load_ingredient_terms(session: Session, product_ids: Optional[List[int]] = None) -> Tuple[array, array, array]:
+    """(product_id, ingredient_id, position) columns of `productingredient`, by product."""
+    statement = select(ProductIngredient.product_id, ProductIngredient.ingredient_id, ProductIngredient.position)
+    if product_ids is not None:
+        statement = statement.where(ProductIngredient.product_id.in_(product_ids))
+    products, ingredients, positions = array("q"), array("q"), array("q")
+    for product_id, ingredient_id, position in session.exec(
+        statement.order_by(ProductIngredient.product_id).execution_options(yield_per=50_000)
+    ):
+        products.append(product_id)
+        ingredients.append(ingredient_id)
+        positions.append(position)
+    return products, ingredients, positions
+
+
+class SimilarityIndex:
+    def __init__(self, product_ids, matrix, idf) -> None:
+        import numpy as np
+
+        self.product_ids = product_ids
+        self.rows: Dict[int, int] = {int(pid): i for i, pid in enumerate(product_ids)}
+        self.matrix = matrix  # products x ingredients, CSR
+        self.by_ingredient = matrix.T.tocsr()  # ingredients x products
+        self.idf = idf
+        self.alive = np.ones(len(product_ids), dtype=bool)
+        self.delta_ids: List[int] = []
+        self.delta_rows: Dict[int, int] = {}
+        self.delta = None
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, session: Session) -> "SimilarityIndex":
+        import numpy as np
+
+        products, ingredients, positions = load_ingredient_terms(session)
+        product_col = np.frombuffer(products, dtype=np.int64)
+        ingredient_col = np.frombuffer(ingredients, dtype=np.int64)
+        vocabulary = int(ingredient_col.max()) + 1 if len(ingredient_col) else 1
+        product_ids, rows = np.unique(product_col, return_inverse=True)
+        # Document frequency: products per ingredient (each (product, ingredient) pair is unique)
+        df = np.bincount(ingredient_col, minlength=vocabulary)
+        idf = np.log((1 + len(product_ids)) / (1 + df)) + 1.0
+        matrix = cls._vectors(rows, ingredient_col, positions, idf, len(product_ids))
+        return cls(product_ids, matrix, idf)
+
+    @staticmethod
+    def _vectors(rows, ingredient_col, positions, idf, n_rows):
+        """L2-normalized CSR rows; ingredients outside the IDF vocabulary are left out."""
+        import numpy as np
+        from scipy import sparse
+
+        position_col = np.frombuffer(positions, dtype=np.int64)
+        known = ingredient_col < len(idf)
+        rows, ingredient_col, position_col = rows[known], ingredient_col[known], position_col[known]
+        weights = idf[ingredient_col] / np.sqrt(1.0 + position_col)
+        matrix = sparse.csr_matrix((weights, (rows, ingredient_col)), shape=(n_rows, len(idf)))
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+    def stale(self) -> bool:
+        return time.monotonic() - self.built_at > get_settings().similarity_rebuild_seconds
+
+    def update(self, session: Session, product_ids: Iterable[int]) -> bool:
+        """Re-vectorize changed products into the delta; False when a rebuild is due instead."""
+        import numpy as np
+
+        changed = set(product_ids) | set(self.delta_ids)
+        if len(changed) > MAX_DELTA_FRACTION * max(len(self.product_ids), 1000):
+            return False
+        for product_id in changed:
+            row = self.rows.get(product_id)
+            if row is not None:
+                self.alive[row] = False
+        ids = sorted(changed)
+        products, ingredients, positions = load_ingredient_terms(session, ids)
+        product_col = np.frombuffer(products, dtype=np.int64)
+        delta_rows = np.searchsorted(np.asarray(ids, dtype=np.int64), product_col)
+        self.delta_ids = ids
+        self.delta_rows = {pid: i for i, pid in enumerate(ids)}
+        self.delta = self._vectors(
+            delta_rows, np.frombuffer(ingredients, dtype=np.int64), positions, self.idf, len(ids)
+        )
+        return True
+
+    def _query_vector(self, product_id: int):
+        if product_id in self.delta_rows:
+            return self.delta[self.delta_rows[product_id]]
+        row = self.rows.get(product_id)
+        return self.matrix[row] if row is not None else None
+
+    def similar(self, product_id: int, k: int) -> List[Tuple[int, float]]:
+        """Top `k` (product_id, cosine) pairs, most similar first, excluding the product itself."""
+        import numpy as np
+
+        query = self._query_vector(product_id)
+        if query is None or query.nnz == 0:
+            return []
+        scores = np.asarray((query @ self.by_ingredient).todense()).ravel()
+        scores[~self.alive] = 0.0
+        ids = self.product_ids
+        if self.delta is not None and self.delta_ids:
+            scores = np.concatenate([scores, np.asarray((self.delta @ query.T).todense()).ravel()])
+            ids = np.concatenate([ids, np.asarray(self.delta_ids, dtype=np.int64)])
+        scores[ids == product_id] = 0.0
+        k = min(k, int((scores > 0).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def _current_index(session: Session) -> SimilarityIndex:
+    """The process's index, built or rebuilt when missing or stale, with pending changes
+    applied. Called with _lock held."""
+    global _index
+    # Taken before reading, so marks arriving meanwhile wait for the next query
+    dirty = _take_dirty()
+    if _index is None or _index.stale():
+        _index = SimilarityIndex.build(session)
+    elif dirty and not _index.update(session, dirty):
+        _index = SimilarityIndex.build(session)
+    return _index
+
+
+def similar_product_ids(session: Session, product_id: int, k: int = 10) -> List[Tuple[int, float]]:
+    """Top `k` products by ingredient similarity to `product_id` as (product_id, cosine)."""
+    if not similarity_available():
+        raise RuntimeError("Ingredient similarity requires the 'numpy' and 'scipy' packages")
+    with _lock:
+        return _current_index(session).similar(product_id, k)
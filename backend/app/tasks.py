@@ -0,0 +1,374 @@
+"""Scrape job handlers run by the background job queue (see jobs.py)."""
+from __future__ import annotations
+from collections import defaultdict
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+import asyncio
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from .analysis import analysis_available
+from .config import get_settings
+from .crud import (
+    _dialect_insert,
+    filter_products_by_terms,
+    get_last_crawl_success,
+    ingest_scraped_products,
+    mark_crawl_success,
+    sync_product_analysis,
+    sync_product_terms,
+)
+from .database import engine
+from .frontier import Frontier
+from .jobs import JobCancelled, JobContext, job_handler
+from .matching import match_products as match_product_rows, unmatched_product_ids
+from .models import EnrichmentAttempt, Product
+from .response_cache import invalidate_catalog
+from .scrapers.base import ScrapedProduct
+from .scrapers.fetcher import AsyncFetcher
+from .scrapers.generic_jsonld import GenericJSONLDScraper
+from .scrapers.parse_pool import ParsePipeline
+from .scrapers.registry import TARGET_DOMAINS
+from .scrapers.scheduler import DomainResult, crawl_domains
+from .urls import canonical_url
+
+
+URL_CHUNK_SIZE = 50
+MATCH_CHUNK_SIZE = 500
+ANALYZE_CHUNK_SIZE = 5000
+
+
+async def _supervise(ctx: JobContext, coro: Awaitable[Any], snapshot: Callable[[], dict]) -> Any:
+    """Run `coro` while publishing progress; cancels it when the job is cancelled."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=1.0)
+            ctx.progress(**snapshot())
+    except JobCancelled:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        raise
+    return task.result()
+
+
+def _crawl_and_ingest(ctx: JobContext, domains: List[str], params: dict) -> Dict[str, dict]:
+    """Crawl `domains` and ingest each as it goes. Domains already recorded in the
+    checkpoint are skipped, and a domain interrupted mid-crawl resumes from its frontier,
+    so a resumed job only crawls what is left."""
+    done: Dict[str, dict] = dict(ctx.checkpoint.get("domains", {}))
+    remaining = [d for d in domains if d not in done]
+    since = None
+    if params.get("incremental") and remaining:
+        with Session(engine) as session:
+            since = get_last_crawl_success(session, remaining)
+    live: List[DomainResult] = []
+    provider_ids: dict[str, int] = {}
+    write_lock = asyncio.Lock()
+    frontiers = {d: Frontier(d, tags=["scraped", d], provider_ids=provider_ids) for d in remaining}
+
+    def ingest(result: DomainResult) -> None:
+        # The frontier ingests items as it writes back their URLs; this flushes the rest
+        frontier = frontiers[result.domain]
+        frontier.flush()
+        result.created = frontier.ingested.created
+        result.skipped = frontier.ingested.updated
+        if result.complete:
+            with Session(engine) as session:
+                mark_crawl_success(session, result.domain, result.started_at)
+
+    async def on_result(result: DomainResult) -> None:
+        # Serialized so two domains finishing together don't race on new providers
+        async with write_lock:
+            await asyncio.to_thread(ingest, result)
+        done[result.domain] = result.summary()
+        ctx.checkpoint["domains"] = dict(done)
+
+    def snapshot() -> dict:
+        running = [r for r in live if r.domain not in done]
+        return {
+            "total": len(domains),
+            "done": len(done),
+            "fetched": sum(s["fetched"] for s in done.values()) + sum(r.fetched for r in running),
+            "failed": sum(s["failed"] for s in done.values()) + sum(r.failed for r in running),
+            "disallowed": sum(s.get("disallowed", 0) for s in done.values()) + sum(r.disallowed for r in running),
+            "created": sum(s["created"] for s in done.values()),
+        }
+
+    ctx.progress(force=True, **snapshot())
+    if remaining:
+        asyncio.run(
+            _supervise(
+                ctx,
+                crawl_domains(
+                    remaining,
+                    params.get("limit_per_domain", 50),
+                    timeout=params.get("domain_timeout"),
+                    modified_since=since,
+                    results=live,
+                    on_result=on_result,
+                    frontier_for=frontiers.get,
+                ),
+                snapshot,
+            )
+        )
+    ctx.progress(force=True, **snapshot())
+    return done
+
+
+@job_handler("run_all")
+def run_all(ctx: JobContext, params: dict) -> dict:
+    done = _crawl_and_ingest(ctx, TARGET_DOMAINS, params)
+    return {
+        "created": sum(s["created"] for s in done.values()),
+        "domains": TARGET_DOMAINS,
+        "results": [done[d] for d in TARGET_DOMAINS if d in done],
+    }
+
+
+@job_handler("run_domain")
+def run_domain(ctx: JobContext, params: dict) -> dict:
+    domain = params["domain"]
+    done = _crawl_and_ingest(ctx, [domain], {**params, "limit_per_domain": params.get("limit", 50)})
+    return {"created": done[domain]["created"], "domain": domain, "result": done[domain]}
+
+
+@job_handler("run_urls")
+def run_urls(ctx: JobContext, params: dict) -> dict:
+    urls: List[str] = params["urls"]
+    domain = params["domain"]
+    scraper = GenericJSONLDScraper(domain=domain, max_pages=len(urls))
+    # Explicitly requested URLs are always parsed, even when the page is unchanged
+    scraper.skip_unchanged = False
+    provider_ids: dict[str, int] = {}
+    failed_before = ctx.counters.get("failed", 0)
+
+    async def crawl() -> None:
+        parser = ParsePipeline()
+        async with AsyncFetcher() as fetcher:
+            while ctx.checkpoint.get("next_index", 0) < len(urls):
+                start = ctx.checkpoint.get("next_index", 0)
+                chunk = urls[start:start + URL_CHUNK_SIZE]
+                items = await scraper.crawl_urls(chunk, fetcher, parser)
+                with Session(engine) as session:
+                    result = ingest_scraped_products(
+                        session, items, tags=["scraped", domain], provider_ids=provider_ids
+                    )
+                ctx.checkpoint.update(
+                    next_index=start + len(chunk),
+                    created=ctx.checkpoint.get("created", 0) + result.created,
+                )
+                ctx.progress(
+                    force=True,
+                    total=len(urls),
+                    done=ctx.checkpoint["next_index"],
+                    created=ctx.checkpoint["created"],
+                    failed=failed_before + scraper.failed,
+                )
+
+    try:
+        asyncio.run(crawl())
+    finally:
+        scraper.close()
+    return {"created": ctx.checkpoint.get("created", 0), "count": len(urls), "domain": domain}
+
+
+def _enrichment_candidates(session: Session, tag: Optional[str], after_id: int, limit: int) -> list:
+    """Incomplete products with a URL after `after_id`, in id order, skipping those whose
+    last attempt is still backing off."""
+    statement = (
+        select(
+            Product.id,
+            Product.url,
+            Product.price_amount,
+            Product.price_currency,
+            Product.inci,
+            EnrichmentAttempt.attempts,
+        )
+        .outerjoin(EnrichmentAttempt, EnrichmentAttempt.product_id == Product.id)
+        .where(
+            (Product.inci == None) | (Product.price_amount == None) | (Product.price_currency == None),
+            Product.url.isnot(None),
+            Product.id > after_id,
+            EnrichmentAttempt.product_id.is_(None) | (EnrichmentAttempt.next_attempt_at <= datetime.utcnow()),
+        )
+    )
+    statement = filter_products_by_terms(statement, tag=tag)
+    return session.exec(statement.order_by(Product.id).limit(limit)).all()
+
+
+def _enrichment_changes(row, item: Optional[ScrapedProduct]) -> dict:
+    """Fields of a candidate row to fill from its scraped page; existing values are kept."""
+    values: dict = {}
+    if item is None:
+        return values
+    if item.price_amount is not None and row.price_amount is None:
+        values["price_amount"] = item.price_amount
+    if item.price_currency and row.price_currency in (None, "SEK") and item.price_currency != row.price_currency:
+        values["price_currency"] = item.price_currency
+    if item.inci and not row.inci:
+        values["inci"] = item.inci
+    return values
+
+
+def _write_enrichment(session: Session, rows: list, items: Dict[str, ScrapedProduct]) -> int:
+    """Apply a chunk's changes with one bulk UPDATE, record attempts for the products that
+    are still incomplete and clear them for the rest, all in one transaction."""
+    settings = get_settings()
+    now = datetime.utcnow()
+    updates, attempts, completed = [], [], []
+    for row in rows:
+        item = items.get(row.url)
+        values = _enrichment_changes(row, item)
+        if values:
+            updates.append({"id": row.id, **values})
+        merged = {"price_amount": row.price_amount, "price_currency": row.price_currency, "inci": row.inci, **values}
+        if all(v is not None for v in merged.values()):
+            completed.append(row.id)
+            continue
+        count = (row.attempts or 0) + 1
+        delay = min(settings.enrich_retry_base_hours * 2 ** min(count - 1, 20), settings.enrich_retry_max_hours)
+        attempts.append(
+            {
+                "product_id": row.id,
+                "attempts": count,
+                "last_attempt_at": now,
+                "next_attempt_at": now + timedelta(hours=delay),
+                "outcome": "no_data" if item is None else ("partial" if values else "no_new_data"),
+            }
+        )
+    if updates:
+        # Rows are grouped by the set of columns they change, one executemany per group
+        session.execute(update(Product), updates)
+        sync_product_terms(session, [u["id"] for u in updates])
+    if completed:
+        session.execute(delete(EnrichmentAttempt).where(EnrichmentAttempt.product_id.in_(completed)))
+    if attempts:
+        statement = _dialect_insert(session)(EnrichmentAttempt.__table__).values(attempts)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["product_id"],
+                set_={c: statement.excluded[c] for c in ("attempts", "last_attempt_at", "next_attempt_at", "outcome")},
+            )
+        )
+    session.commit()
+    return len(updates)
+
+
+@job_handler("enrich_missing")
+def enrich_missing(ctx: JobContext, params: dict) -> dict:
+    """Fill missing price/currency/INCI from each product's page.
+
+    Products are taken in id-ordered chunks; each chunk is fetched concurrently, grouped
+    by domain so every host keeps its own rate limit, and written back in one transaction.
+    Products that stay incomplete are backed off (see EnrichmentAttempt), so pages that
+    never expose the data are not fetched on every run. A resumed job continues after the
+    checkpointed id.
+    """
+    tag, limit = params.get("tag"), params.get("limit", 100)
+    chunk_size = get_settings().enrich_chunk_size
+    scrapers: Dict[str, GenericJSONLDScraper] = {}
+    parsers: Dict[str, ParsePipeline] = {}
+
+    def scraper_for(domain: str) -> GenericJSONLDScraper:
+        if domain not in scrapers:
+            scrapers[domain] = GenericJSONLDScraper(domain=domain, max_pages=chunk_size)
+            # Unchanged pages were parsed on an earlier attempt
+            scrapers[domain].skip_unchanged = True
+            parsers[domain] = ParsePipeline()
+        return scrapers[domain]
+
+    async def fetch(fetcher: AsyncFetcher, rows: list) -> Dict[str, ScrapedProduct]:
+        by_domain: Dict[str, List[str]] = defaultdict(list)
+        for row in rows:
+            by_domain[urlparse(row.url).netloc].append(row.url)
+        batches = await asyncio.gather(
+            *(scraper_for(d).crawl_urls(urls, fetcher, parsers[d]) for d, urls in by_domain.items())
+        )
+        return {canonical_url(it.url): it for items in batches for it in items if it.url}
+
+    async def enrich() -> None:
+        async with AsyncFetcher() as fetcher:
+            while ctx.checkpoint.get("checked", 0) < limit:
+                checked = ctx.checkpoint.get("checked", 0)
+                with Session(engine) as session:
+                    rows = _enrichment_candidates(
+                        session, tag, ctx.checkpoint.get("last_id", 0), min(chunk_size, limit - checked)
+                    )
+                if not rows:
+                    break
+                items = await fetch(fetcher, rows)
+                with Session(engine) as session:
+                    updated = _write_enrichment(session, rows, items)
+                if updated:
+                    invalidate_catalog()
+                ctx.checkpoint.update(
+                    last_id=rows[-1].id,
+                    checked=checked + len(rows),
+                    updated=ctx.checkpoint.get("updated", 0) + updated,
+                )
+                ctx.progress(
+                    force=True,
+                    total=limit,
+                    done=ctx.checkpoint["checked"],
+                    updated=ctx.checkpoint["updated"],
+                    failed=sum(s.failed for s in scrapers.values()),
+                )
+
+    try:
+        asyncio.run(enrich())
+    finally:
+        for scraper in scrapers.values():
+            scraper.close()
+    checked, updated = ctx.checkpoint.get("checked", 0), ctx.checkpoint.get("updated", 0)
+    ctx.progress(force=True, total=limit, done=checked, updated=updated)
+    return {"checked": checked, "updated": updated}
+
+
+@job_handler("match_products")
+def match_products(ctx: JobContext, params: dict) -> dict:
+    """Assign products not matched yet to canonical products (see matching.py), in id order.
+    New and changed products are matched as they are written (crud.sync_product_terms);
+    this backfills products written before matching existed."""
+    counts: Dict[str, int] = dict(ctx.checkpoint.get("counts", {}))
+    while True:
+        with Session(engine) as session:
+            ids = unmatched_product_ids(session, ctx.checkpoint.get("last_id", 0), MATCH_CHUNK_SIZE)
+            if not ids:
+                break
+            for method, n in match_product_rows(session, ids).items():
+                counts[method] = counts.get(method, 0) + n
+            session.commit()
+        invalidate_catalog()
+        ctx.checkpoint.update(last_id=ids[-1], counts=dict(counts))
+        ctx.progress(force=True, matched=sum(counts.values()), **counts)
+    return {"matched": sum(counts.values()), "methods": counts}
+
+
+@job_handler("analyze_products")
+def analyze_products(ctx: JobContext, params: dict) -> dict:
+    """Re-score the whole catalog with the current analysis rules, in id order. New and
+    changed products are scored as they are written; this is for rule changes."""
+    if not analysis_available():
+        raise RuntimeError("Ingredient analysis requires the 'numpy' package")
+    analyzed = ctx.checkpoint.get("analyzed", 0)
+    while True:
+        with Session(engine) as session:
+            ids = session.exec(
+                select(Product.id)
+                .where(Product.id > ctx.checkpoint.get("last_id", 0))
+                .order_by(Product.id)
+                .limit(ANALYZE_CHUNK_SIZE)
+            ).all()
+            if not ids:
+                break
+            sync_product_analysis(session, ids)
+            session.commit()
+        analyzed += len(ids)
+        ctx.checkpoint.update(last_id=ids[-1], analyzed=analyzed)
+        ctx.progress(force=True, analyzed=analyzed)
+    invalidate_catalog()
+    return {"analyzed": analyzed}
@@ -0,0 +1,47 @@
+from sqlalchemy import insert, select
+from sqlmodel import SQLModel, create_engine
+
+from app.migrations import MIGRATIONS, apply_migrations
+from app.models import Ingredient, Product, ProductIngredient, Provider, SchemaMigration
+
+
+def _legacy_engine(tmp_path):
+    """A database from before the migrations: no unique index on product.url."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX uq_product_url")
+    return engine
+
+
+def test_migrations_merge_exact_and_canonical_url_duplicates(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    product = Product.__table__
+    with engine.begin() as conn:
+        conn.execute(insert(Provider.__table__).values(id=1, name="Shop"))
+        conn.execute(insert(Ingredient.__table__).values(id=1, name="aqua"))
+        for row in [
+            {"id": 1, "name": "A", "url": "https://x.se/p/1", "price_currency": "SEK"},
+            {"id": 2, "name": "A", "url": "https://x.se/p/1", "price_amount": 50.0, "price_currency": "EUR",
+             "inci": ["aqua"]},
+            {"id": 3, "name": "B", "url": "https://x.se/p/2?utm_source=x"},
+            {"id": 4, "name": "B", "url": "https://x.se/p/2", "description": "d"},
+            {"id": 5, "name": "B", "url": "https://x.se/p/2?utm_source=x", "rating": 4.5},
+        ]:
+            conn.execute(insert(product).values(provider_id=1, **row))
+        conn.execute(insert(ProductIngredient.__table__).values(product_id=2, ingredient_id=1, position=0))
+
+        ran = apply_migrations(conn)
+
+        rows = conn.execute(select(product).order_by(product.c.id)).mappings().all()
+        terms = conn.execute(select(ProductIngredient.__table__)).all()
+        recorded = conn.execute(select(SchemaMigration.version)).scalars().all()
+    assert ran == [name for _, name, _ in MIGRATIONS]
+    assert sorted(recorded) == sorted(version for version, _, _ in MIGRATIONS)
+    assert [(r["id"], r["url"]) for r in rows] == [(1, "https://x.se/p/1"), (4, "https://x.se/p/2")]
+    assert (rows[0]["price_amount"], rows[0]["price_currency"], rows[0]["inci"]) == (50.0, "EUR", ["aqua"])
+    assert (rows[1]["description"], rows[1]["rating"]) == ("d", 4.5)
+    assert [(t.product_id, t.ingredient_id) for t in terms] == [(1, 1)]
+    with engine.connect() as conn:
+        indexes = conn.exec_driver_sql("PRAGMA index_list(product)").all()
+    assert any(row[1] == "uq_product_url" and row[2] for row in indexes)